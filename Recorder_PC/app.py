@@ -1,33 +1,75 @@
 import cv2
-import socket
+import asyncio
+import argparse
+import queue
 import struct
+import threading
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
+import sys
 import time
+from mjpeg_avi import MjpegAviWriter, jpeg_size
 
-class VideoReceiver:
-    def __init__(self, host, port, save_dir="recordings"):
-        self.server_address = (host, port)
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.bind(self.server_address)
-        self.sock.listen(1)
-        print("Waiting for connection...")
-        self.connection, self.client_address = self.sock.accept()
-        print(f"Connected to {self.client_address}")
-        self.FPS = 20
+# The transcode writer is shared with the main application
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recording import VideoRecorder, segment_path
+
+HEADER = struct.Struct(">L")  # Big-endian frame length prefix
+MAX_FRAME_SIZE = 32 * 1024 * 1024  # Anything larger is a corrupt stream
+INITIAL_BUFFER_SIZE = 512 * 1024
+
+
+class StreamRecorder:
+    """
+    Recording pipeline for a single sender connection.
+
+    Frames are handed over from the network loop through a bounded queue and
+    written on a dedicated thread, so a slow disk or codec on one stream never
+    stalls the others.
+
+    In "passthrough" mode the received JPEG bytes are appended to an MJPEG AVI
+    as-is and the receive time goes to the segment's timestamp sidecar, so no
+    frame is decoded or re-encoded. In "transcode" mode frames are decoded,
+    stamped with the time and re-encoded to XVID.
+    """
+
+    MODES = ("passthrough", "transcode")
+
+    def __init__(self, name, save_dir, fps=20, segment_duration=360, queue_size=64, mode="passthrough"):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown recording mode '{mode}', expected one of {self.MODES}")
+        self.name = name
         self.save_dir = save_dir
-        os.makedirs(self.save_dir, exist_ok=True)
-        print(f"Recording directory ready: {os.path.abspath(self.save_dir)}")
+        self.FPS = fps
+        self.SEGMENT_DURATION = segment_duration
+        self.mode = mode
+        self.frames = queue.Queue(maxsize=queue_size)
         self.video_writer = None
-        self.frame_size = None
-        self.current_filename = None
+        self.segment_start = 0
         self.frames_written = 0
+        self.latest_frame = None
+        self.latest_jpeg = None
+        self.latest_timestamp = 0
+        self.thread = threading.Thread(target=self.run, name=f"recorder-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, frame_data, timestamp):
+        """Queue one encoded frame. Returns False when the queue is full."""
+        try:
+            self.frames.put_nowait((bytes(frame_data), timestamp))
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        self.frames.put((None, None))
 
     def create_video_writer(self, output_path, width, height):
         try:
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            return cv2.VideoWriter(output_path, fourcc, self.FPS, (width, height))
+            if self.mode == "passthrough":
+                return MjpegAviWriter(output_path, self.FPS, width, height)
+            return VideoRecorder(output_path, self.FPS, codec="XVID")
         except Exception as e:
             raise e
 
@@ -36,85 +78,253 @@ class VideoReceiver:
             video_writer.write(frame_raw)
         except Exception as e:
             raise e
-    def receive_frame(self):
-        try:
-            data = self.connection.recv(4)
-            if not data:
-                return None
-            size = struct.unpack(">L", data)[0]
-            frame_data = b""
-            while len(frame_data) < size:
-                packet = self.connection.recv(size - len(frame_data))
-                if not packet:
-                    return None
-                frame_data += packet
-
-            frame = cv2.imdecode(np.frombuffer(frame_data, dtype=np.uint8), cv2.IMREAD_COLOR)
-
-            if frame is not None:
-                print(f"Frame received with shape: {frame.shape}")
-
-                cv2.rectangle(frame, (20, 20), (350, 80), (0, 0, 0), -1)
-                c_time = datetime.now()
-                cv2.putText(frame, str(c_time)[:-7], (40,65), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2, cv2.LINE_AA)
-
-            else:
-                print("Received a None frame. Skipping.")
-            return frame
-        except Exception as e:
-            print(f"Error receiving frame: {e}")
-            return None
-
 
     def manage_video(self, width, height):
         try:
             current_time = datetime.now().strftime("%H:%M:%S")
 
-            if self.video_writer is None:
-                output_dir = "results/videos"
-                current_date = datetime.now().strftime("%Y-%m-%d")
-                date_dir = os.path.join(output_dir, current_date)
-                os.makedirs(date_dir, exist_ok=True)
+            if self.video_writer is not None and self.segment_full():
+                self.video_writer.release()
+                self.video_writer = None
 
-                video_filename = datetime.now().strftime('%H-%M-%S') + '.avi'
-                output_path = os.path.join(date_dir, video_filename)
+            if self.video_writer is None:
+                output_path = segment_path(self.save_dir, "avi", self.name)
                 self.video_writer = self.create_video_writer(output_path, width, height)
+                self.segment_start = time.time()
+                print(f"[{self.name}] Recording to {output_path}")
 
             return current_time
         except Exception as e:
             raise e
 
-if __name__ == "__main__":
-    video_receiver = VideoReceiver(host="192.168.0.58", port=12345)
+    def segment_full(self):
+        if time.time() - self.segment_start >= self.SEGMENT_DURATION:
+            return True
+        return isinstance(self.video_writer, MjpegAviWriter) and self.video_writer.is_full()
 
-    try:
-        start_time = time.time()
+    def decode_frame(self, frame_data, timestamp):
+        frame = cv2.imdecode(np.frombuffer(frame_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            print(f"[{self.name}] Received a frame that could not be decoded. Skipping.")
+            return None
+
+        cv2.rectangle(frame, (20, 20), (350, 80), (0, 0, 0), -1)
+        c_time = datetime.fromtimestamp(timestamp)
+        cv2.putText(frame, str(c_time)[:-7], (40,65), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2, cv2.LINE_AA)
+        return frame
+
+    def run(self):
+        try:
+            while True:
+                frame_data, timestamp = self.frames.get()
+                if frame_data is None:
+                    break
+
+                if self.mode == "passthrough":
+                    self.record_passthrough(frame_data, timestamp)
+                else:
+                    frame = self.decode_frame(frame_data, timestamp)
+                    if frame is None:
+                        continue
+                    width, height = frame.shape[1], frame.shape[0]
+                    self.manage_video(width, height)
+                    self.start_video_recording(self.video_writer, frame)
+                    self.latest_frame = frame
+                self.frames_written += 1
+                self.latest_jpeg = frame_data
+                self.latest_timestamp = timestamp
+        except Exception as e:
+            print(f"[{self.name}] Recording error: {e}")
+        finally:
+            if self.video_writer is not None:
+                self.video_writer.release()
+                self.video_writer = None
+            print(f"[{self.name}] Recording stopped after {self.frames_written} frames.")
+
+    def record_passthrough(self, frame_data, timestamp):
+        if self.video_writer is None or self.segment_full():
+            size = jpeg_size(frame_data)
+            if size is None:
+                print(f"[{self.name}] Received data that is not a JPEG. Skipping.")
+                return
+            self.manage_video(*size)
+        self.video_writer.write(frame_data, timestamp)
+
+    def preview_frame(self):
+        """Return the latest frame for display, decoding it only on request."""
+        if self.mode == "transcode":
+            return self.latest_frame
+        if self.latest_jpeg is None:
+            return None
+        return self.decode_frame(self.latest_jpeg, self.latest_timestamp)
+
+
+class FrameProtocol(asyncio.BufferedProtocol):
+    """
+    Parses big-endian length-prefixed JPEG frames from one sender.
+
+    The event loop reads straight into a reused `bytearray` via `get_buffer`,
+    so a frame is assembled without intermediate `bytes` objects regardless of
+    how the TCP stream is split into packets. When the stream's recorder
+    falls behind, reading is paused and TCP backpressure reaches the sender.
+    """
+
+    def __init__(self, receiver):
+        self.receiver = receiver
+        self.transport = None
+        self.recorder = None
+        self.header = bytearray(HEADER.size)
+        self.header_view = memoryview(self.header)
+        self.payload = bytearray(INITIAL_BUFFER_SIZE)
+        self.payload_view = memoryview(self.payload)
+        self.expected = None  # Payload size of the frame being read, None while reading a header
+        self.filled = 0
+        self.received_at = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.recorder = self.receiver.open_stream(transport.get_extra_info('peername'))
+
+    def get_buffer(self, sizehint):
+        if self.expected is None:
+            return self.header_view[self.filled:]
+        return self.payload_view[self.filled:self.expected]
+
+    def buffer_updated(self, nbytes):
+        self.filled += nbytes
+        if self.expected is None:
+            if self.filled < HEADER.size:
+                return
+            size = HEADER.unpack(self.header)[0]
+            if size > MAX_FRAME_SIZE:
+                print(f"[{self.recorder.name}] Frame size {size} exceeds limit, dropping connection.")
+                self.transport.close()
+                return
+            if size > len(self.payload):
+                self.payload = bytearray(size)
+                self.payload_view = memoryview(self.payload)
+            self.expected = size
+            self.filled = 0
+            if size == 0:
+                self.expected = None
+            return
+
+        if self.filled < self.expected:
+            return
+        self.received_at = time.time()
+        if not self.recorder.submit(self.payload_view[:self.expected], self.received_at):
+            print(f"[{self.recorder.name}] Recorder is behind, pausing the stream.")
+            # Keep the frame in the buffer and retry until the queue drains
+            self.transport.pause_reading()
+            self.receiver.loop.call_later(0.05, self.retry_submit)
+            return
+        self.expected = None
+        self.filled = 0
+
+    def retry_submit(self):
+        if self.transport.is_closing():
+            return
+        if self.recorder.submit(self.payload_view[:self.expected], self.received_at):
+            self.expected = None
+            self.filled = 0
+            self.transport.resume_reading()
+        else:
+            self.receiver.loop.call_later(0.05, self.retry_submit)
+
+    def connection_lost(self, exc):
+        print(f"[{self.recorder.name}] Connection closed.")
+        self.receiver.close_stream(self.recorder)
+
+
+class VideoReceiver:
+    """
+    Asyncio server that accepts any number of sender connections and gives
+    each one its own `StreamRecorder`, so one recorder PC can archive every
+    camera in a bay.
+    """
+
+    def __init__(self, host, port, save_dir="results/videos", fps=20, segment_duration=360, preview=False, mode="passthrough"):
+        self.server_address = (host, port)
+        self.save_dir = save_dir
+        self.mode = mode
+        self.FPS = fps
+        self.SEGMENT_DURATION = segment_duration
+        self.preview = preview
+        self.streams = {}
+        self.loop = None
+        os.makedirs(self.save_dir, exist_ok=True)
+        print(f"Recording directory ready: {os.path.abspath(self.save_dir)}")
+
+    def open_stream(self, peername):
+        host = peername[0] if peername else "unknown"
+        name = host
+        suffix = 2
+        while name in self.streams:
+            name = f"{host}-{suffix}"
+            suffix += 1
+        recorder = StreamRecorder(name, self.save_dir, self.FPS, self.SEGMENT_DURATION, mode=self.mode)
+        self.streams[name] = recorder
+        print(f"Connected to {peername}, recording as '{name}'. Active streams: {len(self.streams)}")
+        return recorder
+
+    def close_stream(self, recorder):
+        recorder.close()
+        self.streams.pop(recorder.name, None)
+        if self.preview:
+            try:
+                cv2.destroyWindow(f"Received Video {recorder.name}")
+            except cv2.error:
+                pass
+
+    async def show_previews(self):
         while True:
-            
-            frame = video_receiver.receive_frame()
-            if frame is None:
-                print("No frame received, stopping.")
-                break
-            width, height = frame.shape[1], frame.shape[0]
-            current_time = video_receiver.manage_video(width, height)
-            video_receiver.start_video_recording(video_receiver.video_writer, frame)
-            end_time = time.time()
-            seconds = end_time - start_time
-    
-            if seconds >=360:
-                video_receiver.video_writer.release()
-                video_receiver.video_writer = None
-                start_time = time.time()
-            cv2.namedWindow("Received Video", cv2.WINDOW_NORMAL)
-            cv2.imshow("Received Video", frame)
+            for name, recorder in list(self.streams.items()):
+                frame = recorder.preview_frame()
+                if frame is not None:
+                    cv2.namedWindow(f"Received Video {name}", cv2.WINDOW_NORMAL)
+                    cv2.imshow(f"Received Video {name}", frame)
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 print("Quit command received.")
-                break
+                return
+            await asyncio.sleep(1.0 / self.FPS)
 
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        server = await self.loop.create_server(lambda: FrameProtocol(self), *self.server_address)
+        print(f"Waiting for connections on {self.server_address[0]}:{self.server_address[1]}...")
+        async with server:
+            if self.preview:
+                await self.show_previews()
+            else:
+                await server.serve_forever()
+
+    def release(self):
+        for recorder in list(self.streams.values()):
+            recorder.close()
+            recorder.thread.join(timeout=5)
+        self.streams.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Receive and record JPEG streams from VMS senders.")
+    parser.add_argument("--host", default="192.168.0.58")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--save-dir", default="results/videos")
+    parser.add_argument("--fps", type=int, default=20)
+    parser.add_argument("--segment-duration", type=int, default=360)
+    parser.add_argument("--preview", action="store_true", help="Show a window per received stream")
+    parser.add_argument("--mode", choices=StreamRecorder.MODES, default="passthrough",
+                        help="passthrough: store received JPEGs as MJPEG AVI, transcode: decode and re-encode to XVID")
+    args = parser.parse_args()
+
+    video_receiver = VideoReceiver(args.host, args.port, args.save_dir, args.fps, args.segment_duration, args.preview, args.mode)
+
+    try:
+        asyncio.run(video_receiver.serve())
     except KeyboardInterrupt:
         print("Keyboard interrupt received. Stopping...")
     except Exception as e:
         print(f"Unexpected error: {e}")
     finally:
-        # video_receiver.release()
+        video_receiver.release()
         cv2.destroyAllWindows()
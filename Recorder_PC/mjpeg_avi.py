@@ -0,0 +1,142 @@
+import os
+import struct
+
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+MAX_RIFF_SIZE = 0x7FFFFFFF - 64 * 1024 * 1024  # Stay clear of the 2 GB AVI 1.0 limit
+
+# Sidecar index entry: capture timestamp, byte offset of the JPEG in the AVI, JPEG size
+TIMESTAMP_ENTRY = struct.Struct("<dQI")
+TIMESTAMP_SUFFIX = ".ts"
+
+
+def jpeg_size(data):
+    """Return (width, height) from the SOF marker of a JPEG, or None if not found."""
+    view = memoryview(data)
+    i = 2
+    while i + 9 < len(view):
+        if view[i] != 0xFF:
+            i += 1
+            continue
+        marker = view[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            i += 1 if marker == 0xFF else 2
+            continue
+        length = struct.unpack_from(">H", view, i + 2)[0]
+        # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack_from(">HH", view, i + 5)
+            return width, height
+        i += 2 + length
+    return None
+
+
+class MjpegAviWriter:
+    """
+    Appends already-encoded JPEG frames to an MJPEG AVI without decoding them.
+
+    The file is playable by any MJPEG-capable player, and OpenCV can read it
+    back with `cv2.VideoCapture`. Capture timestamps are kept out of the
+    picture and written to a sidecar `<name>.avi.ts` file, one fixed-size
+    entry per frame (timestamp, byte offset, size), which also serves as a
+    seek index into the AVI.
+    """
+
+    def __init__(self, output_path, fps, width, height):
+        self.output_path = output_path
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.frame_count = 0
+        self.max_frame_size = 0
+        self.index = bytearray()
+        self.file = open(output_path, "wb")
+        self.timestamps = open(output_path + TIMESTAMP_SUFFIX, "wb")
+        self.write_headers()
+        self.movi_start = self.file.tell()
+        self.file.write(b"LIST\0\0\0\0movi")
+
+    def write_headers(self):
+        avih = struct.pack(
+            "<10I4I",
+            int(1_000_000 / self.fps), 0, 0, AVIF_HASINDEX, 0, 0, 1, 0,
+            self.width, self.height, 0, 0, 0, 0,
+        )
+        strh = struct.pack(
+            "<4s4sIHHIIIIIIIIhhhh",
+            b"vids", b"MJPG", 0, 0, 0, 0, 1, int(self.fps), 0, 0, 0, 0xFFFFFFFF, 0,
+            0, 0, self.width, self.height,
+        )
+        strf = struct.pack(
+            "<IiiHH4sIiiII",
+            40, self.width, self.height, 1, 24, b"MJPG", self.width * self.height * 3, 0, 0, 0, 0,
+        )
+        strl = b"strl" + self.chunk(b"strh", strh) + self.chunk(b"strf", strf)
+        hdrl = b"hdrl" + self.chunk(b"avih", avih) + self.chunk(b"LIST", strl)
+        self.file.write(b"RIFF\0\0\0\0AVI ")
+        self.hdrl_start = self.file.tell()
+        self.file.write(self.chunk(b"LIST", hdrl))
+
+    @staticmethod
+    def chunk(fourcc, payload):
+        pad = b"\0" if len(payload) % 2 else b""
+        return fourcc + struct.pack("<I", len(payload)) + payload + pad
+
+    @property
+    def size(self):
+        return self.file.tell()
+
+    def is_full(self, next_frame_size=0):
+        return self.size + len(self.index) + next_frame_size + 16 > MAX_RIFF_SIZE
+
+    def write(self, jpeg, timestamp):
+        """Append one JPEG frame and record its timestamp."""
+        size = len(jpeg)
+        offset = self.file.tell()
+        self.file.write(b"00dc" + struct.pack("<I", size))
+        self.file.write(jpeg)
+        if size % 2:
+            self.file.write(b"\0")
+        # idx1 offsets are relative to the 'movi' fourcc
+        self.index += struct.pack("<4sIII", b"00dc", AVIIF_KEYFRAME, offset - (self.movi_start + 8), size)
+        self.timestamps.write(TIMESTAMP_ENTRY.pack(timestamp, offset + 8, size))
+        self.frame_count += 1
+        self.max_frame_size = max(self.max_frame_size, size)
+
+    def release(self):
+        """Write the index and patch the header sizes and frame counts."""
+        if self.file.closed:
+            return
+        movi_end = self.file.tell()
+        self.file.write(b"idx1" + struct.pack("<I", len(self.index)))
+        self.file.write(self.index)
+        riff_end = self.file.tell()
+
+        self.file.seek(4)
+        self.file.write(struct.pack("<I", riff_end - 8))
+        avih = self.hdrl_start + 20  # LIST, size, 'hdrl', 'avih', size
+        self.file.seek(avih + 4)
+        self.file.write(struct.pack("<I", int(self.max_frame_size * self.fps)))
+        self.file.seek(avih + 16)
+        self.file.write(struct.pack("<I", self.frame_count))
+        self.file.seek(avih + 28)
+        self.file.write(struct.pack("<I", self.max_frame_size))
+        strh = avih + 56 + 20  # avih payload, LIST, size, 'strl', 'strh', size
+        self.file.seek(strh + 32)
+        self.file.write(struct.pack("<II", self.frame_count, self.max_frame_size))
+        self.file.seek(self.movi_start + 4)
+        self.file.write(struct.pack("<I", movi_end - self.movi_start - 8))
+
+        self.file.close()
+        self.timestamps.close()
+
+
+def read_timestamps(avi_path):
+    """Return a list of (timestamp, offset, size) tuples for an AVI written by MjpegAviWriter."""
+    ts_path = avi_path + TIMESTAMP_SUFFIX
+    if not os.path.exists(ts_path):
+        return []
+    with open(ts_path, "rb") as f:
+        data = f.read()
+    usable = len(data) - len(data) % TIMESTAMP_ENTRY.size
+    return list(TIMESTAMP_ENTRY.iter_unpack(data[:usable]))
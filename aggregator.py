@@ -0,0 +1,499 @@
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from logging_config import logger
+
+PROTOCOL_VERSION = 1
+MAX_LINE = 16 * 1024 * 1024  # Largest batch line accepted from a node
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    node TEXT PRIMARY KEY,
+    first_seen REAL,
+    last_seen REAL,
+    connected INTEGER DEFAULT 0,
+    address TEXT,
+    records INTEGER DEFAULT 0,
+    health TEXT,
+    health_ts REAL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    node TEXT,
+    key TEXT,
+    kind TEXT,
+    ts REAL,
+    data TEXT,
+    UNIQUE (node, key)
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (ts);
+CREATE TABLE IF NOT EXISTS metrics (
+    node TEXT,
+    camera TEXT,
+    minute REAL,
+    frames INTEGER,
+    mean_score REAL,
+    max_score REAL,
+    vibrating_s REAL,
+    settling_s REAL,
+    stable_s REAL,
+    transitions INTEGER,
+    PRIMARY KEY (node, camera, minute)
+);
+CREATE INDEX IF NOT EXISTS metrics_time ON metrics (minute);
+CREATE TABLE IF NOT EXISTS rejected (
+    id INTEGER PRIMARY KEY,
+    node TEXT,
+    ts REAL,
+    error TEXT,
+    data TEXT
+);
+"""
+
+METRIC_COLUMNS = ("frames", "mean_score", "max_score", "vibrating_s", "settling_s", "stable_s", "transitions")
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")  # Queries read while the writer commits
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class AggregatorStore:
+    """
+    SQLite store for the records of every node.
+
+    Batches from all connections are queued to one writer thread, which
+    commits whatever has arrived in a single transaction and only then
+    releases the waiting connections, so a node is acknowledged only for
+    records that are on disk. Each batch runs under its own savepoint. If
+    it fails, it is rolled back and stored again record by record, and the
+    records that still fail are moved to the `rejected` table. The batch is
+    then acknowledged with their count, so a malformed record is skipped
+    for good instead of blocking the node's spool, and the other batches in
+    the transaction are unaffected. Only a failed commit is reported as an
+    error, so the node resends. Events are deduplicated on (node, key), so a
+    batch resent after a lost acknowledgement is stored once.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        connect(db_path).close()
+        self.jobs = queue.Queue()
+        self.commits = 0
+        self.stored = 0
+        self.rejected = 0
+        self.thread = threading.Thread(target=self.run, name="aggregator-store", daemon=True)
+        self.thread.start()
+
+    def submit(self, node, records, timeout=30):
+        """Store a batch and wait for its commit; return (new records, records rejected as malformed)."""
+        job = {"node": node, "records": records, "done": threading.Event(), "stored": 0, "rejected": 0, "error": None}
+        self.jobs.put(("batch", job))
+        if not job["done"].wait(timeout):
+            raise TimeoutError("Aggregator store did not commit in time")
+        if job["error"]:
+            raise RuntimeError(job["error"])
+        return job["stored"], job["rejected"]
+
+    def set_connected(self, node, connected, address=None):
+        self.jobs.put(("connection", (node, connected, address, time.time())))
+
+    def run(self):
+        conn = connect(self.db_path)
+        while True:
+            item = self.jobs.get()
+            if item is None:
+                break
+            items = [item]
+            # Everything that queued up meanwhile goes into the same transaction
+            while len(items) < 1000:
+                try:
+                    item = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.jobs.put(None)
+                    break
+                items.append(item)
+            batches = [args for kind, args in items if kind == "batch"]
+            try:
+                with conn:
+                    for kind, args in items:
+                        if kind == "batch":
+                            self.store_isolated(conn, args)
+                        else:
+                            self.store_connection(conn, *args)
+                self.commits += 1
+                self.stored += sum(job["stored"] for job in batches)
+                self.rejected += sum(job["rejected"] for job in batches)
+            except Exception as e:
+                logger.error(f"Error storing {len(batches)} aggregator batches: {e}")
+                logger.error(traceback.format_exc())
+                for job in batches:
+                    job["error"] = str(e)
+            for job in batches:
+                job["done"].set()
+        conn.close()
+
+    def store_isolated(self, conn, job):
+        """Store one batch under a savepoint; if it fails, store it record by record and set the bad ones aside."""
+        conn.execute("SAVEPOINT batch")
+        try:
+            job["stored"] = self.store_batch(conn, job["node"], job["records"])
+        except Exception as e:
+            conn.execute("ROLLBACK TO batch")
+            logger.error(f"Aggregator batch of {len(job['records'])} records from {job['node']} failed ({e}), "
+                         f"storing it record by record.")
+            job["stored"] = job["rejected"] = 0
+            for record in job["records"]:
+                conn.execute("SAVEPOINT record")
+                try:
+                    job["stored"] += self.store_batch(conn, job["node"], [record])
+                except Exception as e:
+                    conn.execute("ROLLBACK TO record")
+                    self.store_rejected(conn, job["node"], record, e)
+                    job["rejected"] += 1
+                conn.execute("RELEASE record")
+        conn.execute("RELEASE batch")
+
+    def store_rejected(self, conn, node, record, error):
+        """Keep a record that cannot be stored, so it can be inspected instead of being resent forever."""
+        try:
+            data = json.dumps(record, default=repr)
+        except Exception:
+            data = repr(record)
+        conn.execute("INSERT INTO rejected (node, ts, error, data) VALUES (?, ?, ?, ?)", (node, time.time(), str(error), data))
+        logger.error(f"Rejected malformed aggregator record from {node}: {error}")
+
+    def store_connection(self, conn, node, connected, address, ts):
+        conn.execute("INSERT INTO nodes (node, first_seen, last_seen, connected, address) VALUES (?, ?, ?, ?, ?) "
+                     "ON CONFLICT (node) DO UPDATE SET last_seen = excluded.last_seen, connected = excluded.connected, "
+                     "address = COALESCE(excluded.address, address)", (node, ts, ts, int(connected), address))
+
+    def store_batch(self, conn, node, records):
+        now = time.time()
+        events, metrics, health = [], [], None
+        for record in records:
+            kind = record.get("kind")
+            if kind == "metrics":
+                metrics.append((node, record.get("camera") or "", record["minute"],
+                                *(record.get(column, 0) for column in METRIC_COLUMNS)))
+            elif kind == "health":
+                if health is None or record.get("ts", 0) >= health.get("ts", 0):
+                    health = record
+            else:
+                data = {k: v for k, v in record.items() if k not in ("key", "kind", "ts")}
+                events.append((node, record.get("key"), kind, record.get("ts", now), json.dumps(data)))
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO events (node, key, kind, ts, data) VALUES (?, ?, ?, ?, ?)", events)
+        stored = conn.total_changes - before
+        conn.executemany(f"INSERT OR REPLACE INTO metrics (node, camera, minute, {', '.join(METRIC_COLUMNS)}) "
+                         f"VALUES (?, ?, ?, {', '.join('?' * len(METRIC_COLUMNS))})", metrics)
+        stored += len(metrics)
+        conn.execute("INSERT INTO nodes (node, first_seen, last_seen, connected, records) VALUES (?, ?, ?, 1, ?) "
+                     "ON CONFLICT (node) DO UPDATE SET last_seen = excluded.last_seen, records = records + excluded.records",
+                     (node, now, now, len(records)))
+        if health is not None:
+            conn.execute("UPDATE nodes SET health = ?, health_ts = ? WHERE node = ? AND COALESCE(health_ts, 0) <= ?",
+                         (json.dumps({k: v for k, v in health.items() if k not in ("key", "kind")}),
+                          health.get("ts", now), node, health.get("ts", now)))
+        return stored
+
+    def stop(self):
+        self.jobs.put(None)
+        self.thread.join(timeout=10)
+
+
+class NodeHandler(socketserver.StreamRequestHandler):
+    """
+    One edge node connection. Newline-delimited JSON:
+
+        node -> {"type": "hello", "node": "<id>", "version": 1}
+        aggregator -> {"type": "welcome", "node": "<id>"}
+        node -> {"type": "batch", "seq": <n>, "records": [...]}
+        aggregator -> {"type": "ack", "seq": <n>, "stored": <new records>, "rejected": <malformed records>}
+
+    Malformed records are set aside and still acknowledged; a batch that
+    could not be committed gets no ack, so the node resends it.
+    """
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections.add(self.request)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.connections.discard(self.request)
+        super().finish()
+
+    def handle(self):
+        store = self.server.store
+        node = None
+        try:
+            hello = self.read_message()
+            if hello is None or hello.get("type") != "hello" or not hello.get("node"):
+                self.send({"type": "error", "error": "Expected hello with a node id"})
+                return
+            node = str(hello["node"])
+            store.set_connected(node, True, f"{self.client_address[0]}:{self.client_address[1]}")
+            self.send({"type": "welcome", "node": node, "version": PROTOCOL_VERSION})
+            while True:
+                message = self.read_message()
+                if message is None:
+                    break
+                if message.get("type") != "batch" or not isinstance(message.get("records"), list):
+                    self.send({"type": "error", "error": "Expected a batch"})
+                    continue
+                stored, rejected = store.submit(node, message["records"])
+                self.send({"type": "ack", "seq": message.get("seq"), "stored": stored, "rejected": rejected})
+        except (ConnectionError, TimeoutError, OSError) as e:
+            logger.info(f"Aggregator connection from {node or self.client_address} ended: {e}")
+        except Exception as e:
+            logger.error(f"Error in aggregator connection from {node or self.client_address}: {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            if node is not None:
+                store.set_connected(node, False)
+
+    def read_message(self):
+        line = self.rfile.readline(MAX_LINE)
+        if not line:
+            return None
+        if not line.endswith(b"\n"):
+            raise ConnectionError("Message too long")
+        return json.loads(line)
+
+    def send(self, message):
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+
+
+class NodeServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256
+
+    def __init__(self, address, handler):
+        self.lock = threading.Lock()
+        self.connections = set()
+        super().__init__(address, handler)
+
+    def close_connections(self):
+        with self.lock:
+            connections = list(self.connections)
+        for sock in connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def query_params(path):
+    params = {key: values[-1] for key, values in parse_qs(urlparse(path).query).items()}
+    for key in ("since", "until"):
+        if key in params:
+            params[key] = float(params[key])
+    if "limit" in params:
+        params["limit"] = int(params["limit"])
+    return params
+
+
+def time_filter(column, params, where, args):
+    if "since" in params:
+        where.append(f"{column} >= ?")
+        args.append(params["since"])
+    if "until" in params:
+        where.append(f"{column} < ?")
+        args.append(params["until"])
+    if "node" in params:
+        where.append("node = ?")
+        args.append(params["node"])
+
+
+def list_nodes(conn, stale_after=180):
+    now = time.time()
+    nodes = []
+    for row in conn.execute("SELECT * FROM nodes ORDER BY node"):
+        nodes.append({
+            "node": row["node"],
+            "connected": bool(row["connected"]),
+            "stale": row["last_seen"] is None or now - row["last_seen"] > stale_after,
+            "last_seen": row["last_seen"],
+            "address": row["address"],
+            "records": row["records"],
+            "health": json.loads(row["health"]) if row["health"] else None,
+        })
+    return nodes
+
+
+def list_events(conn, params):
+    where, args = [], []
+    time_filter("ts", params, where, args)
+    if "kind" in params:
+        where.append("kind = ?")
+        args.append(params["kind"])
+    query = "SELECT node, kind, ts, data FROM events" + (" WHERE " + " AND ".join(where) if where else "")
+    rows = conn.execute(query + " ORDER BY ts DESC LIMIT ?", args + [params.get("limit", 1000)])
+    return [{"node": row["node"], "kind": row["kind"], "ts": row["ts"], **json.loads(row["data"] or "{}")} for row in rows]
+
+
+def list_metrics(conn, params):
+    where, args = [], []
+    time_filter("minute", params, where, args)
+    query = "SELECT * FROM metrics" + (" WHERE " + " AND ".join(where) if where else "")
+    rows = conn.execute(query + " ORDER BY minute DESC, node LIMIT ?", args + [params.get("limit", 10000)])
+    return [dict(row) for row in rows]
+
+
+def plant_summary(conn, params):
+    """Per node totals over the requested window, plus plant-wide totals."""
+    where, args = [], []
+    time_filter("minute", params, where, args)
+    clause = " WHERE " + " AND ".join(where) if where else ""
+    nodes = {}
+    for row in conn.execute(
+            "SELECT node, COUNT(*) AS minutes, SUM(frames) AS frames, SUM(mean_score * frames) / MAX(SUM(frames), 1) AS mean_score, "
+            "MAX(max_score) AS max_score, SUM(vibrating_s) AS vibrating_s, SUM(settling_s) AS settling_s, "
+            f"SUM(stable_s) AS stable_s, SUM(transitions) AS transitions FROM metrics{clause} GROUP BY node", args):
+        nodes[row["node"]] = {**dict(row), "events": {}}
+    where, args = [], []
+    time_filter("ts", params, where, args)
+    clause = " WHERE " + " AND ".join(where) if where else ""
+    for row in conn.execute(f"SELECT node, kind, COUNT(*) AS count FROM events{clause} GROUP BY node, kind", args):
+        nodes.setdefault(row["node"], {"node": row["node"], "events": {}})["events"][row["kind"]] = row["count"]
+    totals = {"nodes": len(nodes), "events": {}}
+    for summary in nodes.values():
+        for key in ("frames", "vibrating_s", "settling_s", "stable_s", "transitions"):
+            totals[key] = totals.get(key, 0) + (summary.get(key) or 0)
+        for kind, count in summary["events"].items():
+            totals["events"][kind] = totals["events"].get(kind, 0) + count
+    return {"totals": totals, "nodes": sorted(nodes.values(), key=lambda summary: summary["node"])}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Read-only plant-wide view: /nodes, /events, /metrics, /summary and /stats."""
+
+    def do_GET(self):
+        try:
+            path = urlparse(self.path).path
+            params = query_params(self.path)
+            conn = connect(self.server.db_path)
+            try:
+                if path == "/nodes":
+                    self.reply(200, list_nodes(conn))
+                elif path == "/events":
+                    self.reply(200, list_events(conn, params))
+                elif path == "/metrics":
+                    self.reply(200, list_metrics(conn, params))
+                elif path == "/summary":
+                    self.reply(200, plant_summary(conn, params))
+                elif path == "/stats":
+                    store = self.server.store
+                    self.reply(200, {"commits": store.commits, "stored": store.stored, "rejected": store.rejected,
+                                     "queued": store.jobs.qsize()})
+                else:
+                    self.reply(404, {"error": f"Unknown endpoint {path}"})
+            finally:
+                conn.close()
+        except ValueError as e:
+            self.reply(400, {"error": str(e)})
+
+    def reply(self, code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info(f"Aggregator query {self.address_string()} - {format % args}")
+
+
+class Aggregator:
+    """
+    Central service that collects events, health and per-minute metrics from
+    the edge nodes (see aggregator_client.py) and serves a plant-wide view.
+
+    Parameters:
+    ----------
+    db_path : str
+        SQLite database holding every node's records.
+    host : str, optional
+        Address to listen on (default is "0.0.0.0").
+    port : int, optional
+        TCP port the nodes connect to (default is 12400).
+    http_port : int, optional
+        Port of the JSON query API (default is 12401).
+    """
+
+    def __init__(self, db_path, host="0.0.0.0", port=12400, http_port=12401):
+        self.store = AggregatorStore(db_path)
+        self.nodes = NodeServer((host, port), NodeHandler)
+        self.nodes.store = self.store
+        self.http = ThreadingHTTPServer((host, http_port), QueryHandler)
+        self.http.daemon_threads = True
+        self.http.db_path = db_path
+        self.http.store = self.store
+        self.threads = [threading.Thread(target=self.nodes.serve_forever, name="aggregator-nodes", daemon=True),
+                        threading.Thread(target=self.http.serve_forever, name="aggregator-http", daemon=True)]
+
+    @property
+    def port(self):
+        return self.nodes.server_address[1]
+
+    @property
+    def http_port(self):
+        return self.http.server_address[1]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        logger.info(f"Aggregator listening for nodes on port {self.port}, queries on port {self.http_port}")
+        return self
+
+    def stop(self):
+        self.nodes.shutdown()
+        self.nodes.server_close()
+        self.nodes.close_connections()
+        self.http.shutdown()
+        self.http.server_close()
+        self.store.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect events and metrics from many VMS edge nodes.")
+    parser.add_argument("--db", default="results/aggregator.db", help="SQLite database path")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=12400, help="Port edge nodes connect to")
+    parser.add_argument("--http-port", type=int, default=12401, help="Port of the query API")
+    args = parser.parse_args()
+
+    aggregator = Aggregator(args.db, args.host, args.port, args.http_port).start()
+    print(f"Aggregator on port {aggregator.port}, query API on http://{args.host}:{aggregator.http_port}/summary")
+    try:
+        while True:
+            time.sleep(60)
+            store = aggregator.store
+            logger.info(f"Aggregator stored {store.stored} records in {store.commits} commits.")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        aggregator.stop()
+
+
+if __name__ == "__main__":
+    main()
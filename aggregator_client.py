@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import random
+import socket
+import threading
+import time
+from event_spool import EventSpool
+from logging_config import logger
+
+DEFAULT_AGGREGATOR_CONFIG = {
+    "enabled": False,
+    "host": "127.0.0.1",
+    "port": 12400,
+    "node_id": "",                 # Defaults to the host name
+    "spool_path": "results/spool/aggregator.spool",
+    "batch_size": 500,             # Records per batch (one round trip)
+    "flush_interval": 2.0,         # Seconds between sends; also the reconnect period while the aggregator is down
+    "health_interval": 60.0,       # Seconds between health reports
+    "timeout": 10.0,               # Seconds to wait for the aggregator's acknowledgement
+}
+
+STATE_SECONDS = {1: "vibrating_s", 2: "settling_s", 3: "stable_s"}  # score_store state codes
+
+
+class MetricRollup:
+    """Per-minute rollup of motion scores and time spent in each detector state."""
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.minute = None
+        self.camera = None
+        self.last_ts = None
+        self.last_state = None
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.score_sum = 0.0
+        self.max_score = 0.0
+        self.transitions = 0
+        self.seconds = dict.fromkeys(STATE_SECONDS.values(), 0.0)
+
+    def observe(self, score, state, camera, ts):
+        minute = ts - ts % 60
+        if self.minute is not None and (minute != self.minute or camera != self.camera):
+            self.flush()
+        self.minute, self.camera = minute, camera
+        if self.last_ts is not None and self.last_state in STATE_SECONDS:
+            # The time since the previous frame was spent in the previous state
+            self.seconds[STATE_SECONDS[self.last_state]] += min(max(ts - self.last_ts, 0.0), 60.0)
+        if self.last_state is not None and state != self.last_state:
+            self.transitions += 1
+        self.last_ts, self.last_state = ts, state
+        self.frames += 1
+        self.score_sum += score
+        self.max_score = max(self.max_score, score)
+
+    def flush(self):
+        if self.minute is None or self.frames == 0:
+            return
+        self.emit("metrics", camera=self.camera, minute=self.minute, frames=self.frames,
+                  mean_score=round(self.score_sum / self.frames, 3), max_score=round(self.max_score, 3),
+                  transitions=self.transitions, **{key: round(value, 3) for key, value in self.seconds.items()})
+        self.reset()
+
+
+class AggregatorClient:
+    """
+    Sends this node's events, health and per-minute metrics to the aggregator.
+
+    Records go through a local EventSpool, so `event()`, `observe()` and
+    `health()` never block the frame loop and nothing is lost while the
+    aggregator is unreachable. The spool's replayer sends them in batches of
+    up to `batch_size` over one TCP connection and advances the spool offset
+    only once the aggregator acknowledges a batch. After a disconnect it
+    reconnects and resumes from that offset. A batch resent because its
+    acknowledgement was lost is deduplicated by the aggregator on the record
+    keys.
+
+    Parameters:
+    ----------
+    node_id : str
+        Name of this installation in the plant-wide view.
+    host : str
+        Aggregator address.
+    port : int
+        Aggregator port.
+    spool_path : str
+        Local spool file.
+    batch_size : int, optional
+        Records per batch (default is 500).
+    flush_interval : float, optional
+        Seconds between sends (default is 2.0).
+    health_interval : float, optional
+        Minimum seconds between health reports (default is 60.0).
+    timeout : float, optional
+        Seconds to wait for an acknowledgement (default is 10.0).
+    """
+
+    def __init__(self, node_id, host, port, spool_path, batch_size=500, flush_interval=2.0, health_interval=60.0, timeout=10.0):
+        self.node_id = node_id or socket.gethostname()
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.last_health = None
+        self.sock = None
+        self.reader = None
+        self.seq = 0
+        self.sent = 0
+        self.rejected = 0
+        self.connects = 0
+        self.connected = False
+        self.rollup = MetricRollup(self.event)
+        self.spool = EventSpool(spool_path, self.send, fsync_interval=flush_interval / 2,
+                                replay_interval=flush_interval, batch_size=batch_size)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["node_id"], config["host"], config["port"], config["spool_path"], config["batch_size"],
+                   config["flush_interval"], config["health_interval"], config["timeout"])
+
+    def event(self, kind, **fields):
+        """Queue an event (e.g. "vibration_started") for the aggregator."""
+        return self.spool.append(kind, **fields)
+
+    def observe(self, score, state, camera=None, ts=None):
+        """Add one frame's score and detector state to the current minute's metrics."""
+        self.rollup.observe(score, state, camera, time.time() if ts is None else ts)
+
+    def health(self, status, ts=None):
+        """Queue a health report, at most once per `health_interval` seconds."""
+        now = time.time() if ts is None else ts
+        if self.last_health is not None and now - self.last_health < self.health_interval:
+            return
+        self.last_health = now
+        self.spool.append("health", **status)
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock, self.reader = sock, sock.makefile("rb")
+        self.request({"type": "hello", "node": self.node_id, "version": 1}, "welcome")
+        self.connects += 1
+        self.connected = True
+        logger.info(f"Connected to aggregator {self.host}:{self.port} as {self.node_id}.")
+
+    def disconnect(self):
+        self.connected = False
+        for item in (self.reader, self.sock):
+            if item is not None:
+                try:
+                    item.close()
+                except OSError:
+                    pass
+        self.sock = self.reader = None
+
+    def request(self, message, expected):
+        self.sock.sendall(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Aggregator closed the connection")
+        reply = json.loads(line)
+        if reply.get("type") != expected:
+            raise ConnectionError(f"Unexpected aggregator reply: {reply}")
+        return reply
+
+    def send(self, records):
+        """EventSpool sink: one batch, one round trip; raising keeps the records for later."""
+        try:
+            if self.sock is None:
+                self.connect()
+            self.seq += 1
+            reply = self.request({"type": "batch", "seq": self.seq, "records": records}, "ack")
+            self.sent += len(records)
+            if reply.get("rejected"):
+                # Acknowledged all the same: the aggregator keeps them aside, resending would not help
+                self.rejected += reply["rejected"]
+                logger.warning(f"Aggregator rejected {reply['rejected']} malformed records of {len(records)}.")
+        except Exception:
+            self.disconnect()
+            raise
+
+    def stats(self):
+        return {"node": self.node_id, "connected": self.connected, "connects": self.connects,
+                "sent": self.sent, "rejected": self.rejected, **self.spool.stats()}
+
+    def stop(self):
+        """Queue the current minute's metrics and send everything spooled before closing."""
+        self.rollup.flush()
+        self.spool.stop(flush=True)
+        self.disconnect()
+
+
+def simulate_node(index, args, stop_event):
+    """One simulated edge node: runs a plant-like score/state timeline at `args.speed` times real time."""
+    rng = random.Random(index)
+    spool_path = os.path.join(args.spool_dir, f"node{index:03d}.spool")
+    client = AggregatorClient(f"{args.prefix}{index:03d}", args.host, args.port, spool_path,
+                              flush_interval=args.flush_interval, health_interval=60.0)
+    sim_time = time.time()
+    state, until = 3, sim_time + rng.uniform(30, 300)
+    frames = 0
+    step = 1.0 / args.fps
+    try:
+        while not stop_event.is_set():
+            for _ in range(max(1, int(args.fps * args.speed * 0.1))):
+                sim_time += step
+                if sim_time >= until:
+                    # A slab arrives: vibration, then settling, then stable until the next one
+                    state = {3: 1, 1: 2, 2: 3}[state]
+                    until = sim_time + {1: rng.uniform(5, 30), 2: rng.uniform(5, 15), 3: rng.uniform(30, 300)}[state]
+                    if state in (1, 3):
+                        client.event("vibration_started" if state == 1 else "vibration_stopped", sim_ts=sim_time)
+                score = rng.uniform(150, 400) if state == 1 else rng.uniform(0, 140)
+                client.observe(score, state, "CAM1", sim_time)
+                client.health({"fps": args.fps, "frames": frames, "aggregator": client.stats()}, sim_time)
+                frames += 1
+            time.sleep(0.1)
+    finally:
+        client.stop()
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run simulated VMS edge nodes against an aggregator.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12400)
+    parser.add_argument("--nodes", type=int, default=10, help="Number of simulated nodes")
+    parser.add_argument("--seconds", type=float, default=60, help="Wall-clock run time")
+    parser.add_argument("--speed", type=float, default=60, help="Simulated seconds per wall-clock second")
+    parser.add_argument("--fps", type=float, default=20, help="Simulated frame rate per node")
+    parser.add_argument("--flush-interval", type=float, default=2.0)
+    parser.add_argument("--prefix", default="line")
+    parser.add_argument("--spool-dir", default="results/spool/simulated")
+    args = parser.parse_args()
+
+    stop_event = threading.Event()
+    clients = []
+    threads = [threading.Thread(target=lambda i=i: clients.append(simulate_node(i, args, stop_event)),
+                                name=f"node-{i}", daemon=True) for i in range(args.nodes)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=30)
+    sent = sum(client.sent for client in clients)
+    pending = sum(client.spool.stats()["pending_bytes"] for client in clients)
+    print(f"{len(clients)} nodes sent {sent} records; {pending} bytes still spooled "
+          f"({args.seconds * args.speed / 3600:.1f} simulated hours per node)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,724 @@
+import argparse
+import cv2
+import json
+import numpy as np
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from config_loader import CONFIG_PATH, load_config_section
+from score_store import DEFAULT_SCORE_STORE_CONFIG, SAMPLE_DTYPE, STATE_VIBRATING, STATE_SETTLING, ScoreStore, day_start, load_day
+from vibration_state import VibrationState, DEFAULT_DETECTOR_CONFIG
+
+BLOCK_SIZE = 1 << 20        # Samples read from a day file at a time, bounds memory use
+MAX_GAP = 2.0               # Seconds between samples above which the gap counts as "not monitored"
+DEFAULT_SHIFTS = "A=06:00-14:00,B=14:00-22:00,C=22:00-06:00"
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+# Log-spaced score histogram used for percentiles, about 0.4% per bin up to 255**2
+HIST_MIN = 1e-3
+HIST_MAX = 255.0 ** 2
+HIST_BINS = 4000
+HIST_RATIO = (HIST_MAX / HIST_MIN) ** (1.0 / (HIST_BINS - 2))
+
+
+def day_range(start, end):
+    """Yield "YYYY-MM-DD" strings from `start` to `end` inclusive."""
+    current = datetime.strptime(start, "%Y-%m-%d").date()
+    last = datetime.strptime(end, "%Y-%m-%d").date()
+    while current <= last:
+        yield current.isoformat()
+        current += timedelta(days=1)
+
+
+def list_cameras(root, days):
+    cameras = []
+    for day in days:
+        try:
+            _, meta = load_day(day, root)
+        except FileNotFoundError:
+            continue
+        cameras.extend(name for name in meta["cameras"] if name not in cameras)
+    return cameras
+
+
+def iter_samples(root, days, camera):
+    """
+    Yield (day, times, block) for one camera, oldest first.
+
+    Each day file is memory-mapped and walked in blocks of BLOCK_SIZE
+    samples, so only one block is ever copied into RAM. `times` are epoch
+    seconds (float64).
+    """
+    for day in days:
+        try:
+            samples, meta = load_day(day, root)
+        except FileNotFoundError:
+            continue
+        if camera not in meta["cameras"]:
+            continue
+        code = meta["cameras"].index(camera)
+        base = day_start(day)
+        for offset in range(0, len(samples), BLOCK_SIZE):
+            block = samples[offset:offset + BLOCK_SIZE]
+            if len(meta["cameras"]) > 1:
+                block = block[block["camera"] == code]
+            if len(block):
+                yield day, base + block["t_ms"] * 1e-3, block
+
+
+def intervals(times, prev_time, max_gap):
+    """Seconds since the previous sample for each sample, 0 across gaps longer than `max_gap`."""
+    dt = np.diff(times, prepend=times[0] if prev_time is None else prev_time)
+    dt[(dt < 0) | (dt > max_gap)] = 0.0
+    return dt
+
+
+def shifted(values, first):
+    """`values` moved one place to the right with `first` in front (the previous sample's value)."""
+    return np.concatenate(([first], values[:-1]))
+
+
+def parse_shifts(text):
+    """Parse "A=06:00-14:00,B=14:00-22:00" into [(name, start_minute, end_minute)]."""
+    shifts = []
+    for item in text.split(","):
+        name, span = item.split("=")
+        start, end = span.split("-")
+        to_minutes = lambda value: int(value[:2]) * 60 + int(value[3:5])
+        shifts.append((name.strip(), to_minutes(start), to_minutes(end)))
+    return shifts
+
+
+def shift_durations(root, days, camera, shifts, max_gap=MAX_GAP):
+    """
+    Vibration-on time per (shift day, shift).
+
+    A sample counts as "on" while the detector reports vibrating or settling,
+    i.e. while the PLC is being told the slab is not stable. The interval up
+    to the next sample is attributed to the earlier sample's state. Shifts
+    that cross midnight are credited to the day they started.
+
+    Returns {(shift_day, shift_name): [on_seconds, monitored_seconds, episodes]}.
+    """
+    count = len(shifts)
+    minute_shift = np.full(1440, -1, dtype=np.int64)
+    minute_day_offset = np.zeros(1440, dtype=np.int64)
+    for index, (_, start, end) in enumerate(shifts):
+        length = (end - start) % 1440 or 1440
+        minutes = (start + np.arange(length)) % 1440
+        minute_shift[minutes] = index
+        if start + length > 1440:
+            minute_day_offset[minutes[minutes < start]] = -1
+
+    results = {}
+    prev_time, prev_on = None, False
+    for day, times, block in iter_samples(root, days, camera):
+        state = block["state"]
+        on = (state == STATE_VIBRATING) | (state == STATE_SETTLING)
+        on_before = shifted(on, prev_on)
+        dt = intervals(times, prev_time, max_gap)
+        prev_time, prev_on = times[-1], on[-1]
+
+        minute = (block["t_ms"] // 60000).astype(np.int64) % 1440
+        shift = minute_shift[minute]
+        valid = shift >= 0
+        # Key 0..count-1: shift that started the day before, count..2*count-1: this day
+        key = ((minute_day_offset[minute] + 1) * count + shift)[valid]
+        on_seconds = np.bincount(key, weights=(dt * on_before)[valid], minlength=2 * count)
+        monitored = np.bincount(key, weights=dt[valid], minlength=2 * count)
+        episodes = np.bincount(key, weights=(on & ~on_before)[valid], minlength=2 * count)
+
+        this_day = datetime.strptime(day, "%Y-%m-%d").date()
+        for k in np.flatnonzero(monitored + episodes):
+            shift_day = this_day - timedelta(days=1) if k < count else this_day
+            totals = results.setdefault((shift_day.isoformat(), shifts[k % count][0]), [0.0, 0.0, 0])
+            totals[0] += on_seconds[k]
+            totals[1] += monitored[k]
+            totals[2] += int(episodes[k])
+    return results
+
+
+def histogram_bins(scores):
+    bins = np.floor(np.log(np.maximum(scores, HIST_MIN) / HIST_MIN) / np.log(HIST_RATIO)).astype(np.int64) + 1
+    bins[scores < HIST_MIN] = 0
+    return np.minimum(bins, HIST_BINS - 1)
+
+
+def bin_upper_edge(index):
+    return 0.0 if index == 0 else HIST_MIN * HIST_RATIO ** index
+
+
+def score_percentiles(root, days, camera, percentiles=PERCENTILES):
+    """
+    Score percentiles over all samples, while vibrating and while not.
+
+    Scores are accumulated into a fixed log-spaced histogram block by block,
+    so the result is exact to within one bin (about 0.4%) and memory use does
+    not depend on the length of the range.
+    """
+    groups = ("all", "vibrating", "stable")
+    counts = {group: np.zeros(HIST_BINS, dtype=np.int64) for group in groups}
+    totals = {group: [0, 0.0, -np.inf] for group in groups}  # count, sum, max
+    for _, _, block in iter_samples(root, days, camera):
+        scores = block["score"]
+        bins = histogram_bins(scores)
+        vibrating = block["state"] == STATE_VIBRATING
+        for group, mask in (("all", None), ("vibrating", vibrating), ("stable", ~vibrating)):
+            selected_bins = bins if mask is None else bins[mask]
+            selected = scores if mask is None else scores[mask]
+            if not len(selected):
+                continue
+            counts[group] += np.bincount(selected_bins, minlength=HIST_BINS)
+            totals[group][0] += len(selected)
+            totals[group][1] += float(selected.sum(dtype=np.float64))
+            totals[group][2] = max(totals[group][2], float(selected.max()))
+
+    results = {}
+    for group in groups:
+        total, score_sum, score_max = totals[group]
+        if total == 0:
+            continue
+        cumulative = np.cumsum(counts[group])
+        values = [min(score_max, bin_upper_edge(int(np.searchsorted(cumulative, total * p / 100.0))))
+                  for p in percentiles]
+        results[group] = {"count": total, "mean": score_sum / total, "max": score_max,
+                          "percentiles": dict(zip(percentiles, values))}
+    return results
+
+
+def runs_of(mask):
+    """Start and end (exclusive) indices of the runs of True in `mask`, each followed by len(mask) as an end marker."""
+    count = len(mask)
+    changes = np.flatnonzero(np.diff(mask)) + 1
+    rising = mask[changes]
+    starts = np.append(changes[rising], count)
+    ends = np.append(changes[~rising], [count, count] if mask[-1] else count)
+    return (np.insert(starts, 0, 0) if mask[0] else starts), ends
+
+
+def next_in(runs, index):
+    """First index at or after `index` inside one of `runs`, the end marker where there is none."""
+    starts, ends = runs
+    run = np.searchsorted(starts, index, side="right") - 1
+    inside = (run >= 0) & (index < ends[np.maximum(run, 0)])
+    return np.where(inside, index, starts[np.minimum(run + 1, len(starts) - 1)])
+
+
+def first_elapsed(times, peaks, start, end, since, seconds):
+    """
+    First index in [start, end) at least `seconds` after `since`, `end` or beyond where there is none.
+
+    Works element-wise on arrays and returns an array. `peaks` is the
+    running maximum of `times`, so the result is exact even if the clock
+    stepped back.
+    """
+    index = np.maximum(start, np.searchsorted(peaks, np.add(since, seconds)) - 1)
+    index, end, since = np.broadcast_arrays(np.atleast_1d(index), end, since)
+    index = index.copy()
+    pending = np.flatnonzero(index < end)
+    while len(pending):
+        pending = pending[times[index[pending]] - since[pending] < seconds]
+        index[pending] += 1
+        pending = pending[index[pending] < end[pending]]
+    return index
+
+
+def first_quiet(times, peaks, quiet, start, since, seconds):
+    """
+    First frame of the `quiet` runs at or after `start` and at least `seconds` after `since`.
+
+    Returns the frames (len(times) where there is none) and the index of
+    their run. Runs are picked by their latest time first, so only the
+    frames of a run that can hold the answer are searched.
+    """
+    count = len(times)
+    starts, ends = quiet
+    latest = peaks[ends[:-1] - 1]
+    run = np.minimum(np.searchsorted(ends, start, side="right"), len(latest))
+    run = first_elapsed(latest, latest, run, len(latest), since, seconds)
+    found = np.maximum(start, starts[run])
+    since = np.broadcast_to(since, found.shape)
+    early = np.flatnonzero(found < count)
+    while len(early):
+        early = early[times[found[early]] - since[early] < seconds]
+        found[early] = first_elapsed(times, peaks, found[early], ends[run[early]], since[early], seconds)
+        # Past the end of the run only if the clock stepped back, go on with the next late enough run
+        early = early[found[early] >= ends[run[early]]]
+        run[early] = first_elapsed(latest, latest, run[early] + 1, len(latest), since[early], seconds)
+        found[early] = starts[run[early]]
+        early = early[found[early] < count]
+    return found, run
+
+
+def detector_runs(times, peaks, scores, mes_score, detector_config, above_since):
+    """
+    Runs of frames above and below the thresholds of one mes_score, and where VIBRATING can start and end.
+
+    `above_since` is when the run above that the previous block ended in
+    started, NaN if it did not end above. Returns a dict of runs and
+    hand-overs for `settled_stable()` and `replay_block()`, and the
+    `above_since` for the next block.
+    """
+    count = len(times)
+    above = scores > mes_score
+    quiet = scores < mes_score * detector_config["off_ratio"]
+    runs = {"above": runs_of(above), "quiet": runs_of(quiet)}
+
+    # Leaving STABLE needs scores above mes_score for the debounce time, from the start of their run
+    starts, ends = runs["above"]
+    since = times[starts[:-1]]
+    if len(since) and starts[0] == 0 and not np.isnan(above_since):
+        since[0] = above_since
+    above_since = since[-1] if len(since) and ends[-2] == count else np.nan
+    reach = np.flatnonzero(peaks[ends[:-1] - 1] - since >= detector_config["debounce"])
+    armed = first_elapsed(times, peaks, starts[reach], ends[reach], since[reach], detector_config["debounce"])
+    valid = armed < ends[reach]
+    runs["armed"] = (np.append(armed[valid], count), np.append(ends[reach][valid], count))
+
+    # VIBRATING is entered at the start of a run above (from SETTLING) or at its first armed frame
+    # (from STABLE). It hands over to SETTLING at the first quiet frame after min_vibrating, and the
+    # next run above enters VIBRATING again.
+    entries = np.sort(np.concatenate((starts[:-1], runs["armed"][0][:-1])))
+    entries = entries[np.diff(entries, prepend=-1) > 0]
+    settle, settle_run = first_quiet(times, peaks, runs["quiet"], entries + 1, times[entries],
+                                     detector_config["min_vibrating"])
+    resume = next_in(runs["above"], np.minimum(settle + 1, count))
+    runs.update(entries=entries, settle=settle, settle_run=settle_run, resume=resume,
+                next_entry=np.searchsorted(entries, resume))
+
+    # Runs of quiet frames that follow a frame in the hysteresis band, which restarts the settling
+    # time, and the first of them after each hand-over
+    first = runs["quiet"][0][:-1]
+    after_band = np.flatnonzero(first > 0)
+    runs["after_band"] = after_band[~above[first[after_band] - 1]]
+    runs["later_band"] = np.searchsorted(runs["after_band"], settle_run + 1)
+    return runs, above_since
+
+
+def settled_stable(times, peaks, runs, stable_seconds):
+    """
+    Where SETTLING turns STABLE for one stable_threshold, and where the next episode starts.
+
+    STABLE is reached at the first quiet frame `stable_seconds` after the
+    hand-over to SETTLING, or after the band frame in front of its run of
+    quiet frames. Returns a dict with the STABLE frame for each hand-over
+    in runs["settle"] (len(times) if the next frame above comes first),
+    the first armed frame after it, and the first frames of the quiet runs
+    after a band frame together with the earliest STABLE frame timed from
+    that run or a later one.
+    """
+    count = len(times)
+    starts, ends = runs["quiet"]
+    first, last = starts[runs["after_band"]], ends[runs["after_band"]]
+    since = times[first - 1]
+    from_band = np.full(len(first) + 1, count)
+    reach = np.flatnonzero(peaks[last - 1] - since >= stable_seconds)
+    found = first_elapsed(times, peaks, first[reach], last[reach], since[reach], stable_seconds)
+    from_band[reach] = np.where(found < last[reach], found, count)
+    from_band = np.minimum.accumulate(from_band[::-1])[::-1]
+    first = np.append(first, count)
+
+    settle, resume = runs["settle"], runs["resume"]
+    stable_at = np.full(len(settle), count)
+    settled = np.flatnonzero(settle < count)
+    entries = settle[settled]
+    last = ends[runs["settle_run"][settled]]
+    own = np.full(len(entries), count)
+    reach = np.flatnonzero(peaks[last - 1] - times[entries] >= stable_seconds)
+    found = first_elapsed(times, peaks, entries[reach] + 1, last[reach], times[entries[reach]], stable_seconds)
+    own[reach] = np.where(found < last[reach], found, count)
+    later = from_band[runs["later_band"][settled]]
+    stable_at[settled] = np.where(own < count, own, np.where(later < resume[settled], later, count))
+
+    # The first armed frame after a settling is always one of the entries
+    stopped = np.flatnonzero(stable_at < count)
+    rearm = np.full(len(settle), count)
+    rearm[stopped] = next_in(runs["armed"], stable_at[stopped] + 1)
+    rearm_entry = np.full(len(settle), len(runs["entries"]))
+    rearm_entry[stopped] = np.searchsorted(runs["entries"], rearm[stopped])
+    return {"stable_at": stable_at, "rearm": rearm, "rearm_entry": rearm_entry, "band_first": first, "from_band": from_band}
+
+
+def replay_block(times, peaks, elapsed, runs, stable, stable_seconds, min_vibrating, replay):
+    """
+    Advance one candidate's detector replay over a block of samples.
+
+    Does what feeding every sample to VibrationDetector.update() would do,
+    but only visits the samples where the state changes. `runs` and
+    `stable` come from `detector_runs()` and `settled_stable()`: once
+    VIBRATING is entered at one of runs["entries"], the replay follows
+    the hand-overs to a settling that turns STABLE and on to the next
+    episode without looking at the frames in between. `elapsed` is the
+    running sum of the sample intervals with a leading 0. `replay` holds
+    the state, its timestamps and the counts, and is carried from block to
+    block.
+    """
+    count = len(times)
+    entries, settle, next_entry = runs["entries"], runs["settle"], runs["next_entry"]
+    quiet_starts, quiet_ends = runs["quiet"]
+    stable_at, rearm, rearm_entry = stable["stable_at"], stable["rearm"], stable["rearm_entry"]
+    band_first, from_band = stable["band_first"], stable["from_band"]
+    state = replay["state"]
+    stable_from = 0 if state == VibrationState.STABLE else None
+    stable_time = 0.0
+    entry = None  # Index into entries of the frame VIBRATING was entered at, if in this block
+    last_entry = len(entries)
+
+    def entry_at(frame):
+        index = int(np.searchsorted(entries, frame))
+        return index if index < len(entries) and entries[index] == frame else None
+
+    i = 0
+    while i < count:
+        if state is None:
+            # First sample: vibrating if it says so, otherwise wait out the stable time
+            if next_in(runs["above"], i) == i:
+                state = VibrationState.VIBRATING
+                replay["episodes"] += 1
+                entry = entry_at(i)
+            else:
+                state = VibrationState.SETTLING
+                replay["quiet_since"] = times[i]
+            replay["entered_at"] = times[i]
+            i += 1
+
+        elif state == VibrationState.STABLE:
+            k = int(next_in(runs["armed"], i))
+            if k == count:
+                break
+            stable_time += elapsed[k + 1] - elapsed[stable_from]
+            state = VibrationState.VIBRATING
+            replay["entered_at"] = times[k]
+            replay["episodes"] += 1
+            entry = entry_at(k)
+            i = k + 1
+
+        elif state == VibrationState.VIBRATING and entry is not None:
+            # VIBRATING -> SETTLING -> VIBRATING within the same episode until a settling lasts,
+            # then STABLE -> VIBRATING at the next armed frame, which starts the next episode
+            while True:
+                while stable_at[entry] == count and next_entry[entry] < last_entry:
+                    entry = next_entry[entry]
+                k = stable_at[entry]
+                if k == count or rearm[entry] == count:
+                    break
+                stable_time += elapsed[rearm[entry] + 1] - elapsed[k + 1]
+                replay["stable_signals"] += 1
+                replay["episodes"] += 1
+                entry = rearm_entry[entry]
+            if stable_at[entry] < count:
+                k = stable_at[entry]
+                state = VibrationState.STABLE
+                replay["entered_at"] = times[k]
+                replay["stable_signals"] += 1
+                stable_from = i = k + 1
+            elif settle[entry] < count:
+                state = VibrationState.SETTLING
+                replay["entered_at"] = replay["quiet_since"] = times[settle[entry]]
+                i = settle[entry] + 1
+            else:
+                replay["entered_at"] = times[entries[entry]]
+                break
+            entry = None
+
+        elif state == VibrationState.VIBRATING:
+            k = int(first_quiet(times, peaks, runs["quiet"], i, replay["entered_at"], min_vibrating)[0][0])
+            if k == count:
+                break
+            state = VibrationState.SETTLING
+            replay["entered_at"] = replay["quiet_since"] = times[k]
+            i = k + 1
+
+        else:
+            # SETTLING until the next frame above. The quiet run at `i` is timed from quiet_since,
+            # the later ones from the band frame in front of them.
+            end = int(next_in(runs["above"], i))
+            k = count
+            run = np.searchsorted(quiet_starts, i, side="right") - 1
+            if run >= 0 and i < quiet_ends[run] and peaks[quiet_ends[run] - 1] - replay["quiet_since"] >= stable_seconds:
+                k = int(first_elapsed(times, peaks, i, quiet_ends[run], replay["quiet_since"], stable_seconds)[0])
+                k = k if k < quiet_ends[run] else count
+            if k == count and from_band[np.searchsorted(band_first, i + 1)] < end:
+                k = int(from_band[np.searchsorted(band_first, i + 1)])
+            if k < count:
+                state = VibrationState.STABLE
+                replay["entered_at"] = times[k]
+                replay["stable_signals"] += 1
+                stable_from = i = k + 1
+            elif end < count:
+                # Back to VIBRATING within the same episode, as in the app
+                state = VibrationState.VIBRATING
+                replay["entered_at"] = times[end]
+                entry = entry_at(end)
+                i = end + 1
+            else:
+                last_band = quiet_starts[-2] - 1 if len(quiet_starts) > 1 and quiet_ends[-2] == count else count - 1
+                if last_band >= i:
+                    replay["quiet_since"] = times[last_band]
+                break
+
+    if state == VibrationState.STABLE:
+        stable_time += elapsed[count] - elapsed[stable_from]
+    replay["state"] = state
+    replay["unstable"] += elapsed[count] - stable_time
+
+
+def threshold_sweep(root, days, camera, mes_scores, stable_thresholds, max_gap=MAX_GAP, detector_config=None):
+    """
+    Replay the stored scores through the detector with candidate thresholds.
+
+    Each (mes_score, stable_threshold) pair is run through the
+    VibrationDetector state machine, with the hysteresis, debounce and
+    minimum vibrating time of the `detector` config section, so the counts
+    are what the running app would have signalled. The above and quiet
+    masks are built with numpy once per block and mes_score, and the state
+    is only stepped at the frames where it can change (see
+    `replay_block()`), so a month of scores takes seconds.
+
+    Returns arrays of shape (len(mes_scores), len(stable_thresholds)):
+    episodes (vibration_started events), stable signals and seconds not
+    stable. Gaps longer than `max_gap` are not counted as not stable.
+    """
+    if detector_config is None:
+        detector_config = load_config_section('detector', DEFAULT_DETECTOR_CONFIG)
+    min_vibrating = detector_config["min_vibrating"]
+    replays = [[{"state": None, "entered_at": None, "quiet_since": None,
+                 "episodes": 0, "stable_signals": 0, "unstable": 0.0}
+                for _ in stable_thresholds] for _ in mes_scores]
+    # Start of the run of frames above each mes_score that the last block ended in, NaN if none
+    above_since = np.full(len(mes_scores), np.nan)
+    prev_time = None
+    for _, times, block in iter_samples(root, days, camera):
+        # Compare in float64 like the detector does, not at the float32 precision of the store
+        scores = block["score"].astype(np.float64)
+        peaks = np.maximum.accumulate(times) if (times[1:] < times[:-1]).any() else times
+        elapsed = np.concatenate(([0.0], np.cumsum(intervals(times, prev_time, max_gap))))
+        prev_time = times[-1]
+        for i, mes_score in enumerate(mes_scores):
+            runs, above_since[i] = detector_runs(times, peaks, scores, mes_score, detector_config, above_since[i])
+            for j, stable_threshold in enumerate(stable_thresholds):
+                stable = settled_stable(times, peaks, runs, stable_threshold)
+                replay_block(times, peaks, elapsed, runs, stable, stable_threshold, min_vibrating, replays[i][j])
+
+    episodes = np.array([[replay["episodes"] for replay in row] for row in replays], dtype=np.int64)
+    stable_signals = np.array([[replay["stable_signals"] for replay in row] for row in replays], dtype=np.int64)
+    unstable_seconds = np.array([[replay["unstable"] for replay in row] for row in replays])
+    return episodes, stable_signals, unstable_seconds
+
+
+def write_synthetic_days(root, days, camera="SYNTHETIC", fps=20, seed=0):
+    """
+    Fill a ScoreStore at `root` with a full day of synthetic scores per day in `days`.
+
+    Scores are a noise floor around 20 with a noisy burst around 400
+    lasting 20-120 s about every ten minutes, at jittered frame times. Each day is handed
+    to the store's writer thread in one piece, so the files are the ones
+    the app would write.
+    """
+    rng = np.random.default_rng(seed)
+    count = int(fps * 86400)
+    store = ScoreStore(root, chunk_size=count, expected_fps=fps)
+    for day in days:
+        offsets = np.arange(count) / fps + rng.uniform(0, 0.5 / fps, count)
+        scores = rng.gamma(2.0, 10.0, count)
+        starts = np.cumsum(rng.exponential(600.0, int(86400 / 600 * 2)))
+        ends = starts + rng.uniform(20.0, 120.0, len(starts))
+        burst = np.searchsorted(starts, offsets) - 1
+        vibrating = (burst >= 0) & (offsets < ends[np.maximum(burst, 0)])
+        scores[vibrating] = rng.lognormal(np.log(400.0), 0.4, int(vibrating.sum()))
+        rows = np.zeros(count, dtype=SAMPLE_DTYPE)
+        rows["t_ms"] = (offsets * 1000).astype(np.uint32)
+        rows["score"] = scores
+        store.jobs.put((day, rows, [camera]))
+    store.jobs.put(None)
+    store.thread.join()
+
+
+def sweep_benchmark(days=30, fps=20, mes_score=150.0, stable_threshold=2.0, limit=5.0):
+    """
+    Time `threshold_sweep()` with the default 5 x 3 candidates over `days` synthetic days.
+
+    Returns (seconds, samples, passed), `passed` being False if the sweep
+    took longer than `limit` seconds.
+    """
+    names = list(day_range("2025-01-01", (date(2025, 1, 1) + timedelta(days=days - 1)).isoformat()))
+    with tempfile.TemporaryDirectory() as root:
+        write_synthetic_days(root, names, fps=fps)
+        started = time.perf_counter()
+        threshold_sweep(root, names, "SYNTHETIC", [mes_score * factor for factor in (0.5, 0.75, 1, 1.5, 2)],
+                        [stable_threshold * factor for factor in (0.5, 1, 2)], detector_config=DEFAULT_DETECTOR_CONFIG)
+        seconds = time.perf_counter() - started
+    return seconds, days * int(fps * 86400), seconds <= limit
+
+
+def plot_scores(root, days, camera, output_path, width=1600, height=400, mes_score=None, log_scale=False):
+    """
+    Draw the score history of `days` into a PNG.
+
+    Samples are decimated to one min/max pair per pixel column with
+    reduceat, so the plot costs the same for an hour or a month. Columns that
+    contain vibrating frames are shaded.
+    """
+    start_ts = day_start(days[0])
+    end_ts = day_start(days[-1]) + 86400
+    lows = np.full(width, np.inf)
+    highs = np.full(width, -np.inf)
+    vibrating = np.zeros(width, dtype=bool)
+    for _, times, block in iter_samples(root, days, camera):
+        columns = np.clip(((times - start_ts) * width / (end_ts - start_ts)).astype(np.int64), 0, width - 1)
+        starts = np.flatnonzero(np.diff(columns, prepend=-1))
+        ids = columns[starts]
+        scores = block["score"]
+        lows[ids] = np.minimum(lows[ids], np.minimum.reduceat(scores, starts))
+        highs[ids] = np.maximum(highs[ids], np.maximum.reduceat(scores, starts))
+        vibrating[ids] |= np.logical_or.reduceat(block["state"] == STATE_VIBRATING, starts)
+
+    has_data = np.isfinite(highs)
+    if not has_data.any():
+        return False
+
+    margin_left, margin_bottom, margin_top = 70, 30, 20
+    plot_width = width
+    plot_height = height - margin_bottom - margin_top
+    canvas = np.full((height, width + margin_left + 10, 3), 255, dtype=np.uint8)
+    transform = np.log1p if log_scale else (lambda value: value)
+    top = transform(max(highs[has_data].max(), mes_score or 0) * 1.05)
+
+    def to_y(value):
+        return (margin_top + plot_height - np.clip(transform(value) / top, 0, 1) * plot_height).astype(np.int64)
+
+    x = margin_left + np.arange(plot_width)
+    canvas[margin_top:margin_top + plot_height, x[vibrating]] = (210, 210, 255)
+    y_low, y_high = to_y(np.where(has_data, lows, 0)), to_y(np.where(has_data, highs, 0))
+    for column in np.flatnonzero(has_data):
+        cv2.line(canvas, (int(x[column]), int(y_low[column])), (int(x[column]), int(y_high[column])), (120, 60, 0), 1)
+    if mes_score:
+        y = int(to_y(np.array([mes_score]))[0])
+        cv2.line(canvas, (margin_left, y), (margin_left + plot_width, y), (0, 0, 220), 1)
+        cv2.putText(canvas, f"mes_score {mes_score:g}", (margin_left + 5, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 220), 1)
+
+    cv2.rectangle(canvas, (margin_left, margin_top), (margin_left + plot_width, margin_top + plot_height), (0, 0, 0), 1)
+    label = np.expm1(top) if log_scale else top
+    cv2.putText(canvas, f"{label:.0f}", (5, margin_top + 10), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 1)
+    cv2.putText(canvas, "0", (5, margin_top + plot_height), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 1)
+    ticks = min(len(days) + 1, 8)
+    for tick in range(ticks):
+        ts = start_ts + (end_ts - start_ts) * tick / max(1, ticks - 1)
+        tick_x = margin_left + int(plot_width * tick / max(1, ticks - 1))
+        text = datetime.fromtimestamp(ts).strftime("%m-%d %H:%M")
+        cv2.putText(canvas, text, (min(tick_x, canvas.shape[1] - 85), height - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 1)
+    cv2.putText(canvas, camera, (margin_left + 5, margin_top - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 1)
+    return cv2.imwrite(output_path, canvas)
+
+
+def current_settings():
+    """mes_score and stable_threshold from config.json, or None if unavailable."""
+    try:
+        with open(CONFIG_PATH, 'r') as file:
+            config_data = json.load(file)
+        return config_data.get("mes_score"), config_data.get("stable_threshold")
+    except Exception:
+        return None, None
+
+
+def parse_numbers(text):
+    return [float(value) for value in text.split(",") if value.strip()]
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse the stored per-frame motion scores.")
+    parser.add_argument("--root", default=DEFAULT_SCORE_STORE_CONFIG["path"], help="Score store directory")
+    parser.add_argument("--start", default=date.today().isoformat(), help='First day, "YYYY-MM-DD" (default today)')
+    parser.add_argument("--end", help='Last day, "YYYY-MM-DD" (default --start)')
+    parser.add_argument("--camera", help="Camera serial number (default: every camera in the range)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    shifts = commands.add_parser("shifts", help="Vibration-on time per shift")
+    shifts.add_argument("--shifts", default=DEFAULT_SHIFTS, help=f'Shift definitions (default "{DEFAULT_SHIFTS}")')
+    shifts.add_argument("--max-gap", type=float, default=MAX_GAP, help="Longer gaps between samples are not counted")
+
+    commands.add_parser("percentiles", help="Score percentiles overall, while vibrating and while stable")
+
+    sweep = commands.add_parser("sweep", help="What-if counts for candidate thresholds")
+    sweep.add_argument("--mes-scores", help="Comma separated candidates (default: 0.5x-2x the configured value)")
+    sweep.add_argument("--stable-thresholds", help="Comma separated seconds (default: 0.5x-2x the configured value)")
+    sweep.add_argument("--max-gap", type=float, default=MAX_GAP)
+
+    benchmark = commands.add_parser("benchmark", help="Time the sweep over synthetic days (ignores --root and the day range)")
+    benchmark.add_argument("--days", type=int, default=30)
+    benchmark.add_argument("--fps", type=int, default=20)
+    benchmark.add_argument("--limit", type=float, default=5.0, help="Fail if the sweep takes longer than this many seconds")
+
+    plot = commands.add_parser("plot", help="Downsampled score plot as PNG")
+    plot.add_argument("-o", "--output", required=True, help="PNG path, the camera name is appended when several cameras are plotted")
+    plot.add_argument("--width", type=int, default=1600)
+    plot.add_argument("--height", type=int, default=400)
+    plot.add_argument("--log", action="store_true", help="Logarithmic score axis")
+
+    args = parser.parse_args()
+    if args.command == "benchmark":
+        seconds, samples, passed = sweep_benchmark(args.days, args.fps, limit=args.limit)
+        print(f"Swept {samples} samples ({args.days} days at {args.fps} fps) with 15 candidates in {seconds:.2f} s, "
+              f"{'OK' if passed else 'FAILED'} (limit {args.limit:g} s)")
+        sys.exit(0 if passed else 1)
+
+    days = list(day_range(args.start, args.end or args.start))
+    cameras = [args.camera] if args.camera else list_cameras(args.root, days)
+    if not cameras:
+        print(f"No motion scores stored in {args.root} for {days[0]} to {days[-1]}.")
+        return
+    mes_score, stable_threshold = current_settings()
+    started = time.perf_counter()
+
+    for camera in cameras:
+        print(f"Camera {camera}, {days[0]} to {days[-1]}")
+        if args.command == "shifts":
+            results = shift_durations(args.root, days, camera, parse_shifts(args.shifts), args.max_gap)
+            print(f"{'Day':<12}{'Shift':<8}{'Vibrating':>12}{'Monitored':>12}{'%':>8}{'Episodes':>10}")
+            for (day, shift), (on, monitored, episodes) in sorted(results.items()):
+                share = 100.0 * on / monitored if monitored else 0.0
+                print(f"{day:<12}{shift:<8}{format_duration(on):>12}{format_duration(monitored):>12}{share:>8.1f}{episodes:>10}")
+
+        elif args.command == "percentiles":
+            results = score_percentiles(args.root, days, camera)
+            print(f"{'Frames':<10}{'Count':>12}{'Mean':>10}{'Max':>10}" + "".join(f"{'p' + format(p, 'g'):>10}" for p in PERCENTILES))
+            for group, values in results.items():
+                print(f"{group:<10}{values['count']:>12}{values['mean']:>10.1f}{values['max']:>10.1f}"
+                      + "".join(f"{value:>10.1f}" for value in values["percentiles"].values()))
+
+        elif args.command == "sweep":
+            if not (args.mes_scores or mes_score) or not (args.stable_thresholds or stable_threshold):
+                parser.error("Give --mes-scores and --stable-thresholds (config.json could not be read)")
+            mes_scores = parse_numbers(args.mes_scores) if args.mes_scores else \
+                [mes_score * factor for factor in (0.5, 0.75, 1, 1.5, 2)]
+            stable_thresholds = parse_numbers(args.stable_thresholds) if args.stable_thresholds else \
+                [stable_threshold * factor for factor in (0.5, 1, 2)]
+            episodes, signals, unstable = threshold_sweep(args.root, days, camera, mes_scores, stable_thresholds, args.max_gap)
+            print(f"{'mes_score':>10}{'stable_s':>10}{'Episodes':>10}{'Stable sig':>12}{'Not stable':>12}")
+            for i, candidate in enumerate(mes_scores):
+                for j, threshold in enumerate(stable_thresholds):
+                    current = " *" if (candidate, threshold) == (mes_score, stable_threshold) else ""
+                    print(f"{candidate:>10g}{threshold:>10g}{episodes[i, j]:>10}{signals[i, j]:>12}"
+                          f"{format_duration(unstable[i, j]):>12}{current}")
+
+        elif args.command == "plot":
+            output = args.output
+            if len(cameras) > 1:
+                root, ext = output.rsplit(".", 1) if "." in output else (output, "png")
+                output = f"{root}_{camera}.{ext}"
+            if plot_scores(args.root, days, camera, output, args.width, args.height, mes_score, args.log):
+                print(f"Saved {output}")
+            else:
+                print("No samples to plot.")
+
+    print(f"Done in {time.perf_counter() - started:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,45 @@
 import cv2
 import time
 import numpy as np
-import os
 from datetime import datetime
 from cam import CameraThread, load_camera_config, error_image
-from logging_config import logger
-from database import create_db_if_not_exists, create_table_if_not_exists, store_vibration_stopped_time
+from logging_config import logger, ic
 from file_verifier import check_and_create_files
-from plc import PLC
+from pacing import FrameScheduler, SegmentClock, AdaptiveRate, DEFAULT_ADAPTIVE_RATE_CONFIG
+from plc_gate import PLCGate, DEFAULT_PLC_GATE_CONFIG, FAIL_OPEN
+from plc_writer import PLCWriter
+from publisher import FramePublisher, DEFAULT_PUBLISHER_CONFIG
+from config_loader import load_config_section
+from control_api import ControlServer, ControlState, DEFAULT_CONTROL_API_CONFIG
+from preview_server import PreviewServer, DEFAULT_PREVIEW_CONFIG
+from segment_index import SegmentIndex
+from recording import VideoRecorder, load_recording_config, segment_path
+from score_store import ScoreStore, DEFAULT_SCORE_STORE_CONFIG
+from vibration_state import VibrationDetector, VibrationState, DEFAULT_DETECTOR_CONFIG
+from mp_pipeline import CaptureProcess, RecordingProcess, load_pipeline_config
+from startup import SubsystemManager
+from frame_graph import FrameGraph
+from event_spool import EventSpool, DEFAULT_EVENT_SPOOL_CONFIG
+from aggregator_client import AggregatorClient, DEFAULT_AGGREGATOR_CONFIG
+from snapshots import SnapshotWriter, DEFAULT_SNAPSHOT_CONFIG
+from compactor import Compactor, DEFAULT_COMPACTOR_CONFIG
+from mosaic import Mosaic, DEFAULT_MOSAIC_CONFIG
+from tracing import tracer, install_signal_handlers, DEFAULT_TRACING_CONFIG
+import multiprocessing
 import json
 import traceback
 import sys
 import shutil
-from icecream import ic
 from copy import deepcopy
 ic.disable()
-plc = PLC()
+
+DEFAULT_PLC_CONFIG = {
+    "port": "COM7",  # Serial port, or a pySerial URL such as socket://127.0.0.1:5020 for plc_simulator.py
+    "refresh_interval": 5.0,  # Seconds between re-sends of D10, so a lost write or a PLC restart is corrected
+}
 
 class VideoProcessor:
-    def __init__(self, mes_score=50, fps=10, video_duration=180, stable_threshold=1, motion_blur=True):
+    def __init__(self, mes_score=50, fps=10, video_duration=180, stable_threshold=1, motion_blur=True, headless=False):
         """
         Initializes the Vibration Detection System.
 
@@ -34,6 +55,8 @@ class VideoProcessor:
             Threshold for determining stability in seconds (default is 1).
         motion_blur : bool, optional
             Flag to enable or disable motion blur detection (default is True).
+        headless : bool, optional
+            Run without local display windows, e.g. under soak_test.py (default is False).
 
         Attributes:
         ----------
@@ -43,28 +66,35 @@ class VideoProcessor:
             Frames per second for video capture.
         VIDEO_DURATION : int
             Duration of the video in seconds.
-        stable_time : int
-            Tracks the stable duration before detecting vibration.
         STABLE_THRESHOLD : int
             Threshold in seconds for determining if an object is stable.
         mes_score : int
             Motion energy score used for vibration detection.
+        detector : VibrationDetector
+            Time-based VIBRATING/SETTLING/STABLE state machine, tuned in the "detector" config section.
         cnt_frame : int
             Counter for processed frames.
-        fps : int
-            Current frames per second.
+        fps : float
+            Achieved frames per second, averaged over recent loop ticks.
         frame_dict : dict
             Dictionary to store frames and related metadata.
         camera_threads : list
-            List to store active camera threads.
+            List to store active camera threads (or capture processes).
         video_writer : object or None
             Video writer object for saving video files.
         start_time : float
             Timestamp of when the system was initialized.
-        video_start_time : float
-            Timestamp of when video recording started.
-        frame_gray_p : object or None
-            Placeholder for storing the previous grayscale frame.
+        roi_gray_p : object or None
+            Grayscale ROI of the previous frame, compared with the current one.
+        roi_gray_p_source : object or None
+            Raw frame `roi_gray_p` was taken from.
+        previous_frame : object or None
+            Raw frame of the last tick with a new picture; at the idle detection rate the
+            scored frame is compared with it rather than with the last scored frame.
+        previous_frame_time : float or None
+            Monotonic tick time of `previous_frame`.
+        frame_graph : FrameGraph
+            Lazy per-frame stages (ROI crop, gray, equalized, display); only the ones asked for run.
         title : str
             Title of the system interface or display.
         last_saved_time : float
@@ -73,22 +103,93 @@ class VideoProcessor:
             Region of interest (ROI) configuration loaded from a file or database.
         fps_for_frame : int
             FPS counter for individual frames.
-        last_plc_signal_time : float
-            Timestamp of the last received PLC (Programmable Logic Controller) signal.
+        scheduler : FrameScheduler
+            Paces the processing loop at `FPS` with drift correction.
+        segment_clock : SegmentClock
+            Keeps the frame count of the current video segment in step with wall-clock time.
+        recording_config : dict
+            The "recording" config section (codec, container, quality, fps, overview track).
+        RECORD_FPS : float
+            Frame rate of recorded segments; follows `FPS` unless set in the recording config.
+        publisher : FramePublisher or None
+            Streams recorded frames to a Recorder_PC when enabled in the "publisher" config section.
+        recording_mode : str
+            "continuous" to record every segment, "off" to stop recording.
+        control_state : ControlState or None
+            Mailbox for live updates from the embedded control API, applied between frames.
+        preview_server : PreviewServer or None
+            Remote MJPEG preview of the display frame, enabled in the "preview" config section.
+        active_camera : str or None
+            Serial number of the camera whose frame is being processed.
+        camera_connected : bool
+            Whether the active camera delivered a frame on this tick (False while it shows the error image).
+        last_changed_at : float or None
+            `changed_at` of the last frame read from the active camera; an unchanged value means no new picture.
+        repeated_frames : int
+            Frames skipped by detection because the camera delivered no new picture.
+        rate : AdaptiveRate
+            Drops detection to a low rate while the line is calm, configured by the "adaptive_rate" config section.
+        plc_gate : PLCGate or None
+            Polls the door, slab and roller inputs and gates detection and recording, enabled in the "plc_gate" config section.
+        gate_decision : Decision
+            The gate's current detection mode ("full", "reduced" or "off") and whether to record.
+        gate_version : int
+            Input version last seen from the gate, to wake detection on PLC activity.
+        roi_valid : bool
+            False while the ROI lies outside the camera frame, which pauses detection.
+        segment_index : SegmentIndex
+            Index of recorded segments and detector events (results/index.db).
+        video_path : str or None
+            Path of the segment currently being recorded.
+        segment_size : tuple or None
+            (width, height) of the camera frames the current segment was opened for.
+        vibrating : bool or None
+            Last reported detector state, used to index vibration start/stop events.
+        score_store : ScoreStore or None
+            Per-frame motion score history (results/scores), enabled in the "score_store" config section.
+        pipeline_config : dict
+            The "pipeline" config section: whether capture and recording run as threads or separate processes.
+        recording_process : RecordingProcess or None
+            Process that encodes segments when recording runs in "process" mode.
+        subsystems : SubsystemManager
+            Connects the PLC and the database in the background and reports their readiness.
+        plc_config : dict
+            The "plc" config section: serial port and output refresh interval.
+        plc_writer : PLCWriter
+            Writes PLC registers from a background thread and re-sends them periodically and after reconnects.
+        event_spool : EventSpool
+            Local spool that keeps database events until they are stored, whatever the database state.
+        headless : bool
+            When True, frames are not shown in local windows (the preview server still gets them).
+        running : bool
+            Cleared by `stop()` to end the processing loop after the current frame.
+        aggregator : AggregatorClient or None
+            Sends events, health and per-minute metrics to the plant aggregator, enabled in the "aggregator" config section.
+        snapshots : SnapshotWriter or None
+            Background JPEG snapshots of vibration start/stop events (results/snapshots), enabled in the "snapshots" config section.
+        compactor : Compactor or None
+            Transcodes old segments to a lower resolution while the app is idle, enabled in the "compactor" config section.
+        mosaic_config : dict
+            The "mosaic" config section: the single-canvas display of all cameras.
+        mosaic : Mosaic or None
+            Display canvas with one tile per camera, created on first use when enough cameras are configured.
 
         Notes:
         -----
-        - Calls `create_db_if_not_exists()` and `create_table_if_not_exists()` 
-        to ensure the database and tables are initialized.
+        - The PLC and the database are initialized in the background by `start_subsystems()`
+        once the cameras are started, so they never delay the first frames.
         - Loads the region of interest (ROI) using `load_roi()`.
         - Uses the `ic()` function for debugging initialization.
         """
         self.MOTION_BLUR = motion_blur
+        self.headless = headless
+        self.running = True
         self.FPS = fps
         self.VIDEO_DURATION = video_duration
-        self.stable_time = 0  # Time in seconds
         self.STABLE_THRESHOLD = stable_threshold
         self.mes_score = mes_score
+        self.detector = VibrationDetector.from_config(mes_score, stable_threshold,
+                                                      load_config_section('detector', DEFAULT_DETECTOR_CONFIG))
         ic("IN initialization :", self.mes_score)
         self.cnt_frame = 0
         self.fps = 0
@@ -96,15 +197,71 @@ class VideoProcessor:
         self.camera_threads = []
         self.video_writer = None
         self.start_time = time.time()
-        self.video_start_time = self.start_time
-        self.frame_gray_p = None
+        self.roi_gray_p = None
+        self.roi_gray_p_source = None
+        self.previous_frame = None
+        self.previous_frame_time = None
+        self.frame_graph = self.build_frame_graph()
         self.title = "Vibration Detection System"
         self.last_saved_time = time.time()
-        create_db_if_not_exists()
-        create_table_if_not_exists()
         self.roi = self.load_roi()
         self.fps_for_frame = 0
-        self.last_plc_signal_time = 0
+        self.scheduler = FrameScheduler(self.FPS)
+        self.recording_config = load_recording_config()
+        self.RECORD_FPS = self.recording_config['fps'] or self.FPS
+        self.segment_clock = SegmentClock(self.RECORD_FPS)
+        self.publisher = None
+        publisher_config = load_config_section('publisher', DEFAULT_PUBLISHER_CONFIG)
+        if publisher_config['enabled']:
+            self.publisher = FramePublisher.from_config(publisher_config)
+        self.recording_mode = self.recording_config['mode']
+        self.control_state = None
+        self.control_server = None
+        self.preview_server = None
+        self.active_camera = None
+        self.segment_index = SegmentIndex()
+        self.video_path = None
+        self.segment_size = None
+        self.vibrating = None
+        self.score_store = None
+        score_store_config = load_config_section('score_store', DEFAULT_SCORE_STORE_CONFIG)
+        if score_store_config['enabled']:
+            self.score_store = ScoreStore.from_config(score_store_config, self.FPS)
+        self.pipeline_config = load_pipeline_config()
+        self.recording_process = None
+        self.subsystems = SubsystemManager()
+        self.plc_config = load_config_section('plc', DEFAULT_PLC_CONFIG)
+        self.plc_writer = PLCWriter(lambda: self.subsystems.get('plc'), self.plc_config['refresh_interval'])
+        event_spool_config = load_config_section('event_spool', DEFAULT_EVENT_SPOOL_CONFIG)
+        self.event_spool = EventSpool.from_config(event_spool_config, self.store_spooled_events)
+        self.aggregator = None
+        aggregator_config = load_config_section('aggregator', DEFAULT_AGGREGATOR_CONFIG)
+        if aggregator_config['enabled']:
+            self.aggregator = AggregatorClient.from_config(aggregator_config)
+        self.snapshots = None
+        snapshot_config = load_config_section('snapshots', DEFAULT_SNAPSHOT_CONFIG)
+        if snapshot_config['enabled']:
+            self.snapshots = SnapshotWriter.from_config(snapshot_config)
+        self.compactor = None
+        compactor_config = load_config_section('compactor', DEFAULT_COMPACTOR_CONFIG)
+        if compactor_config['enabled']:
+            self.compactor = Compactor.from_config(compactor_config, self.segment_index)
+        self.mosaic_config = load_config_section('mosaic', DEFAULT_MOSAIC_CONFIG)
+        self.mosaic = None
+        self.camera_connected = False
+        self.last_changed_at = None
+        self.repeated_frames = 0
+        tracer.configure(load_config_section('tracing', DEFAULT_TRACING_CONFIG))
+        self.rate = AdaptiveRate.from_config(load_config_section('adaptive_rate', DEFAULT_ADAPTIVE_RATE_CONFIG))
+        self.plc_gate = None
+        plc_gate_config = load_config_section('plc_gate', DEFAULT_PLC_GATE_CONFIG)
+        if plc_gate_config['enabled']:
+            # An input change ends the current tick wait, so a starting line is not held up by the idle rate
+            self.plc_gate = PLCGate.from_config(lambda: self.subsystems.get('plc'), plc_gate_config,
+                                                on_change=self.scheduler.interrupt)
+        self.gate_decision = FAIL_OPEN
+        self.gate_version = 0
+        self.roi_valid = True
 
 
     def load_storage_limit(self):
@@ -140,9 +297,156 @@ class VideoProcessor:
             logger.error(traceback.format_exc())
             return None
 
+    def start_control_api(self):
+        """Start the embedded HTTP control API if enabled in config.json."""
+        control_config = load_config_section('control_api', DEFAULT_CONTROL_API_CONFIG)
+        if not control_config['enabled']:
+            return
+        try:
+            self.control_state = ControlState(self.roi, {
+                "mes_score": self.mes_score,
+                "stable_threshold": self.STABLE_THRESHOLD,
+                "fps": self.FPS,
+                "recording_mode": self.recording_mode,
+            })
+            self.control_server = ControlServer(self.control_state, control_config['host'], control_config['port'])
+            self.control_server.start()
+        except Exception as e:
+            logger.error(f"Error starting control API: {e}")
+            logger.error(traceback.format_exc())
+            self.control_state = None
+            self.control_server = None
+
+    def start_preview_server(self):
+        """Start the remote live preview server if enabled in config.json."""
+        preview_config = load_config_section('preview', DEFAULT_PREVIEW_CONFIG)
+        if not preview_config['enabled']:
+            return
+        try:
+            self.preview_server = PreviewServer.from_config(preview_config)
+            self.preview_server.start()
+        except Exception as e:
+            logger.error(f"Error starting preview server: {e}")
+            logger.error(traceback.format_exc())
+            self.preview_server = None
+
+    def record_event(self, kind, snapshot=None):
+        """Index a detector event against the current segment and frame."""
+        frame_no = self.segment_clock.frames_written if self.video_path else None
+        self.segment_index.add_event(kind, time.time(), self.active_camera, self.video_path, frame_no, snapshot)
+
+    def set_vibrating(self, vibrating, frame_raw=None, score=None):
+        """Record a vibration start/stop event; return the path of its snapshot, if one was taken."""
+        if vibrating == self.vibrating:
+            return None
+        previous, self.vibrating = self.vibrating, vibrating
+        if previous is None and not vibrating:
+            return None  # Stable from the start: nothing stopped
+        kind = "vibration_started" if vibrating else "vibration_stopped"
+        snapshot = None
+        if self.snapshots is not None and frame_raw is not None:
+            snapshot = self.snapshots.submit(kind, frame_raw, self.roi, score, time.time(), self.active_camera)
+        self.record_event(kind, snapshot)
+        if self.aggregator is not None:
+            self.aggregator.event(kind, camera=self.active_camera, snapshot=snapshot)
+        return snapshot
+
+    def handle_transition(self, transition, frame_raw, score):
+        """Act on a detector state change; nothing here runs on frames without one."""
+        logger.info(f"Detector {transition.previous.name if transition.previous else 'START'} -> {transition.state.name}")
+        tracer.instant(f"detector {transition.state.name}", "detector")
+        self.rate.wake(transition.at, f"detector {transition.state.name}")
+        if transition.state == VibrationState.VIBRATING:
+            logger.info('\n[Vibration Detected...!]\n')
+            self.set_vibrating(True, frame_raw, score)
+            self.write_plc(4106, 200) # 4106 D10 # Send off signal to y0
+        elif transition.state == VibrationState.STABLE:
+            logger.info('[Stable : No Vibration Detected....]\n')
+            was_vibrating = self.vibrating
+            snapshot = self.set_vibrating(False, frame_raw, score)
+            self.write_plc(4106, 100) # 4106 D10 send on signal to y0
+            if was_vibrating:
+                # Save the time to the database via the local spool; not after startup or a frozen stream
+                self.event_spool.append("vibration_stopped", time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'), snapshot=snapshot)
+        elif transition.state == VibrationState.FROZEN:
+            logger.error(f"Camera {self.active_camera} has delivered no new picture for {self.detector.freeze_timeout} s; "
+                         f"stable signalling is blocked until live video returns.")
+            self.write_plc(4106, 200)  # Withdraw the stable signal: the line must not act on stale video
+            self.record_event("stream_frozen")
+            if self.aggregator is not None:
+                self.aggregator.event("stream_frozen", camera=self.active_camera)
+        if transition.previous == VibrationState.FROZEN:
+            logger.info(f"Camera {self.active_camera} delivers new pictures again.")
+            self.record_event("stream_resumed")
+            if self.aggregator is not None:
+                self.aggregator.event("stream_resumed", camera=self.active_camera)
+
+    def apply_control_updates(self):
+        """Apply all updates received from the control API since the last frame."""
+        updates = self.control_state.take_pending()
+        if not updates:
+            return
+        self.rate.wake(time.monotonic(), "control update")
+        if 'roi' in updates:
+            self.roi = updates['roi']
+        if 'mes_score' in updates:
+            self.mes_score = updates['mes_score']
+        if 'stable_threshold' in updates:
+            self.STABLE_THRESHOLD = updates['stable_threshold']
+        self.detector.set_thresholds(self.mes_score, self.STABLE_THRESHOLD)
+        if 'fps' in updates and updates['fps'] != self.FPS:
+            self.FPS = updates['fps']
+            self.scheduler.set_target_fps(self.FPS)
+            if not self.recording_config['fps']:
+                self.close_video()  # The next segment is opened at the new rate
+                self.RECORD_FPS = self.FPS
+                self.segment_clock = SegmentClock(self.RECORD_FPS)
+        if 'recording_mode' in updates:
+            self.recording_mode = updates['recording_mode']
+        logger.info(f"Applied control updates: {updates}")
+
+    def apply_gate(self, now):
+        """Follow the PLC gate's decision; PLC input changes also count as activity for the adaptive rate."""
+        decision = self.plc_gate.decide(now)
+        if decision != self.gate_decision:
+            logger.info(f"PLC gate: detection {decision.detection}, recording {'on' if decision.recording else 'off'} "
+                        f"({decision.rule or 'no rule matches'}).")
+            tracer.instant(f"gate {decision.detection}", "plc")
+            if decision.detection == 'full':
+                self.rate.release(now, "PLC: line active")
+            else:
+                self.rate.hold(now, f"PLC: {decision.rule}")
+            if decision.detection == 'off':
+                self.roi_gray_p = None  # The first frame after resuming has nothing stale to compare with
+            if decision.detection != self.gate_decision.detection:
+                self.record_event({'full': "line_active", 'reduced': "line_reduced", 'off': "line_idle"}[decision.detection])
+            self.gate_decision = decision
+        if self.plc_gate.version != self.gate_version:
+            self.gate_version = self.plc_gate.version
+            if decision.detection == 'full':
+                self.rate.wake(now, "PLC activity")
+
+    def start_subsystems(self):
+        self.subsystems.start('plc', lambda: connect_plc(self.plc_config['port']))
+        self.subsystems.start('database', connect_database)
+
+    def write_plc(self, address, value):
+        """Set a PLC register; the PLC writer thread writes it and keeps it asserted."""
+        self.plc_writer.set(address, value)
+
+    def store_spooled_events(self, records):
+        """Event spool sink, called from the spool's replayer thread."""
+        database = self.subsystems.get('database')
+        if database is None:
+            raise RuntimeError("Database is not ready")
+        database.store_spooled_events(records)
+
     def add_camera(self, cam_serial_num, rtsp_path):
         try:
-            thread = CameraThread(cam_serial_num, rtsp_path, self.frame_dict)
+            if self.pipeline_config['capture'] == 'process':
+                thread = CaptureProcess.from_config(cam_serial_num, rtsp_path, self.pipeline_config)
+            else:
+                thread = CameraThread(cam_serial_num, rtsp_path, self.frame_dict)
             self.camera_threads.append(thread)
             thread.start()
             logger.info(f"Camera with serial {cam_serial_num} added successfully.")
@@ -152,8 +456,10 @@ class VideoProcessor:
 
     def create_video_writer(self, output_path):
         try:
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            return cv2.VideoWriter(output_path, fourcc, self.FPS, (1920, 1080))  # Adjust the frame size as needed
+            # Sized from the first frame written, so any camera resolution is recorded
+            if self.recording_process is not None:
+                return self.recording_process.open(output_path, self.RECORD_FPS, self.recording_config)
+            return VideoRecorder.from_config(output_path, self.RECORD_FPS, self.recording_config)
         except Exception as e:
             logger.error(f"Error creating video writer: {e}")
             logger.error(traceback.format_exc())
@@ -169,18 +475,6 @@ class VideoProcessor:
             logger.error(traceback.format_exc())
             raise e
 
-    def lighting_compensation(self, frame):
-        try:
-            logger.info("Performing lighting compensation...")
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            compensated_frame = cv2.equalizeHist(gray)
-            logger.info("Lighting compensation applied.")
-            return compensated_frame
-        except Exception as e:
-            logger.error(f"Error in lighting compensation: {e}")
-            logger.error(traceback.format_exc())
-            raise e
-
     def overlay_logo(self, frame, logo, position=(10, 10)):
         try:
             logger.info("Overlaying logo...")
@@ -249,143 +543,179 @@ class VideoProcessor:
             logger.error(traceback.format_exc())
             raise e
 
+    def compose_mosaic(self, frame):
+        """
+        Put the processed camera's display frame and the latest frame of every
+        other camera into the mosaic canvas. Tiles of cameras without a new
+        frame are left as they are.
+        """
+        cameras = [thread.cam_serial_num for thread in self.camera_threads]
+        if self.mosaic is None or self.mosaic.cameras != cameras:
+            self.mosaic = Mosaic.from_config(cameras, self.mosaic_config)
+        for thread in self.camera_threads:
+            if thread.cam_serial_num == self.active_camera:
+                if not self.camera_connected:
+                    status = "DISCONNECTED"
+                else:
+                    status = self.detector.state.name if self.detector.state is not None else "LIVE"
+                self.mosaic.update(self.active_camera, frame, status)
+            else:
+                info = thread.read_info()
+                if info.frame is error_image:
+                    status = "DISCONNECTED"
+                elif time.monotonic() - info.changed_at >= self.detector.freeze_timeout:
+                    status = "FROZEN"
+                else:
+                    status = "LIVE"
+                self.mosaic.update(thread.cam_serial_num, info.frame, status)
+        return self.mosaic.canvas
+
     def show(self, name, frame):
         try:
             logger.info(f"Displaying frame in window: {name}")
-            cv2.namedWindow(name, cv2.WINDOW_NORMAL)
-            cv2.imshow(name, frame)
+            if not self.headless:
+                if self.mosaic_config['enabled'] and len(self.camera_threads) >= self.mosaic_config['min_cameras']:
+                    display = self.compose_mosaic(frame)
+                else:
+                    display = frame
+                cv2.namedWindow(name, cv2.WINDOW_NORMAL)
+                cv2.imshow(name, display)
+            if self.preview_server is not None:
+                self.preview_server.publish(self.active_camera, frame)
         except Exception as e:
             logger.error(f"Error showing frame: {e}")
             logger.error(traceback.format_exc())
             raise e
 
-    def start_video_recording(self, video_writer, frame_raw):
+    def start_video_recording(self, video_writer, frame_raw, now=None):
         try:
             logger.info("Starting video recording...")
-            video_writer.write(frame_raw)
+            video_writer.write(frame_raw, now)
             logger.info(f"Frame written to video.\n{'='*100}")
         except Exception as e:
             logger.error(f"Error in starting video recording: {e}")
             logger.error(traceback.format_exc())
             raise e
 
-    def process_frame(self, frame_raw, logo, frame_gray):
+    def build_frame_graph(self):
+        """Per-frame stages; each runs only for frames where something asks for it."""
+        graph = FrameGraph()
+        graph.stage("roi_frame", self.crop_roi, "raw", "roi")
+        graph.stage("roi_gray", lambda roi_frame: None if roi_frame is None else cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY), "roi_frame")
+        graph.stage("gray", lambda raw: cv2.cvtColor(raw, cv2.COLOR_BGR2GRAY), "raw")
+        graph.stage("equalized", cv2.equalizeHist, "gray")  # Lighting compensation, for detectors that need it
+        graph.stage("display_base", self.display_base, "raw")
+        graph.stage("display", self.render_display, "display_base", "logo", "roi", "notification")
+        return graph
+
+    def crop_roi(self, frame_raw, roi):
+        """The ROI part of the frame, or None when the ROI lies outside it (e.g. after a camera change)."""
+        crop = frame_raw[roi['y']:roi['y'] + roi['height'], roi['x']:roi['x'] + roi['width']]
+        return crop if crop.size else None
+
+    def display_base(self, frame_raw):
+        """Display copy of the frame, blurred when motion blur is enabled."""
+        if self.MOTION_BLUR:
+            logger.info("Applying motion blur...")
+            return cv2.GaussianBlur(frame_raw, (3, 3), 0)
+        return frame_raw.copy()
+
+    def render_display(self, frame, logo, roi, notification):
+        self.overlay_logo(frame, logo, (10, 10))
+        self.put_title(frame, self.title)
+        # Draw the ROI rectangle on the full frame (for display purposes)
+        cv2.rectangle(frame, (roi['x'], roi['y']), (roi['x'] + roi['width'], roi['y'] + roi['height']), (0, 255, 0), 2)  # Green color
+        if notification is not None:
+            self.put_motion_notification(frame, notification)
+        # Display FPS in the bottom-left corner
+        fps_text = f"FPS: {int(self.fps_for_frame)}"
+        cv2.putText(frame, fps_text, (10, frame.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+        return frame
+
+    def process_frame(self, frame_raw, logo, fresh=True, previous_frame=None, storage_ok=None):
         try:
             ic.disable()
             logger.info(f"Processing frame {self.cnt_frame}...")
+            frame = self.frame_graph.frame(raw=frame_raw, roi=self.roi, logo=logo)
 
-            # Check storage before continuing the recording
-            if not self.check_storage():
-                self.overlay_logo(frame_raw, logo, (10, 10))
-                self.put_title(frame_raw, self.title)
-                self.put_motion_notification(frame_raw, "Storage Full!")  # Show "Storage Full!" notification
-                fps_text = f"FPS: {int(self.fps_for_frame)}"
-                cv2.putText(frame_raw, fps_text, (10, frame_raw.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-                self.show(f'Camera Feed', frame_raw)  # Display the frame with the notification
+            # Check storage before continuing the recording (the loop passes its once-per-tick result)
+            if not (self.check_storage() if storage_ok is None else storage_ok):
+                frame.set("notification", "Storage Full!")  # Show "Storage Full!" notification
+                self.show(f'Camera Feed', frame.get("display"))  # Display the frame with the notification
                 return  # Stop further processing of frames, recording won't continue
 
-            self.roi = self.load_roi()
-            # Extract the ROI for vibration detection
-            roi_x = self.roi['x']
-            roi_y = self.roi['y']
-            roi_width = self.roi['width']
-            roi_height = self.roi['height']
-
-            # Extract ROI region from the frame
-            roi_frame = frame_raw[roi_y:roi_y+roi_height, roi_x:roi_x+roi_width]
-            logger.info("ROI extracted.")
-
-            if self.MOTION_BLUR:
-                logger.info("Applying motion blur...")
-                frame = cv2.GaussianBlur(frame_raw, (3, 3), 0)
-                logger.info("Motion blur applied.")
-            else:
-                frame = frame_raw
-
-            # Lighting compensation
-            compensated_frame = self.lighting_compensation(frame)
-
-            # Overlay logo
-            self.overlay_logo(frame, logo, (10, 10))
-
-            # Put title
-            self.put_title(frame, self.title)
-
-            # Draw the ROI rectangle on the full frame (for display purposes)
-            cv2.rectangle(frame, (roi_x, roi_y), (roi_x + roi_width, roi_y + roi_height), (0, 255, 0), 2)  # Green color
-
-            # Perform vibration detection only inside the ROI
-            if self.cnt_frame > 0:
-                mse_result = self.mse(cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY), self.frame_gray_p[roi_y:roi_y+roi_height, roi_x:roi_x+roi_width])
-                if mse_result > self.mes_score:  # Detect motion in ROI
-                    ic("WHile checking condition of mse",self.mes_score)
-                    ic(mse_result)
-                    ic(mse_result > self.mes_score)
-                    self.stable_time = 0  # Reset stable time when vibration is detected
-                    self.video_start_time = time.time()
-                    ic(self.stable_time, "vibration When mse is", mse_result)
-                    logger.info('\n[Vibration Detected...!]\n')
-                    self.put_motion_notification(frame, "Vibration Detected!")
-                    plc.write_bit(4106, 200) # 4106 D10 # Send off signal to y0
-                else:
-                    # Increment stable time by the duration of the frame processing
-                    self.stable_time += (time.time() - self.video_start_time)
-                    ic(self.stable_time, "No vibration..... When mse is", mse_result)
-                    logger.info(f"Logging self.stable_time - {self.stable_time} untill it reaches -Self.stable_theshold: {self.STABLE_THRESHOLD}")
-                    if self.stable_time > self.STABLE_THRESHOLD:
-                        logger.info(f"self.stable_time {self.stable_time} is now greater than self.stable_Threshold {self.STABLE_THRESHOLD} condition matched.....")
-                        ic(self.stable_time > self.STABLE_THRESHOLD)
-                        # If stable time exceeds the threshold, trigger the actions
-                        logger.info('[Stable : No Vibration Detected....]\n')
-                        ic('[Stable : No Vibration Detected....]\n')
-                        self.put_motion_notification(frame, "No Vibration detected")  # Display stable notification    
-                        # Check if 10 seconds have passed since the last PLC signal was sent
-                        current_time = time.time()
-                        plc.write_bit(4106, 100) # 4106 D10 send on signal to y0
-                        if not hasattr(self, 'last_plc_signal_time') or current_time - self.last_plc_signal_time >= 10:
-                            store_vibration_stopped_time()  # Save the time to the database
-                            print("Send Signal TO PLC")
-                            # Send signal to PLC
-                            self.last_plc_signal_time = current_time  # Update the time of the last signal
-                        else:
-                            logger.info("Waiting to send PLC signal until 10 seconds have passed.")
-                            # print(f'Waiting to send PLC signal until 10 seconds have passed. {time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time()))}')
-
-                        # Send signal to plc
-                        # plc.write_bit(4106, 100) # 4106 D10 send on signal to y0
-                        # self.stable_time = 0  # Reset the stable time after sending notification
-                        # self.video_start_time = time.time()
-                    else:
-                        self.put_motion_notification(frame, "Vibration Detected!")
-
-            # Display FPS in the bottom-left corner
-            fps_text = f"FPS: {int(self.fps_for_frame)}"
-            cv2.putText(frame, fps_text, (10, frame.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+            # Perform vibration detection only inside the ROI, and only on a new picture
+            detect_start = tracer.begin()
+            if fresh:
+                roi_gray = frame.get("roi_gray")
+                if roi_gray is None:
+                    if self.roi_valid:
+                        logger.error(f"ROI {self.roi} lies outside the {frame_raw.shape[1]}x{frame_raw.shape[0]} frame; "
+                                     f"vibration detection is paused until it is corrected.")
+                    self.roi_valid = False
+                elif previous_frame is not None and previous_frame is not self.roi_gray_p_source:
+                    # Ticks were skipped at the idle rate: compare with the previous tick, not the last scored one
+                    previous_roi = self.crop_roi(previous_frame, self.roi)
+                    self.roi_gray_p = None if previous_roi is None else cv2.cvtColor(previous_roi, cv2.COLOR_BGR2GRAY)
+                    self.roi_gray_p_source = previous_frame
+                if roi_gray is not None and self.roi_gray_p is not None and self.roi_gray_p.shape == roi_gray.shape:
+                    mse_result = self.mse(roi_gray, self.roi_gray_p)
+                    transition = self.detector.update(mse_result, time.monotonic())
+                    if transition is not None:
+                        # The tick's own copy: the camera buffer gets the next timestamp drawn on it in place
+                        self.handle_transition(transition, self.frame_for_video, mse_result)
+                    state = self.detector.state
+                    self.rate.observe(mse_result, state == VibrationState.STABLE, self.detector.on_score, time.monotonic())
+                    if self.score_store is not None:
+                        self.score_store.append(time.time(), self.active_camera, 0, mse_result, int(state))
+                    if self.aggregator is not None:
+                        self.aggregator.observe(mse_result, int(state), self.active_camera)
+                if roi_gray is not None:
+                    self.roi_valid = True
+                self.roi_gray_p = roi_gray
+                self.roi_gray_p_source = frame_raw
+            tracer.complete("detect", detect_start, None, "frame")
+            state = self.detector.state
+            notification = None
+            if state == VibrationState.FROZEN:
+                notification = "Camera Frozen!"
+            elif not self.roi_valid:
+                notification = "ROI outside frame!"
+            elif self.gate_decision.detection == 'off':
+                notification = "Line idle"
+            elif state == VibrationState.STABLE:
+                notification = "No Vibration detected"  # Display stable notification
+            elif state is not None:
+                notification = "Vibration Detected!"
 
             # Display the frame
-            self.show(f'Camera Feed', frame)
-            logger.info(f"Frame {self.cnt_frame} processed successfully.")
-
-            self.frame_gray_p = cv2.cvtColor(frame_raw, cv2.COLOR_BGR2GRAY)
+            frame.set("notification", notification)
+            with tracer.span("show", "frame"):
+                self.show(f'Camera Feed', frame.get("display"))
+            logger.info(f"Frame {self.cnt_frame} processed successfully, stages run: {frame.ran}")
 
         except Exception as e:
             logger.error(f"Error processing frame {self.cnt_frame}: {e}")
             logger.error(traceback.format_exc())
             raise e
 
-    def manage_video(self):
+    def manage_video(self, frame_size):
+        """Open a segment sized for the camera's `frame_size`, or reopen it when the camera changes resolution."""
         try:
             current_time = datetime.now().strftime("%H:%M:%S")
 
+            if not self.camera_connected:
+                return current_time  # A new segment waits for a real frame; the error image has a size of its own
+            if self.video_writer is not None and frame_size != self.segment_size:
+                logger.info(f"Camera resolution changed from {self.segment_size} to {frame_size}, starting a new segment.")
+                self.close_video()
             if self.video_writer is None:
-                output_dir = "results/videos"
-                current_date = datetime.now().strftime("%Y-%m-%d")
-                date_dir = os.path.join(output_dir, current_date)
-                os.makedirs(date_dir, exist_ok=True)
-
-                video_filename = datetime.now().strftime('%H-%M-%S') + '.avi'
-                output_path = os.path.join(date_dir, video_filename)
+                self.segment_size = frame_size
+                output_path = segment_path("results/videos", self.recording_config['container'])
                 self.video_writer = self.create_video_writer(output_path)
+                self.segment_clock.start_segment(self.scheduler.last_tick)
+                self.video_path = output_path
+                self.segment_index.open_segment(self.active_camera, output_path, time.time(), self.RECORD_FPS)
                 logger.info(f"Started recording: {output_path}")
 
             return current_time
@@ -394,63 +724,193 @@ class VideoProcessor:
             logger.error(traceback.format_exc())
             raise e
 
+    def close_video(self):
+        if self.video_writer is None:
+            return
+        logger.info(f"Segment closed. Recording: {self.segment_clock.stats()}, loop: {self.scheduler.stats()}")
+        self.video_writer.release()
+        self.video_writer = None
+        self.segment_index.close_segment(self.video_path, time.time(), self.segment_clock.frames_written)
+        self.video_path = None
+
     def process(self):
         try:
             logo_path = 'data/logo.png'  # Top left logo
             logo = cv2.imread(logo_path, cv2.IMREAD_UNCHANGED)
 
             camera_config = load_camera_config()
+            # Cameras first: the PLC and database come up in the background meanwhile
             for cam_serial_num, rtsp_path in camera_config.items():
                 self.add_camera(cam_serial_num, rtsp_path)
-            # prev_frame_time = 0
-            # new_frame_time = 0
-            while True:
-                prev_frame_time = time.time()
-                for thread in self.camera_threads:
-                    frame_raw = self.frame_dict.get(thread.cam_serial_num, error_image)
-                if frame_raw is None:
-                    frame_raw = error_image.copy()
-                cv2.rectangle(frame_raw, (20,20), (600,100), (0,0,0), -1)
-                c_time = datetime.now()
-                cv2.putText(frame_raw, str(c_time)[:-7], (40,65), cv2.FONT_HERSHEY_SIMPLEX, 1.3, (255, 255, 255), 2 )
-                self.frame_for_video = frame_raw.copy()
+            self.start_subsystems()
+            self.plc_writer.start()
+            if self.compactor is not None:
+                self.compactor.start()
+            if self.plc_gate is not None:
+                self.plc_gate.start()
+            if self.pipeline_config['recording'] == 'process':
+                self.recording_process = RecordingProcess.from_config(self.pipeline_config)
+                self.recording_process.start()
+            self.start_control_api()
+            self.start_preview_server()
+            while self.running:
+                with tracer.span("wait", "loop"):
+                    tick_time = self.scheduler.wait()
+                frame_start = tracer.begin()
+                with tracer.span("control", "loop"):
+                    if self.control_state is not None:
+                        self.apply_control_updates()
+                    if self.plc_gate is not None:
+                        self.apply_gate(tick_time)
+                with tracer.span("read", "loop"):
+                    info = None
+                    for thread in self.camera_threads:
+                        info = thread.read_info()
+                        self.active_camera = thread.cam_serial_num
+                    frame_raw = info.frame if info is not None else None
+                    self.camera_connected = frame_raw is not None and frame_raw is not error_image
+                    if not self.camera_connected:
+                        # The timestamp is drawn on it below; an open segment records the outage at its own size
+                        frame_raw = error_image.copy() if self.video_writer is None else cv2.resize(error_image, self.segment_size)
+                    elif self.control_state is not None:
+                        self.control_state.set_frame_size(frame_raw.shape[1], frame_raw.shape[0])
+                    # Only a new picture is worth scoring: a repeat would read as a perfectly still slab
+                    fresh = self.camera_connected and info.changed_at != self.last_changed_at
+                    if self.camera_connected and not fresh:
+                        self.repeated_frames += 1
+                    self.last_changed_at = info.changed_at if self.camera_connected else None
+                    if info is not None:
+                        transition = self.detector.check_frozen(info.changed_at, time.monotonic())
+                        if transition is not None:
+                            self.handle_transition(transition, frame_raw, 0.0)
+                with tracer.span("timestamp", "loop"):
+                    cv2.rectangle(frame_raw, (20,20), (600,100), (0,0,0), -1)
+                    c_time = datetime.now()
+                    cv2.putText(frame_raw, str(c_time)[:-7], (40,65), cv2.FONT_HERSHEY_SIMPLEX, 1.3, (255, 255, 255), 2 )
+                    self.frame_for_video = frame_raw.copy()
                 # frame_raw = cv2.resize(frame_raw, (1920, 1080))  # Resize the frame if necessary
-                frame_gray = cv2.cvtColor(frame_raw, cv2.COLOR_BGR2GRAY)
-
-                current_time = self.manage_video()
-                frame_for_process = frame_raw.copy()
-                self.process_frame(frame_for_process, logo, frame_gray)
-                if self.check_storage():
-                    self.start_video_recording(self.video_writer, self.frame_for_video)
-                
-
-                end_time = time.time()
-                seconds = end_time - self.start_time
-                self.fps = 1.0 / seconds
-                self.cnt_frame += 1
 
-                if seconds >= self.VIDEO_DURATION:
-                    self.video_writer.release()
-                    self.video_writer = None
-                    self.start_time = time.time()  # Reset the start time for the next video
+                recording = self.recording_mode == 'continuous' and self.gate_decision.recording
+                storage_ok = self.check_storage()  # Once per tick: a disk query, a config read and a log line
+                with tracer.span("manage_video", "loop"):
+                    if recording:
+                        current_time = self.manage_video((frame_raw.shape[1], frame_raw.shape[0]))
+                    else:
+                        self.close_video()
+                # With the whole loop slowed to the idle rate the previous tick is an idle period old:
+                # keep this frame as the reference and score the next one, a full-rate period later
+                detecting = self.gate_decision.detection != 'off'
+                slowed = self.scheduler.target_fps < self.FPS
+                pairing = slowed and fresh and detecting and (self.previous_frame_time is None
+                                                              or tick_time - self.previous_frame_time > 1.5 / self.FPS)
+                if pairing:
+                    self.scheduler.tick_soon(1.0 / self.FPS)
+                elif self.rate.due(tick_time):
+                    with tracer.span("process_frame", "loop"):
+                        self.process_frame(frame_raw, logo, fresh and detecting, self.previous_frame,
+                                           storage_ok)  # Stages never draw on the raw frame
+                if fresh:
+                    self.previous_frame = frame_raw  # Only a reference; scoring against it costs nothing unless a tick is skipped
+                    self.previous_frame_time = tick_time
+                elif not self.camera_connected:
+                    self.previous_frame = self.previous_frame_time = None
+                with tracer.span("record", "loop"):
+                    if recording and self.video_writer is not None and storage_ok:
+                        # Drop or duplicate so the segment timeline matches wall-clock time
+                        for _ in range(self.segment_clock.frames_due(tick_time)):
+                            self.start_video_recording(self.video_writer, self.frame_for_video, tick_time)
+                    if self.publisher is not None:
+                        self.publisher.submit(self.frame_for_video)
+
+                # Recording keeps its own rate; without it the whole loop can slow down with detection
+                loop_fps = self.rate.idle_fps if self.rate.idle and not recording else self.FPS
+                if loop_fps != self.scheduler.target_fps:
+                    self.scheduler.set_target_fps(loop_fps)
+
+                self.fps = self.scheduler.achieved_fps
+                self.fps_for_frame = self.scheduler.instant_fps
+                if self.cnt_frame == 0:
+                    logger.info(f"First frame processed {time.time() - self.start_time:.2f} s after start.")
+                self.cnt_frame += 1
 
-                if cv2.waitKey(1) & 0xFF == ord('q'):  # If 'q' key is pressed
+                if self.segment_clock.elapsed() >= self.VIDEO_DURATION:
+                    self.close_video()
+                status_start = tracer.begin()
+                if self.control_state is not None or self.aggregator is not None:
+                    status = {"loop": self.scheduler.stats(), "recording": self.segment_clock.stats(),
+                              "subsystems": self.subsystems.status(), "plc_writer": self.plc_writer.stats,
+                              "event_spool": self.event_spool.stats(),
+                              "detector": {**self.detector.stats(time.monotonic()), "repeated_frames": self.repeated_frames},
+                              "stages": self.frame_graph.stats()}
+                    if self.snapshots is not None:
+                        status["snapshots"] = self.snapshots.stats
+                    if self.compactor is not None:
+                        status["compactor"] = self.compactor.stats
+                    status["tracing"] = tracer.stats()
+                    status["rate"] = self.rate.stats(time.monotonic())
+                    if self.plc_gate is not None:
+                        status["plc_gate"] = self.plc_gate.status(time.monotonic())
+                    if self.aggregator is not None:
+                        status["aggregator"] = self.aggregator.stats()
+                        self.aggregator.health(status)
+                    if self.control_state is not None:
+                        self.control_state.set_status(status)
+
+                tracer.complete("status", status_start, None, "loop")
+                tracer.complete("frame", frame_start, None, "loop", {"frame": self.cnt_frame})
+
+                if not self.headless and cv2.waitKey(1) & 0xFF == ord('q'):  # If 'q' key is pressed
                     logger.info("Keyboard interrupt received. Exiting...")
                     break
-                new_frame_time = time.time()
-                self.fps_for_frame = 1/(new_frame_time-prev_frame_time) 
-                # prev_frame_time = new_frame_time
 
         except Exception as e:
             logger.error(f"Error in main processing loop: {e}")
             logger.error(traceback.format_exc())
 
         finally:
-            if self.video_writer is not None:
-                self.video_writer.release()
-            plc.write_bit(4106, 200)
-            cv2.destroyAllWindows()
-            sys.exit(0)
+            self.close_video()
+            if self.recording_process is not None:
+                self.recording_process.stop()
+            for thread in self.camera_threads:
+                thread.stop()
+            if self.control_server is not None:
+                self.control_server.stop()
+            if self.preview_server is not None:
+                self.preview_server.stop()
+            if self.snapshots is not None:
+                self.snapshots.stop()  # Before the index: every linked snapshot is written
+            if self.compactor is not None:
+                self.compactor.stop()
+            if self.plc_gate is not None:
+                self.plc_gate.stop()
+            self.segment_index.stop()
+            self.event_spool.stop()
+            if self.aggregator is not None:
+                self.aggregator.stop()
+            if self.score_store is not None:
+                self.score_store.stop()
+            if self.publisher is not None:
+                self.publisher.stop()
+            self.write_plc(4106, 200)
+            self.plc_writer.stop()  # Writes the final value before returning
+            if not self.headless:
+                cv2.destroyAllWindows()
+
+    def stop(self):
+        """Ask the processing loop to finish; `process()` then shuts everything down and returns."""
+        self.running = False
+
+def connect_plc(port):
+    from plc import PLC  # Imported here so opening the serial port stays off the startup path
+    plc = PLC(port)
+    if not plc.isPLCConnectecd:
+        raise RuntimeError("Could not connect to the PLC")
+    return plc
+
+def connect_database():
+    import database  # Imported here so psycopg2 stays off the startup path
+    database.initialize_database()
+    return database
 
 def load_config():
     """Load storage limit from the storage_limit.json file."""
@@ -469,8 +929,11 @@ def load_config():
         return mes_score, fps, video_duration, stable_threshold, motion_blur 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Needed by the capture/recording processes in the frozen build
     # check_and_create_files() only use if you need to create files inside data folder
     mes_score, fps, video_duration, stable_threshold, motion_blur = load_config()
     ic(mes_score, fps, video_duration, stable_threshold, motion_blur)
     video_processor = VideoProcessor(mes_score, fps, video_duration, stable_threshold, motion_blur)
+    install_signal_handlers()  # SIGUSR1 toggles tracing, SIGUSR2 dumps it
     video_processor.process()
+    sys.exit(0)
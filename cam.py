@@ -3,8 +3,11 @@ import time
 import threading
 import numpy as np
 from logging_config import logger
+from tracing import tracer
 import json
 import traceback
+import zlib
+from collections import namedtuple
 
 thread_count_lock = threading.Lock()
 lock = threading.Lock()
@@ -24,36 +27,102 @@ text_y = (error_image.shape[0] + text_size[1]) // 2
 # Put the text on the image
 cv2.putText(error_image, text, (text_x, text_y), font, font_scale, text_color, font_thickness, cv2.LINE_AA)
 
+# Latest frame, its fingerprint (None while disconnected), the monotonic time the source last made
+# progress and the frame's stream position in milliseconds (None if the source has none)
+FrameInfo = namedtuple("FrameInfo", ["frame", "fingerprint", "changed_at", "position"])
+
+
+def frame_fingerprint(frame, grid=(36, 64)):
+    """
+    Cheap identity of a decoded frame: CRC32 of a sparse grid of pixels
+    (about 30 µs at 1080p). An equal fingerprint means the same picture.
+    """
+    height, width = frame.shape[:2]
+    sample = frame[::max(1, height // grid[0]), ::max(1, width // grid[1])]
+    return zlib.crc32(np.ascontiguousarray(sample))
+
+
+def stream_position(capture):
+    """Position of the last grabbed frame in the stream (ms), or None if the backend does not report one."""
+    position = capture.get(cv2.CAP_PROP_POS_MSEC)
+    return position if position > 0 else None
+
+
+def next_frame_info(frame, previous, position=None):
+    """
+    FrameInfo for a newly captured `frame`. The source made progress if the
+    picture changed or its stream position moved on: an encoder watching a
+    still scene can send pixel-identical frames, but their timestamps still
+    advance. Without progress `changed_at` carries over.
+    """
+    if frame is error_image:
+        return FrameInfo(frame, None, previous.changed_at, None)
+    fingerprint = frame_fingerprint(frame)
+    progressed = fingerprint != previous.fingerprint or (position is not None and position != previous.position)
+    return FrameInfo(frame, fingerprint, time.monotonic() if progressed else previous.changed_at, position)
+
 
 class CamConnect:
+    """
+    Keeps one camera (or video file) open and its latest frame in `frame`.
+
+    A single grab thread reads frames for the lifetime of the object. When a
+    read fails it releases the old capture and reopens the source every
+    `RECONNECTION_PERIOD` seconds until it succeeds or `stop()` is called, so
+    reconnects never add threads or leave capture handles open.
+
+    Each frame is fingerprinted as it is grabbed; `info` holds the frame,
+    its fingerprint, its stream position and when the source last made
+    progress, so readers can skip repeated frames and spot a source that is
+    connected but frozen.
+    """
+
     def __init__(self, cam_address):
         self.cam_address = cam_address
         self.capture = None
         self.RECONNECTION_PERIOD = 0.5
-        self.reconnect_camera()
         self.frame = error_image
-        self.grab_thread = None
+        self.info = FrameInfo(error_image, None, time.monotonic(), None)
+        self.running = True
+        self.reconnects = 0
+        self.repeated_frames = 0
+        self.reconnect_camera()
+        self.grab_thread = threading.Thread(target=self.grab_frame, daemon=True)
+        self.grab_thread.start()
 
     def grab_frame(self):
-        while True:
-            ret, self.frame = self.capture.read()
-            if ret is False:
+        while self.running:
+            if self.capture is None:
+                time.sleep(self.RECONNECTION_PERIOD)
                 self.reconnect_camera()
+                continue
+            start = tracer.begin()
+            ret, frame = self.capture.read()
+            tracer.complete("capture.read", start, None, "capture")
+            if ret is False:
                 self.frame = error_image
-                break
+                self.info = next_frame_info(error_image, self.info)
+                self.release()
+                self.reconnects += 1
+                self.reconnect_camera()
+                continue
+            info = next_frame_info(frame, self.info, stream_position(self.capture))
+            if info.changed_at == self.info.changed_at:
+                self.repeated_frames += 1
+            self.frame, self.info = frame, info
             time.sleep(0.01)
+        self.release()
 
     def reconnect_camera(self):
         attempts = 0
-        while attempts < 3:  # Limit reconnection attempts
+        while attempts < 3 and self.running:  # Limit reconnection attempts; grab_frame retries later
             try:
                 self.capture = cv2.VideoCapture(self.cam_address)
                 if not self.capture.isOpened():
+                    self.release()
                     raise Exception(f"Could not connect to a camera: {self.cam_address}")
 
                 logger.info(f"Connected to camera: {self.cam_address}")
-                self.grab_thread = threading.Thread(target=self.grab_frame, daemon=True)
-                self.grab_thread.start()
                 break
             except Exception as e:
                 logger.error(f"Error in reconnect_camera: {e}")
@@ -64,9 +133,19 @@ class CamConnect:
     def read(self):
         return self.frame
 
+    def read_info(self):
+        return self.info
+
     def release(self):
         if self.capture is not None:
             self.capture.release()
+            self.capture = None
+
+    def stop(self):
+        """Stop the grab thread; it releases the capture on its way out."""
+        self.running = False
+        if self.grab_thread is not None and self.grab_thread is not threading.current_thread():
+            self.grab_thread.join(timeout=5)
 
 
 class CameraThread(threading.Thread):
@@ -75,24 +154,40 @@ class CameraThread(threading.Thread):
         self.cam_serial_num = camera_serial_number
         self.rtsp_url = rtsp_link
         self.frame = error_image
+        self.info = FrameInfo(error_image, None, time.monotonic(), None)
         self.running = True
         self.frame_dict = frame_dictionary
+        self.connection = None
 
     def run(self):
+        cap = None
         try:
-            cap = CamConnect(self.rtsp_url)
+            cap = self.connection = CamConnect(self.rtsp_url)
             while self.running:
-                frame = cap.read()
+                info = cap.read_info()
                 with lock:
-                    self.frame_dict[self.cam_serial_num] = frame
-                self.frame = frame
+                    self.frame_dict[self.cam_serial_num] = info.frame
+                self.frame, self.info = info.frame, info
                 time.sleep(0.01)
         except Exception as e:
             logger.error(f"Error in CameraThread run(): {e}")
             logger.error(traceback.format_exc())
+        finally:
+            if cap is not None:
+                cap.stop()
+
+    def read(self):
+        with lock:
+            return self.frame_dict.get(self.cam_serial_num, error_image)
+
+    def read_info(self):
+        """The latest FrameInfo; same frame as `read()` plus its capture-time fingerprint."""
+        return self.info
 
     def stop(self):
         self.running = False
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(timeout=5)
 
 
 def load_camera_config():
@@ -111,6 +206,9 @@ def load_camera_config():
 
 
 if __name__ == "__main__":
+    from config_loader import load_config_section
+    from mosaic import Mosaic, DEFAULT_MOSAIC_CONFIG
+
     frame_dict = {}
     camera_threads = []
 
@@ -121,16 +219,21 @@ if __name__ == "__main__":
             thread = CameraThread(cam_serial_num, rtsp_path, frame_dict)
             camera_threads.append(thread)
             thread.start()
-            cv2.namedWindow(f'Camera {thread.cam_serial_num} Feed', cv2.WINDOW_NORMAL)
         except Exception as e:
             logger.error(f"Error starting camera thread for {cam_serial_num}: {e}")
             logger.error(traceback.format_exc())
 
+    # One window for all cameras; tiles are redrawn only when their camera has a new frame
+    mosaic = Mosaic.from_config([thread.cam_serial_num for thread in camera_threads],
+                                load_config_section('mosaic', DEFAULT_MOSAIC_CONFIG))
+    cv2.namedWindow('Camera Feeds', cv2.WINDOW_NORMAL)
     while True:
         for thread in camera_threads:
             latest_frame = frame_dict.get(thread.cam_serial_num, error_image)
             with lock:
-                cv2.imshow(f'Camera {thread.cam_serial_num} Feed', latest_frame)
+                mosaic.update(thread.cam_serial_num, latest_frame,
+                              "DISCONNECTED" if latest_frame is error_image else "LIVE")
+        cv2.imshow('Camera Feeds', mosaic.canvas)
 
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
@@ -0,0 +1,288 @@
+import argparse
+import cv2
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from logging_config import logger, child_log_queue, log_to_queue
+from recording import open_writer
+
+DEFAULT_COMPACTOR_CONFIG = {
+    "enabled": False,
+    "root": "results/videos",
+    "older_than_days": 7,      # Segments modified longer ago than this are compacted
+    "max_width": 960,          # Compacted resolution; segments already this small are left alone
+    "codec": "XVID",
+    "quality": 60,
+    "cpu_threshold": 50.0,     # Start new jobs only while the app uses less than this % of the CPUs
+    "check_interval": 30.0,    # Seconds between load checks
+    "workers": 1,
+    "nice": 10,                # Priority decrease of the worker processes
+}
+
+VIDEO_EXTENSIONS = (".avi", ".mp4", ".mkv")
+
+# spawn on every platform: forking a process that already runs camera threads is unsafe
+context = multiprocessing.get_context("spawn")
+
+
+def lower_priority(nice, log_queue=None):
+    """Pool initializer: run the workers below the frame loop's priority and log through the parent."""
+    log_to_queue(log_queue)
+    try:
+        if hasattr(os, "nice"):
+            os.nice(nice)
+        else:
+            import psutil  # Windows has no nice(); psutil is optional there
+            psutil.Process().nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+    except Exception as e:
+        logger.warning(f"Could not lower compactor worker priority: {e}")
+
+
+def compact_segment(path, max_width, codec, quality):
+    """
+    Transcode one segment to at most `max_width` at the same frame rate and
+    frame count, verify the result and atomically replace the original.
+    Returns a result dict; "status" is "compacted", "skipped" or "failed".
+    """
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.compacting{ext}"
+    capture = cv2.VideoCapture(path)
+    writer = None
+    try:
+        if not capture.isOpened():
+            return {"path": path, "status": "failed", "reason": "cannot open"}
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = capture.get(cv2.CAP_PROP_FPS) or 1.0
+        if width <= max_width:
+            return {"path": path, "status": "skipped", "reason": f"already {width}x{height}"}
+        # Most codecs need even dimensions
+        size = (max_width // 2 * 2, max(2, int(height * max_width / width) // 2 * 2))
+        writer = open_writer(tmp_path, codec, fps, size, quality)
+        frames = 0
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            writer.write(cv2.resize(frame, size, interpolation=cv2.INTER_AREA))
+            frames += 1
+        writer.release()
+        writer = None
+        capture.release()
+
+        # Verify before replacing: every frame must be readable back at the new size
+        check = cv2.VideoCapture(tmp_path)
+        try:
+            readable = 0
+            while check.grab():
+                readable += 1
+            check_size = (int(check.get(cv2.CAP_PROP_FRAME_WIDTH)), int(check.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        finally:
+            check.release()
+        before, after = os.path.getsize(path), os.path.getsize(tmp_path)
+        if frames == 0 or readable != frames or check_size != size:
+            os.remove(tmp_path)
+            return {"path": path, "status": "failed", "reason": f"verification failed ({readable}/{frames} frames)"}
+        if after >= before:
+            os.remove(tmp_path)
+            return {"path": path, "status": "skipped", "reason": "output not smaller"}
+        original = os.stat(path)
+        os.utime(tmp_path, ns=(original.st_atime_ns, original.st_mtime_ns))  # Age-based retention and search keep working
+        os.replace(tmp_path, path)
+        return {"path": path, "status": "compacted", "frames": frames, "fps": fps, "before": before, "after": after}
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return {"path": path, "status": "failed", "reason": str(e), "traceback": traceback.format_exc()}
+    finally:
+        if writer is not None:
+            writer.release()
+        capture.release()
+
+
+def find_candidates(root, older_than_days, skip=()):
+    """Segments under `root` last modified more than `older_than_days` ago, oldest first."""
+    cutoff = time.time() - older_than_days * 86400
+    candidates = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if not name.lower().endswith(VIDEO_EXTENSIONS) or ".compacting" in name:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if mtime < cutoff and path not in skip:
+                candidates.append((mtime, path))
+    return [path for _, path in sorted(candidates)]
+
+
+class CpuMeter:
+    """Share of all CPUs this process (the frame loop and its threads) used since the last call."""
+
+    def __init__(self):
+        self.cpus = os.cpu_count() or 1
+        self.last = (time.monotonic(), time.process_time())
+
+    def percent(self):
+        now = (time.monotonic(), time.process_time())
+        wall, cpu = now[0] - self.last[0], now[1] - self.last[1]
+        self.last = now
+        return 100.0 * cpu / (wall * self.cpus) if wall > 0 else 0.0
+
+
+class Compactor:
+    """
+    Background compaction of old recordings.
+
+    A scheduler thread checks the app's own CPU use every `check_interval`
+    seconds and, only while it is below `cpu_threshold`, hands the oldest
+    segments past `older_than_days` to a pool of low-priority worker
+    processes. A worker transcodes the segment to `max_width` at the same
+    frame rate and frame count, reads the result back to verify it and
+    replaces the original with an atomic rename. The segment index is then
+    refreshed (keyframe offsets change); event frame numbers stay valid
+    because no frames are dropped.
+
+    Parameters:
+    ----------
+    root : str
+        Directory holding the recorded segments.
+    segment_index : SegmentIndex or None
+        Index to refresh after each compacted segment.
+    older_than_days, max_width, codec, quality, cpu_threshold, check_interval, workers, nice
+        See DEFAULT_COMPACTOR_CONFIG.
+    """
+
+    def __init__(self, root, segment_index=None, older_than_days=7, max_width=960, codec="XVID", quality=60,
+                 cpu_threshold=50.0, check_interval=30.0, workers=1, nice=10):
+        self.root = root
+        self.segment_index = segment_index
+        self.older_than_days = older_than_days
+        self.max_width = max_width
+        self.codec = codec
+        self.quality = quality
+        self.cpu_threshold = cpu_threshold
+        self.check_interval = check_interval
+        self.workers = workers
+        self.nice = nice
+        self.pool = None
+        self.in_flight = {}
+        self.done = set()  # Skipped or failed this session; not retried until restart
+        self.meter = CpuMeter()
+        self.stop_event = threading.Event()
+        self.stats = {"compacted": 0, "skipped": 0, "failed": 0, "bytes_saved": 0, "deferred_checks": 0, "cpu_percent": 0.0}
+        self.thread = threading.Thread(target=self.run, name="compactor", daemon=True)
+
+    @classmethod
+    def from_config(cls, config, segment_index=None):
+        return cls(config["root"], segment_index, config["older_than_days"], config["max_width"], config["codec"],
+                   config["quality"], config["cpu_threshold"], config["check_interval"], config["workers"], config["nice"])
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stop_event.wait(self.check_interval):
+            try:
+                self.collect()
+                cpu = self.stats["cpu_percent"] = round(self.meter.percent(), 1)
+                if cpu >= self.cpu_threshold:
+                    self.stats["deferred_checks"] += 1
+                    continue
+                free = self.workers - len(self.in_flight)
+                if free <= 0:
+                    continue
+                candidates = find_candidates(self.root, self.older_than_days, self.done | set(self.in_flight))
+                for path in candidates[:free]:
+                    if self.pool is None:
+                        self.pool = context.Pool(self.workers, initializer=lower_priority,
+                                                 initargs=(self.nice, child_log_queue(context)))
+                    self.in_flight[path] = self.pool.apply_async(compact_segment, (path, self.max_width, self.codec, self.quality))
+                if not candidates and not self.in_flight and self.pool is not None:
+                    # Nothing left to do: give the memory of the idle workers back
+                    self.pool.close()
+                    self.pool = None
+            except Exception as e:
+                logger.error(f"Error in compactor: {e}")
+                logger.error(traceback.format_exc())
+
+    def collect(self):
+        for path, job in list(self.in_flight.items()):
+            if not job.ready():
+                continue
+            del self.in_flight[path]
+            try:
+                result = job.get()
+            except Exception as e:
+                result = {"path": path, "status": "failed", "reason": str(e)}
+            self.handle_result(result)
+
+    def handle_result(self, result):
+        status, path = result["status"], result["path"]
+        self.stats[status] += 1
+        if status == "compacted":
+            self.stats["bytes_saved"] += result["before"] - result["after"]
+            logger.info(f"Compacted {path}: {result['before'] / 1e6:.1f} MB -> {result['after'] / 1e6:.1f} MB")
+            if self.segment_index is not None:
+                self.segment_index.update_segment(path, result["frames"], result["fps"])
+        else:
+            self.done.add(path)
+            log = logger.error if status == "failed" else logger.info
+            log(f"Compactor {status} {path}: {result.get('reason')}")
+            if "traceback" in result:
+                logger.error(result["traceback"])
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join(timeout=5)
+        if self.pool is not None:
+            self.pool.terminate()  # An interrupted job leaves only its .compacting temp file
+            self.pool.join()
+            self.pool = None
+        for path in self.in_flight:
+            root, ext = os.path.splitext(path)
+            if os.path.exists(f"{root}.compacting{ext}"):
+                os.remove(f"{root}.compacting{ext}")
+        self.in_flight.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact old recordings now, without waiting for idle time.")
+    parser.add_argument("--root", default=DEFAULT_COMPACTOR_CONFIG["root"])
+    parser.add_argument("--older-than-days", type=float, default=DEFAULT_COMPACTOR_CONFIG["older_than_days"])
+    parser.add_argument("--max-width", type=int, default=DEFAULT_COMPACTOR_CONFIG["max_width"])
+    parser.add_argument("--codec", default=DEFAULT_COMPACTOR_CONFIG["codec"])
+    parser.add_argument("--quality", type=int, default=DEFAULT_COMPACTOR_CONFIG["quality"])
+    parser.add_argument("--workers", type=int, default=DEFAULT_COMPACTOR_CONFIG["workers"])
+    parser.add_argument("--index", default="results/index.db", help="Segment index to refresh ('' to skip)")
+    args = parser.parse_args()
+
+    from segment_index import SegmentIndex
+    index = SegmentIndex(args.index) if args.index else None
+    compactor = Compactor(args.root, index, args.older_than_days, args.max_width, args.codec, args.quality,
+                          workers=args.workers)
+    candidates = find_candidates(args.root, args.older_than_days)
+    print(f"{len(candidates)} segment(s) older than {args.older_than_days:g} days under {args.root}")
+    with context.Pool(args.workers, initializer=lower_priority,
+                      initargs=(DEFAULT_COMPACTOR_CONFIG["nice"], child_log_queue(context))) as pool:
+        for result in pool.imap_unordered(compact_segment_args, [(path, args.max_width, args.codec, args.quality) for path in candidates]):
+            compactor.handle_result(result)
+            print(f"{result['status']:>9} {result['path']}" + (f" ({result.get('reason')})" if result.get("reason") else ""))
+    if index is not None:
+        index.stop()
+    stats = compactor.stats
+    print(f"Compacted {stats['compacted']}, skipped {stats['skipped']}, failed {stats['failed']}, "
+          f"saved {stats['bytes_saved'] / 1e9:.2f} GB")
+
+
+def compact_segment_args(args):
+    return compact_segment(*args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import json
+from logging_config import logger
+
+CONFIG_PATH = 'data/config.json'
+
+
+def load_config_section(section, defaults):
+    """
+    Load one section of config.json, e.g. {"publisher": {...}}.
+
+    Keys missing from the file fall back to `defaults`, and the defaults are
+    returned unchanged if the file cannot be read.
+    """
+    values = dict(defaults)
+    try:
+        with open(CONFIG_PATH, 'r') as file:
+            config_data = json.load(file)
+        values.update(config_data.get(section, {}))
+    except Exception as e:
+        logger.error(f"Error loading '{section}' settings from JSON: {e}")
+    return values
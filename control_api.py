@@ -0,0 +1,254 @@
+import json
+import math
+import os
+import queue
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging_config import logger
+from tracing import tracer
+
+DEFAULT_CONTROL_API_CONFIG = {
+    "enabled": True,
+    "host": "127.0.0.1",  # Local only; set "0.0.0.0" so Recorder_PC/roi_manager.py can reach it
+    "port": 12345,  # Port Recorder_PC/roi_manager.py talks to
+}
+
+RECORDING_MODES = ("continuous", "off")
+
+
+def validate_roi(roi, frame_size=None):
+    """
+    Return a clean ROI dict or raise ValueError.
+
+    With `frame_size` (width, height) the ROI must also lie inside the frame.
+    """
+    if not isinstance(roi, dict):
+        raise ValueError("'roi' must be an object with x, y, width and height")
+    clean = {}
+    for key in ("x", "y", "width", "height"):
+        value = roi.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value != int(value):
+            raise ValueError(f"ROI '{key}' must be an integer")
+        clean[key] = int(value)
+    if clean["x"] < 0 or clean["y"] < 0:
+        raise ValueError("ROI x and y must not be negative")
+    if clean["width"] <= 0 or clean["height"] <= 0:
+        raise ValueError("ROI width and height must be positive")
+    if frame_size is not None:
+        width, height = frame_size
+        if clean["x"] + clean["width"] > width or clean["y"] + clean["height"] > height:
+            raise ValueError(f"ROI must lie inside the {width}x{height} frame")
+    return clean
+
+
+def validate_settings(data):
+    """Return the recognised, validated settings from `data` or raise ValueError."""
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    clean = {}
+    for key in ("mes_score", "stable_threshold", "fps"):
+        if key not in data:
+            continue
+        value = data[key]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"'{key}' must be a finite number")
+        clean[key] = value
+    if clean.get("mes_score", 1) <= 0:
+        raise ValueError("'mes_score' must be positive")
+    if clean.get("stable_threshold", 0) < 0:
+        raise ValueError("'stable_threshold' must not be negative")
+    if not 1 <= clean.get("fps", 1) <= 120:
+        raise ValueError("'fps' must be between 1 and 120")
+    if "recording_mode" in data:
+        if data["recording_mode"] not in RECORDING_MODES:
+            raise ValueError(f"'recording_mode' must be one of {RECORDING_MODES}")
+        clean["recording_mode"] = data["recording_mode"]
+    if not clean:
+        raise ValueError("No recognised settings in request")
+    return clean
+
+
+def write_json_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(data, file, indent=4)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+class ConfigPersister:
+    """
+    Writes accepted updates to data/roi.json and data/config.json on a
+    background thread, so the HTTP handlers and the frame loop never wait on
+    disk. Files are replaced atomically and unrelated keys are preserved.
+    """
+
+    def __init__(self, roi_path='data/roi.json', config_path='data/config.json'):
+        self.roi_path = roi_path
+        self.config_path = config_path
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="config-persister", daemon=True)
+        self.thread.start()
+
+    def save(self, updates):
+        self.jobs.put(dict(updates))
+
+    def run(self):
+        while True:
+            updates = self.jobs.get()
+            if updates is None:
+                break
+            try:
+                if "roi" in updates:
+                    write_json_atomic(self.roi_path, {"roi": updates["roi"]})
+                settings = {key: value for key, value in updates.items() if key != "roi"}
+                if settings:
+                    with open(self.config_path, 'r') as file:
+                        config_data = json.load(file)
+                    if "recording_mode" in settings:
+                        config_data.setdefault("recording", {})["mode"] = settings.pop("recording_mode")
+                    config_data.update(settings)
+                    write_json_atomic(self.config_path, config_data)
+                logger.info(f"Persisted control updates: {sorted(updates)}")
+            except Exception as e:
+                logger.error(f"Error persisting control updates: {e}")
+                logger.error(traceback.format_exc())
+
+    def stop(self):
+        self.jobs.put(None)
+        self.thread.join(timeout=5)
+
+
+class ControlState:
+    """
+    Mailbox between the HTTP handler threads and the frame loop.
+
+    Handlers merge validated updates into `pending`; the frame loop collects
+    them with `take_pending()` between frames and applies them all at once.
+    The frame loop also reports the camera frame size, which new ROIs are
+    checked against.
+    """
+
+    def __init__(self, roi, settings):
+        self.lock = threading.Lock()
+        self.current = {"roi": roi, **settings}
+        self.pending = {}
+        self.status = {}
+        self.frame_size = None  # (width, height) of the live camera, once known
+
+    def submit(self, updates):
+        with self.lock:
+            self.pending.update(updates)
+            self.current.update(updates)
+            return dict(self.current)
+
+    def take_pending(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return pending
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.current)
+
+    def set_status(self, status):
+        self.status = status
+
+    def set_frame_size(self, width, height):
+        self.frame_size = (width, height)
+
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        state = self.server.state
+        if self.path == "/get_roi":
+            self.reply(200, {"roi": state.snapshot()["roi"]})
+        elif self.path == "/get_config":
+            settings = state.snapshot()
+            settings.pop("roi")
+            self.reply(200, settings)
+        elif self.path == "/status":
+            self.reply(200, state.status)
+        elif self.path == "/trace":
+            self.reply(200, tracer.chrome_trace())  # Open the saved response in chrome://tracing or Perfetto
+        else:
+            self.reply(404, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        try:
+            body = self.read_json()
+            if self.path == "/update_roi":
+                updates = {"roi": validate_roi(body.get("roi") if isinstance(body, dict) else None,
+                                               self.server.state.frame_size)}
+            elif self.path == "/update_config":
+                updates = validate_settings(body)
+            elif self.path in ("/trace", "/trace/dump"):
+                self.handle_trace(body)
+                return
+            else:
+                self.reply(404, {"error": f"Unknown endpoint {self.path}"})
+                return
+        except (ValueError, OverflowError) as e:
+            self.reply(400, {"error": str(e)})
+            return
+
+        current = self.server.state.submit(updates)
+        self.server.persister.save(updates)
+        logger.info(f"Control update accepted: {updates}")
+        self.reply(200, {"status": "ok", **current})
+
+    def handle_trace(self, body):
+        """POST /trace {"enabled": bool} switches tracing; POST /trace/dump writes the buffer to a file."""
+        if self.path == "/trace/dump":
+            self.reply(200, {"path": tracer.dump(), **tracer.stats()})
+            return
+        enabled = body.get("enabled") if isinstance(body, dict) else None
+        if not isinstance(enabled, bool):
+            raise ValueError("'enabled' must be true or false")
+        tracer.enabled = enabled
+        logger.info(f"Tracing {'enabled' if enabled else 'disabled'} through the control API.")
+        self.reply(200, tracer.stats())
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+
+    def reply(self, code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info(f"Control API {self.address_string()} - {format % args}")
+
+
+class ControlServer:
+    """Embedded HTTP control API served from a daemon thread."""
+
+    def __init__(self, state, host="127.0.0.1", port=12345):
+        self.state = state
+        self.persister = ConfigPersister()
+        self.httpd = ThreadingHTTPServer((host, port), ControlRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = state
+        self.httpd.persister = self.persister
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="control-api", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        host, port = self.httpd.server_address[:2]
+        logger.info(f"Control API listening on {host}:{port}")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.persister.stop()
@@ -1,7 +1,9 @@
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 from datetime import datetime
 from logging_config import logger
+from tracing import traced
 import os
 import traceback
 
@@ -9,6 +11,8 @@ import traceback
 DB_NAME = "deevia_vms"
 TABLE_NAME = "vms"
 COLUMN_NAME = "vibration_stopped_date_time"
+KEY_COLUMN_NAME = "event_key"  # Idempotency key of events replayed from the local spool
+SNAPSHOT_COLUMN_NAME = "snapshot_path"  # JPEG snapshot of the event (snapshots.py)
 DB_USER = "postgres"    # Replace with your PostgreSQL username
 DB_PASSWORD = "root"  # Replace with your PostgreSQL password
 DB_HOST = "localhost"  # Adjust if your PostgreSQL is hosted elsewhere
@@ -38,9 +42,11 @@ def create_db_if_not_exists():
 
         cursor.close()
         conn.close()
+        return True
     except Exception as e:
         logger.error(f"Error creating database: {e}")
         logger.error(traceback.format_exc())
+        return False
 
 # Function to create table if it does not exist
 def create_table_if_not_exists():
@@ -64,17 +70,28 @@ def create_table_if_not_exists():
         """).format(sql.Identifier(TABLE_NAME), sql.Identifier(COLUMN_NAME))
 
         cursor.execute(create_table_query)
+
+        # Migration: tables created before the event spool have no key column
+        cursor.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS {} TEXT;").format(
+            sql.Identifier(TABLE_NAME), sql.Identifier(KEY_COLUMN_NAME)))
+        cursor.execute(sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({});").format(
+            sql.Identifier(f"{TABLE_NAME}_{KEY_COLUMN_NAME}"), sql.Identifier(TABLE_NAME), sql.Identifier(KEY_COLUMN_NAME)))
+        cursor.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS {} TEXT;").format(
+            sql.Identifier(TABLE_NAME), sql.Identifier(SNAPSHOT_COLUMN_NAME)))
         conn.commit()
         logger.info(f"Table '{TABLE_NAME}' is ready.")
         print(f"Table '{TABLE_NAME}' is ready.")
         
         cursor.close()
         conn.close()
+        return True
     except Exception as e:
         logger.error(f"Error creating table: {e}")
         logger.error(traceback.format_exc())
+        return False
 
 # Function to store the current time into the database
+@traced("db.store_time", "db")
 def store_vibration_stopped_time():
     try:
         # Get the current time in string format
@@ -107,6 +124,49 @@ def store_vibration_stopped_time():
         logger.error(f"Error storing time: {e}")
         logger.error(traceback.format_exc())
 
+# Function to bulk insert events replayed from the local event spool
+@traced("db.store_events", "db")
+def store_spooled_events(records):
+    """
+    Insert spooled events in one statement. Events whose key is already in
+    the table are skipped, so replaying a batch twice is harmless. Raises on
+    any database error so the spool keeps the records.
+    """
+    rows = []
+    for record in records:
+        if record.get("kind") == "vibration_stopped":
+            rows.append((record["time"], record["key"], record.get("snapshot")))
+        else:
+            logger.warning(f"Ignoring spooled event of unknown kind '{record.get('kind')}'.")
+    if not rows:
+        return
+
+    conn = psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+        connect_timeout=5
+    )
+    try:
+        with conn, conn.cursor() as cursor:
+            insert_query = sql.SQL("""
+                INSERT INTO {} ({}, {}, {})
+                VALUES %s
+                ON CONFLICT ({}) DO NOTHING;
+            """).format(sql.Identifier(TABLE_NAME), sql.Identifier(COLUMN_NAME), sql.Identifier(KEY_COLUMN_NAME),
+                         sql.Identifier(SNAPSHOT_COLUMN_NAME), sql.Identifier(KEY_COLUMN_NAME))
+            execute_values(cursor, insert_query, rows)
+            logger.info(f"Stored {cursor.rowcount} of {len(rows)} spooled vibration stopped times in the database.")
+    finally:
+        conn.close()
+
+def initialize_database():
+    """Create the database and table if needed. Raises if PostgreSQL cannot be reached."""
+    if not (create_db_if_not_exists() and create_table_if_not_exists()):
+        raise RuntimeError(f"Database '{DB_NAME}' on {DB_HOST}:{DB_PORT} is not available")
+
 # Main function to set up the database and store time
 if __name__ == "__main__":
     try:
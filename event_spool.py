@@ -0,0 +1,216 @@
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from logging_config import logger
+
+DEFAULT_EVENT_SPOOL_CONFIG = {
+    "path": "results/spool/events.spool",
+    "fsync_interval": 0.5,     # Seconds of appends batched into one fsync
+    "replay_interval": 5.0,    # Seconds between attempts to drain the spool into the database
+    "batch_size": 500,         # Records per bulk insert
+}
+
+
+class EventSpool:
+    """
+    Append-only local spool for events bound for the database.
+
+    `append()` only queues the record, so it costs microseconds on the frame
+    thread whatever the state of the database. A writer thread appends queued
+    records to the spool file as JSON lines and fsyncs once per batch. A
+    replayer thread drains fsynced records to `sink(records)` in bulk and
+    records how far it got in `<path>.offset`; if `sink` raises, the records
+    stay in the spool and are retried later. Every record carries a unique
+    "key", so a replay after a crash cannot insert duplicates as long as the
+    sink ignores keys it already has.
+
+    Parameters:
+    ----------
+    path : str
+        Spool file.
+    sink : callable
+        Called with a list of record dicts; must raise if they were not stored.
+    fsync_interval : float, optional
+        Seconds of appends written per fsync (default is 0.5).
+    replay_interval : float, optional
+        Seconds between replay attempts (default is 5.0).
+    batch_size : int, optional
+        Maximum records per `sink` call (default is 500).
+    """
+
+    def __init__(self, path, sink, fsync_interval=0.5, replay_interval=5.0, batch_size=500):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.sink = sink
+        self.fsync_interval = fsync_interval
+        self.replay_interval = replay_interval
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.lock = threading.Lock()
+        self.file = open(path, "ab")
+        self.repair_tail()
+        self.durable_size = os.fstat(self.file.fileno()).st_size
+        self.offset = min(self.load_offset(), self.durable_size)
+        self.appended = 0
+        self.replayed = 0
+        self.failures = 0
+        self.jobs = queue.Queue()
+        self.running = True
+        self.wake = threading.Event()
+        self.writer = threading.Thread(target=self.run_writer, name="event-spool-writer", daemon=True)
+        self.replayer = threading.Thread(target=self.run_replayer, name="event-spool-replayer", daemon=True)
+        self.writer.start()
+        self.replayer.start()
+        if self.offset < self.durable_size:
+            logger.info(f"Event spool has {self.durable_size - self.offset} bytes of events waiting for the database.")
+
+    @classmethod
+    def from_config(cls, config, sink):
+        return cls(config["path"], sink, config["fsync_interval"], config["replay_interval"], config["batch_size"])
+
+    def append(self, kind, **fields):
+        """Queue an event and return its idempotency key."""
+        record = {"key": uuid.uuid4().hex, "kind": kind, "ts": time.time(), **fields}
+        self.jobs.put(record)
+        self.appended += 1
+        return record["key"]
+
+    def repair_tail(self):
+        """Cut off a record that was only partly written when the app last stopped."""
+        size = os.fstat(self.file.fileno()).st_size
+        if size == 0:
+            return
+        with open(self.path, "rb") as file:
+            file.seek(max(0, size - 65536))
+            tail = file.read()
+        if tail.endswith(b"\n"):
+            return
+        cut = size - len(tail) + tail.rfind(b"\n") + 1
+        logger.warning(f"Dropping {size - cut} bytes of incomplete event spool record.")
+        self.file.truncate(cut)
+
+    def load_offset(self):
+        try:
+            with open(self.offset_path, "r") as file:
+                return int(file.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logger.error(f"Error reading event spool offset, replaying from the start: {e}")
+            return 0
+
+    def save_offset(self, offset):
+        tmp_path = self.offset_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            file.write(str(offset))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.offset_path)
+
+    def run_writer(self):
+        stopping = False
+        while not stopping:
+            record = self.jobs.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.fsync_interval
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    record = self.jobs.get(timeout=max(0.0, remaining)) if remaining > 0 else self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            try:
+                data = b"".join(json.dumps(item).encode() + b"\n" for item in batch)
+                with self.lock:
+                    self.file.write(data)
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                    self.durable_size = os.fstat(self.file.fileno()).st_size
+                self.wake.set()
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} events to the spool: {e}")
+                logger.error(traceback.format_exc())
+
+    def run_replayer(self):
+        while self.running:
+            self.wake.wait(self.replay_interval)
+            self.wake.clear()
+            if self.running:
+                self.replay()
+
+    def read_batch(self, offset, end):
+        records = []
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            while offset < end and len(records) < self.batch_size:
+                line = file.readline()
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    logger.error(f"Skipping malformed event spool record: {e}")
+        return records, offset
+
+    def replay(self):
+        while True:
+            with self.lock:
+                end = self.durable_size
+            if self.offset >= end:
+                self.compact()
+                return
+            records, next_offset = self.read_batch(self.offset, end)
+            if records:
+                try:
+                    self.sink(records)
+                except Exception as e:
+                    self.failures += 1
+                    logger.error(f"Event spool replay failed, {end - self.offset} bytes kept for later: {e}")
+                    return
+            self.offset = next_offset
+            self.save_offset(self.offset)
+            self.replayed += len(records)
+            logger.info(f"Replayed {len(records)} spooled events to the database.")
+
+    def compact(self):
+        """Empty the spool once everything in it has been replayed."""
+        if self.offset == 0:
+            return
+        with self.lock:
+            if self.offset != self.durable_size:
+                return
+            # Offset first: a crash in between only replays events the sink already has
+            self.save_offset(0)
+            self.file.truncate(0)
+            self.durable_size = 0
+            self.offset = 0
+
+    def stats(self):
+        return {
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "pending_bytes": self.durable_size - self.offset,
+            "failures": self.failures,
+        }
+
+    def stop(self, flush=False):
+        """Stop both threads; with `flush`, first send what is spooled once more on the calling thread."""
+        self.jobs.put(None)
+        self.writer.join(timeout=5)
+        self.running = False
+        self.wake.set()
+        self.replayer.join(timeout=5)
+        if flush and not self.replayer.is_alive():
+            self.replay()  # Whatever the sink refuses stays in the spool for the next start
+        self.file.close()
@@ -1,6 +1,5 @@
 import os
 import json
-from PIL import Image
 
 # Default data for the files
 default_data = {
@@ -12,7 +11,138 @@ default_data = {
         "fps": 20,
         "video_duration": 180,
         "stable_threshold": 5,
-        "motion_blur": True
+        "motion_blur": True,
+        "publisher": {
+            "enabled": False,
+            "host": "192.168.0.58",
+            "port": 12345,
+            "quality": 80,
+            "width": 0,
+            "height": 0,
+            "fps": 10,
+            "workers": 2,
+            "reconnect_period": 2.0
+        },
+        "recording": {
+            "mode": "continuous",
+            "codec": "XVID",
+            "container": "avi",
+            "quality": 95,
+            "fps": 0,
+            "overview": {
+                "enabled": False,
+                "scale": 0.25,
+                "fps": 5,
+                "codec": "XVID",
+                "quality": 50
+            }
+        },
+        "control_api": {
+            "enabled": True,
+            "host": "127.0.0.1",
+            "port": 12345
+        },
+        "preview": {
+            "enabled": False,
+            "host": "0.0.0.0",
+            "port": 8080,
+            "fps": 5,
+            "max_width": 960,
+            "quality": 70
+        },
+        "score_store": {
+            "enabled": True,
+            "path": "results/scores",
+            "chunk_size": 1024,
+            "flush_interval": 10.0
+        },
+        "pipeline": {
+            "capture": "thread",
+            "recording": "thread",
+            "capture_slots": 3,
+            "recording_slots": 8,
+            "max_width": 1920,
+            "max_height": 1080
+        },
+        "event_spool": {
+            "path": "results/spool/events.spool",
+            "fsync_interval": 0.5,
+            "replay_interval": 5.0,
+            "batch_size": 500
+        },
+        "plc": {
+            "port": "COM7",
+            "refresh_interval": 5.0
+        },
+        "detector": {
+            "off_ratio": 0.8,
+            "debounce": 0.1,
+            "min_vibrating": 1.0,
+            "freeze_timeout": 5.0
+        },
+        "aggregator": {
+            "enabled": False,
+            "host": "127.0.0.1",
+            "port": 12400,
+            "node_id": "",
+            "spool_path": "results/spool/aggregator.spool",
+            "batch_size": 500,
+            "flush_interval": 2.0,
+            "health_interval": 60.0,
+            "timeout": 10.0
+        },
+        "snapshots": {
+            "enabled": True,
+            "path": "results/snapshots",
+            "width": 640,
+            "quality": 80,
+            "workers": 1,
+            "queue_size": 8
+        },
+        "compactor": {
+            "enabled": False,
+            "root": "results/videos",
+            "older_than_days": 7,
+            "max_width": 960,
+            "codec": "XVID",
+            "quality": 60,
+            "cpu_threshold": 50.0,
+            "check_interval": 30.0,
+            "workers": 1,
+            "nice": 10
+        },
+        "mosaic": {
+            "enabled": True,
+            "width": 1920,
+            "height": 1080,
+            "min_cameras": 2
+        },
+        "tracing": {
+            "enabled": False,
+            "capacity": 200000,
+            "path": "results/traces"
+        },
+        "adaptive_rate": {
+            "enabled": True,
+            "idle_fps": 3.0,
+            "margin": 0.5,
+            "calm_seconds": 10.0
+        },
+        "plc_gate": {
+            "enabled": False,
+            "poll_interval": 0.5,
+            "stale_after": 3.0,
+            "inputs": {
+                "door_open": 0,
+                "slab_status": 1,
+                "roller_status": 2
+            },
+            "rules": [
+                {"name": "door open", "when": {"door_open": 1}, "detection": "full", "recording": True},
+                {"name": "line idle", "when": {"slab_status": 0, "roller_status": 0}, "detection": "off", "recording": False},
+                {"name": "rollers stopped", "when": {"roller_status": 0}, "detection": "reduced", "recording": True}
+            ]
+        }
     },
     "roi.json": {
         "roi": {
@@ -29,6 +159,7 @@ default_data = {
 
 def create_placeholder_logo(path):
     # Create a blank white image as a placeholder for the logo
+    from PIL import Image  # Only needed on first setup, kept out of the app's startup imports
     img = Image.new('RGB', (100, 100), color='white')  # You can change size and color
     img.save(path)
     print(f"logo.png created as a placeholder.")
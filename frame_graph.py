@@ -0,0 +1,77 @@
+import time
+from tracing import tracer
+
+
+class FrameGraph:
+    """
+    Declarative graph of per-frame processing stages.
+
+    Each stage is a function of other stages or of per-frame sources (values
+    passed to `frame()` or set later with `FrameContext.set()`). Nothing runs
+    when a frame arrives: a stage is computed the first time a consumer asks
+    for it with `FrameContext.get()`, together with the stages it needs, and
+    the result is kept for the rest of that frame. A stage that no consumer
+    asks for never runs, so unused products cost nothing.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.runs = {}
+        self.seconds = {}
+        self.frames = 0
+
+    def stage(self, name, func, *inputs):
+        """Register `name` as `func(*inputs)`; inputs name stages or sources."""
+        if name in self.stages:
+            raise ValueError(f"Stage {name!r} is already defined")
+        self.stages[name] = (func, inputs)
+        self.runs[name] = 0
+        self.seconds[name] = 0.0
+
+    def frame(self, **sources):
+        """Start a frame with the given source values."""
+        self.frames += 1
+        return FrameContext(self, sources)
+
+    def stats(self):
+        """Per-stage run count, share of frames and average cost in milliseconds."""
+        return {
+            name: {
+                "runs": self.runs[name],
+                "per_frame": round(self.runs[name] / self.frames, 3) if self.frames else 0.0,
+                "avg_ms": round(self.seconds[name] / self.runs[name] * 1000, 3) if self.runs[name] else 0.0,
+            }
+            for name in self.stages
+        }
+
+
+class FrameContext:
+    """Stage values of one frame, computed on demand."""
+
+    def __init__(self, graph, sources):
+        self.graph = graph
+        self.values = dict(sources)
+        self.ran = []
+
+    def set(self, name, value):
+        """Provide a source that is only known part-way through the frame."""
+        if name in self.graph.stages:
+            raise ValueError(f"{name!r} is a stage, not a source")
+        self.values[name] = value
+
+    def get(self, name):
+        if name in self.values:
+            return self.values[name]
+        if name not in self.graph.stages:
+            raise KeyError(f"No stage or source named {name!r} in this frame")
+        func, inputs = self.graph.stages[name]
+        args = [self.get(item) for item in inputs]
+        start = time.perf_counter_ns()
+        value = func(*args)
+        end = time.perf_counter_ns()
+        self.graph.seconds[name] += (end - start) / 1e9
+        tracer.complete(name, start, end, "stage")
+        self.graph.runs[name] += 1
+        self.values[name] = value
+        self.ran.append(name)
+        return value
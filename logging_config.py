@@ -1,5 +1,5 @@
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 import os
 from datetime import datetime
 
@@ -19,6 +19,7 @@ def setup_logger():
         when="midnight",
         interval=1,
         backupCount=1,  # Keep 0 backup files (delete old logs)
+        delay=True,  # Opened on the first record, so a child process that logs through the parent never opens it
     )
 
     # Create a formatter that includes the filename
@@ -30,8 +31,66 @@ def setup_logger():
 
     return logger
 
+
+log_queue = None
+log_listener = None
+
+
+def child_log_queue(context):
+    """
+    Queue for child processes to log into (see `log_to_queue()`). A listener
+    thread hands their records to this process's handlers, so only one
+    process writes and rotates the log file.
+    """
+    global log_queue, log_listener
+    if log_queue is None:
+        log_queue = context.Queue()
+        log_listener = QueueListener(log_queue, *logging.getLogger().handlers, respect_handler_level=True)
+        log_listener.start()
+    return log_queue
+
+
+def log_to_queue(queue):
+    """Send this child process's log records to the parent through `queue` instead of its own handlers."""
+    if queue is None:
+        return
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(QueueHandler(queue))
+
+
+class LazyIc:
+    """
+    Stand-in for icecream's `ic` that only imports icecream when debugging
+    output is enabled, keeping it off the startup path.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.debugger = None
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def __call__(self, *args):
+        if self.enabled:
+            if self.debugger is None:
+                from icecream import ic as debugger
+                self.debugger = debugger
+            return self.debugger(*args)
+        if not args:
+            return None
+        return args[0] if len(args) == 1 else args
+
+
 # Use this logger in both server.py and main.py
 logger = setup_logger()
+ic = LazyIc()
 
 # Example usage in server.py:
 # logger.info("This is a log message from server.py")
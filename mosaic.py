@@ -0,0 +1,90 @@
+import cv2
+import math
+import numpy as np
+
+DEFAULT_MOSAIC_CONFIG = {
+    "enabled": True,
+    "width": 1920,        # Canvas size; tiles share it, so the cost does not grow with the camera count
+    "height": 1080,
+    "min_cameras": 2,     # With fewer cameras the single feed is shown as before
+}
+
+STATUS_COLORS = {
+    "STABLE": (0, 200, 0),
+    "SETTLING": (0, 165, 255),
+    "VIBRATING": (0, 0, 255),
+    "FROZEN": (255, 0, 255),
+    "DISCONNECTED": (128, 128, 128),
+    "LIVE": (200, 200, 200),
+}
+
+
+class Mosaic:
+    """
+    All cameras in one preallocated canvas.
+
+    The canvas is split into a near-square grid of equal tiles. `update()`
+    resizes a frame straight into its tile with `cv2.resize(dst=...)` and
+    redraws the tile's status label, but only when the camera delivered a
+    new frame object or its status changed, so cameras without new frames
+    cost nothing. Because the canvas size is fixed, the pixels written per
+    refresh stay the same whether it shows 1 or 9 cameras.
+
+    Parameters:
+    ----------
+    cameras : list of str
+        Camera names in tile order.
+    width, height : int, optional
+        Canvas size (default is 1920x1080).
+    """
+
+    def __init__(self, cameras, width=1920, height=1080):
+        self.cameras = list(cameras)
+        count = max(1, len(self.cameras))
+        self.columns = math.ceil(math.sqrt(count))
+        self.rows = math.ceil(count / self.columns)
+        self.tile_width = width // self.columns
+        self.tile_height = height // self.rows
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self.tiles = {}
+        for i, camera in enumerate(self.cameras):
+            row, column = divmod(i, self.columns)
+            y, x = row * self.tile_height, column * self.tile_width
+            self.tiles[camera] = self.canvas[y:y + self.tile_height, x:x + self.tile_width]
+        self.last_frames = dict.fromkeys(self.cameras)
+        self.last_status = dict.fromkeys(self.cameras)
+        self.updates = 0
+        self.skipped = 0
+
+    @classmethod
+    def from_config(cls, cameras, config):
+        return cls(cameras, config["width"], config["height"])
+
+    def update(self, camera, frame, status="LIVE"):
+        """Draw `frame` into the camera's tile if it is new; return True if the tile changed."""
+        tile = self.tiles.get(camera)
+        if tile is None or frame is None:
+            return False
+        if frame is self.last_frames[camera] and status == self.last_status[camera]:
+            self.skipped += 1
+            return False
+        self.last_frames[camera] = frame
+        self.last_status[camera] = status
+        # INTER_LINEAR samples per output pixel; INTER_AREA reads every input pixel and grows with the camera count
+        cv2.resize(frame, (self.tile_width, self.tile_height), dst=tile, interpolation=cv2.INTER_LINEAR)
+        self.draw_label(tile, camera, status)
+        self.updates += 1
+        return True
+
+    def draw_label(self, tile, camera, status):
+        color = STATUS_COLORS.get(status, STATUS_COLORS["LIVE"])
+        text = f"{camera}  {status}"
+        scale = max(0.4, min(0.8, self.tile_width / 800))
+        (text_width, text_height), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, 1)
+        cv2.rectangle(tile, (0, 0), (text_width + 12, text_height + 12), (0, 0, 0), -1)
+        cv2.putText(tile, text, (6, text_height + 6), cv2.FONT_HERSHEY_SIMPLEX, scale, color, 1, cv2.LINE_AA)
+        cv2.rectangle(tile, (0, 0), (tile.shape[1] - 1, tile.shape[0] - 1), color, 2)
+
+    def stats(self):
+        return {"cameras": len(self.cameras), "grid": f"{self.columns}x{self.rows}",
+                "tile_updates": self.updates, "tiles_skipped": self.skipped}
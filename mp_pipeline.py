@@ -0,0 +1,336 @@
+import cv2
+import multiprocessing
+import numpy as np
+import time
+import traceback
+from multiprocessing import shared_memory
+from logging_config import logger, child_log_queue, log_to_queue
+from config_loader import load_config_section
+
+DEFAULT_PIPELINE_CONFIG = {
+    "capture": "thread",     # "thread" or "process" (one capture process per camera)
+    "recording": "thread",   # "thread" or "process" (one process encodes every segment)
+    "capture_slots": 3,
+    "recording_slots": 8,    # Frames the recording process may fall behind before dropping
+    "max_width": 1920,       # Size of a ring slot; larger camera frames are scaled down to fit
+    "max_height": 1080,
+}
+
+STAGE_MODES = ("thread", "process")
+SLOT_FIELDS = 4  # seq, height, width, channels
+
+# spawn on every platform: forking a process that already runs camera threads is unsafe
+context = multiprocessing.get_context("spawn")
+
+
+def load_pipeline_config():
+    config = load_config_section('pipeline', DEFAULT_PIPELINE_CONFIG)
+    for stage in ("capture", "recording"):
+        if config[stage] not in STAGE_MODES:
+            logger.error(f"Invalid pipeline mode '{config[stage]}' for {stage}, using 'thread'.")
+            config[stage] = "thread"
+    return config
+
+
+class FrameRing:
+    """
+    Fixed ring of frame slots in shared memory, one writer and any number of readers.
+
+    Each slot carries a sequence number that the writer sets to -1 while it
+    copies a frame in and to the frame's sequence number afterwards. Readers
+    copy the pixels out and check the sequence number again, so a slot that
+    was overwritten mid-copy is detected instead of returning a torn frame.
+    Frames never pass through pickling; only slot sequence numbers do.
+
+    Parameters:
+    ----------
+    name : str or None
+        Name of an existing ring to attach to, or None when `create` is True.
+    slots : int
+        Number of frame slots.
+    max_shape : tuple
+        (height, width, channels) of the largest frame a slot holds.
+    create : bool, optional
+        Allocate a new shared memory block (default is False).
+    """
+
+    def __init__(self, name=None, slots=4, max_shape=(1080, 1920, 3), create=False):
+        self.slots = slots
+        self.max_shape = tuple(max_shape)
+        self.slot_bytes = int(np.prod(max_shape))
+        header_bytes = -(-8 * (1 + slots * SLOT_FIELDS + slots) // 64) * 64
+        if create:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + slots * self.slot_bytes)
+        else:
+            # Children share the creator's resource tracker, which unlinks the block if the app dies
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.counter = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf, offset=0)
+        self.meta = np.ndarray((slots, SLOT_FIELDS), dtype=np.int64, buffer=self.shm.buf, offset=8)
+        self.stamps = np.ndarray((slots,), dtype=np.float64, buffer=self.shm.buf, offset=8 + slots * SLOT_FIELDS * 8)
+        self.data = np.ndarray((slots, self.slot_bytes), dtype=np.uint8, buffer=self.shm.buf, offset=header_bytes)
+        if create:
+            self.counter[0] = 0
+            self.meta[:] = 0
+
+    def fits(self, frame):
+        return frame.size <= self.slot_bytes
+
+    def write(self, frame, timestamp):
+        """Copy `frame` into the next slot and return its sequence number."""
+        if not self.fits(frame):
+            raise ValueError(f"Frame of shape {frame.shape} does not fit a {self.max_shape} ring slot")
+        seq = int(self.counter[0]) + 1
+        slot = (seq - 1) % self.slots
+        height, width = frame.shape[:2]
+        channels = 1 if frame.ndim == 2 else frame.shape[2]
+        self.meta[slot, 0] = -1
+        np.copyto(self.data[slot, :frame.size].reshape(frame.shape), frame)
+        self.meta[slot, 1:] = (height, width, channels)
+        self.stamps[slot] = timestamp
+        self.meta[slot, 0] = seq
+        self.counter[0] = seq
+        return seq
+
+    def latest_seq(self):
+        return int(self.counter[0])
+
+    def read(self, seq=None):
+        """
+        Return (frame, timestamp, seq) for frame `seq`, or for the newest frame
+        when `seq` is None. Returns None if there is no frame yet or `seq` has
+        already been overwritten.
+        """
+        for _ in range(3):
+            wanted = self.latest_seq() if seq is None else seq
+            if wanted == 0:
+                return None
+            slot = (wanted - 1) % self.slots
+            if self.meta[slot, 0] != wanted:
+                if seq is not None:
+                    return None
+                continue
+            height, width, channels = (int(value) for value in self.meta[slot, 1:])
+            timestamp = float(self.stamps[slot])
+            frame = self.data[slot, :height * width * channels].copy()
+            if self.meta[slot, 0] == wanted:
+                shape = (height, width) if channels == 1 else (height, width, channels)
+                return frame.reshape(shape), timestamp, wanted
+            if seq is not None:
+                return None
+        return None
+
+    def close(self):
+        # Drop the numpy views first, the buffer cannot be closed while they exist
+        self.counter = self.meta = self.stamps = self.data = None
+        self.shm.close()
+
+    def unlink(self):
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def fit_frame(frame, max_shape):
+    """Scale `frame` down, keeping its aspect ratio, so it fits a ring slot."""
+    max_height, max_width = max_shape[:2]
+    height, width = frame.shape[:2]
+    scale = min(max_width / width, max_height / height)
+    return cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def capture_worker(cam_serial_num, rtsp_link, ring_name, slots, max_shape, stop_event, log_queue=None):
+    """Entry point of a capture process: grab frames from one camera into its ring."""
+    log_to_queue(log_queue)
+    from cam import CamConnect
+    ring = FrameRing(ring_name, slots, max_shape)
+    capture = None
+    try:
+        capture = CamConnect(rtsp_link)
+        last_frame = None
+        warned = False
+        while not stop_event.is_set():
+            info = capture.read_info()
+            frame = info.frame
+            # CamConnect replaces its frame object on every grab, so identity marks a new frame
+            if frame is not None and frame is not last_frame:
+                last_frame = frame
+                if not ring.fits(frame):
+                    if not warned:
+                        logger.warning(f"Camera {cam_serial_num} frames of shape {frame.shape} are larger "
+                                       f"than the pipeline ring slot {max_shape}, scaling down.")
+                        warned = True
+                    frame = fit_frame(frame, max_shape)
+                # The slot stamp carries the stream position, so the reader can tell a still scene from a frozen one
+                ring.write(frame, -1.0 if info.position is None else info.position)
+            time.sleep(0.005)
+    except Exception as e:
+        logger.error(f"Error in capture process for camera {cam_serial_num}: {e}")
+        logger.error(traceback.format_exc())
+    finally:
+        if capture is not None:
+            capture.stop()
+        ring.close()
+
+
+def recording_worker(ring_name, slots, max_shape, jobs, log_queue=None):
+    """Entry point of the recording process: encode the frames announced on `jobs`."""
+    log_to_queue(log_queue)
+    from recording import VideoRecorder
+    ring = FrameRing(ring_name, slots, max_shape)
+    recorder = None
+    dropped = 0
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            try:
+                if job[0] == "open":
+                    _, output_path, fps, config = job
+                    recorder = VideoRecorder.from_config(output_path, fps, config)
+                    dropped = 0
+                elif job[0] == "frame" and recorder is not None:
+                    _, seq, now = job
+                    item = ring.read(seq)
+                    if item is None:
+                        # Overwritten before this process got to it
+                        dropped += 1
+                        continue
+                    recorder.write(item[0], now)
+                elif job[0] == "close" and recorder is not None:
+                    recorder.release()
+                    logger.info(f"Recording process closed {recorder.output_path}: {recorder.frames_written} frames "
+                                f"written, {dropped} dropped.")
+                    recorder = None
+            except Exception as e:
+                logger.error(f"Error in recording process ({job[0]}): {e}")
+                logger.error(traceback.format_exc())
+    finally:
+        if recorder is not None:
+            recorder.release()
+        ring.close()
+
+
+class CaptureProcess:
+    """
+    Captures one camera in a separate process.
+
+    Drop-in replacement for CameraThread in the main loop: `read()` returns a
+    private copy of the newest frame from the shared memory ring.
+    """
+
+    def __init__(self, camera_serial_number, rtsp_link, slots=3, max_shape=(1080, 1920, 3)):
+        self.cam_serial_num = camera_serial_number
+        self.rtsp_url = rtsp_link
+        self.ring = FrameRing(slots=slots, max_shape=max_shape, create=True)
+        from cam import FrameInfo, error_image
+        self.info = FrameInfo(error_image, None, time.monotonic(), None)
+        self.stop_event = context.Event()
+        self.process = context.Process(
+            target=capture_worker,
+            args=(camera_serial_number, rtsp_link, self.ring.name, slots, max_shape, self.stop_event,
+                  child_log_queue(context)),
+            name=f"capture-{camera_serial_number}",
+            daemon=True,
+        )
+
+    @classmethod
+    def from_config(cls, camera_serial_number, rtsp_link, config):
+        max_shape = (config["max_height"], config["max_width"], 3)
+        return cls(camera_serial_number, rtsp_link, config["capture_slots"], max_shape)
+
+    def start(self):
+        self.process.start()
+        logger.info(f"Started capture process {self.process.pid} for camera {self.cam_serial_num}")
+
+    def read(self):
+        from cam import error_image
+        item = self.ring.read()
+        return error_image if item is None else item[0]
+
+    def read_info(self):
+        """Newest frame as a FrameInfo; the fingerprint is taken here, on this process's copy."""
+        from cam import next_frame_info, error_image
+        item = self.ring.read()
+        if item is None:
+            self.info = next_frame_info(error_image, self.info)
+        else:
+            frame, position, _ = item
+            self.info = next_frame_info(frame, self.info, None if position < 0 else position)
+        return self.info
+
+    def stop(self):
+        self.stop_event.set()
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.ring.close()
+        self.ring.unlink()
+
+
+class RemoteRecorder:
+    """VideoRecorder stand-in that hands frames to the recording process."""
+
+    def __init__(self, recording_process, output_path, fps, config):
+        self.recording_process = recording_process
+        self.output_path = output_path
+        self.frames_written = 0
+        self.last_frame = None
+        self.last_seq = None
+        recording_process.jobs.put(("open", output_path, fps, config))
+
+    def write(self, frame, now=None):
+        # Duplicated frames are sent as the same slot instead of being copied again
+        if frame is not self.last_frame:
+            self.last_frame = frame
+            if not self.recording_process.ring.fits(frame):
+                frame = fit_frame(frame, self.recording_process.ring.max_shape)
+            self.last_seq = self.recording_process.ring.write(frame, time.time())
+        self.recording_process.jobs.put(("frame", self.last_seq, time.monotonic() if now is None else now))
+        self.frames_written += 1
+
+    def release(self):
+        self.recording_process.jobs.put(("close",))
+        self.last_frame = None
+
+
+class RecordingProcess:
+    """
+    Runs segment encoding in a separate process.
+
+    The frame loop copies each frame into a shared memory ring once and
+    queues its slot number; the process encodes it with VideoRecorder. If
+    encoding falls more than `slots` frames behind, the oldest frames are
+    dropped and counted rather than stalling the frame loop.
+    """
+
+    def __init__(self, slots=8, max_shape=(1080, 1920, 3)):
+        self.ring = FrameRing(slots=slots, max_shape=max_shape, create=True)
+        self.jobs = context.Queue()
+        self.process = context.Process(
+            target=recording_worker,
+            args=(self.ring.name, slots, max_shape, self.jobs, child_log_queue(context)),
+            name="recording",
+            daemon=True,
+        )
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["recording_slots"], (config["max_height"], config["max_width"], 3))
+
+    def start(self):
+        self.process.start()
+        logger.info(f"Started recording process {self.process.pid}")
+
+    def open(self, output_path, fps, config):
+        return RemoteRecorder(self, output_path, fps, config)
+
+    def stop(self):
+        self.jobs.put(None)
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.ring.close()
+        self.ring.unlink()
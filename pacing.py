@@ -0,0 +1,289 @@
+import threading
+import time
+from collections import deque
+from logging_config import logger
+
+
+class FrameScheduler:
+    """
+    Paces the processing loop at a fixed target frame rate.
+
+    Ticks are laid out on an absolute monotonic timeline (each deadline is the
+    previous deadline plus one period), so sleep jitter and processing time do
+    not accumulate as drift. If the loop falls more than `max_lag` periods
+    behind, the timeline is re-anchored to "now" instead of bursting through
+    the backlog; the first re-anchor is logged and all are counted in
+    `missed_ticks`. `interrupt()` ends the current wait early from another
+    thread, so an event does not wait out a long period at a low rate.
+
+    Parameters:
+    ----------
+    target_fps : float
+        Rate at which the loop should run.
+    max_lag : int, optional
+        Number of periods the loop may fall behind before re-anchoring (default is 5).
+    window : int, optional
+        Number of recent ticks used to compute the achieved rate (default is 50).
+    """
+
+    def __init__(self, target_fps, max_lag=5, window=50):
+        self.set_target_fps(target_fps)
+        self.max_lag = max_lag
+        self.next_tick = None
+        self.last_tick = None
+        self.ticks = 0
+        self.missed_ticks = 0
+        self.tick_times = deque(maxlen=window)
+        self.wake_event = threading.Event()
+        self.interrupts = 0
+
+    def set_target_fps(self, target_fps):
+        if target_fps <= 0:
+            raise ValueError(f"Target FPS must be positive, got {target_fps}")
+        self.target_fps = float(target_fps)
+        self.period = 1.0 / self.target_fps
+        self.resume_tick = None  # Planned tick displaced by tick_soon(); a new rate plans afresh
+
+    def wait(self):
+        """Sleep until the next tick is due and return its monotonic timestamp."""
+        now = time.monotonic()
+        if self.next_tick is None:
+            self.next_tick = now
+
+        delay = self.next_tick - now
+        if delay > 0:
+            if self.wake_event.wait(delay):
+                self.wake_event.clear()
+                self.interrupts += 1
+                self.next_tick = time.monotonic()  # Tick now; the timeline continues from here
+            now = time.monotonic()
+        elif -delay > self.max_lag * self.period:
+            missed = int(-delay / self.period)
+            if self.missed_ticks == 0:
+                logger.warning(f"Frame loop is {-delay:.3f}s behind schedule, skipping {missed} ticks; "
+                               f"further skips are only counted in stats().")
+            self.missed_ticks += missed
+            self.next_tick = now
+
+        if self.resume_tick is not None:
+            self.next_tick, self.resume_tick = self.resume_tick, None
+        else:
+            self.next_tick += self.period
+        self.last_tick = now
+        self.ticks += 1
+        self.tick_times.append(now)
+        return now
+
+    def tick_soon(self, delay):
+        """Add one tick `delay` seconds after the last one; the timeline after it is unchanged."""
+        if self.last_tick is not None and self.last_tick + delay < self.next_tick:
+            self.resume_tick = self.next_tick
+            self.next_tick = self.last_tick + delay
+
+    def interrupt(self):
+        """Make a pending `wait()` return now (safe from any thread)."""
+        self.wake_event.set()
+
+    @property
+    def achieved_fps(self):
+        """Average rate over the recent tick window."""
+        if len(self.tick_times) < 2:
+            return 0.0
+        span = self.tick_times[-1] - self.tick_times[0]
+        return (len(self.tick_times) - 1) / span if span > 0 else 0.0
+
+    @property
+    def instant_fps(self):
+        """Rate implied by the interval between the last two ticks."""
+        if len(self.tick_times) < 2:
+            return 0.0
+        interval = self.tick_times[-1] - self.tick_times[-2]
+        return 1.0 / interval if interval > 0 else 0.0
+
+    def stats(self):
+        return {
+            "target_fps": self.target_fps,
+            "achieved_fps": round(self.achieved_fps, 2),
+            "ticks": self.ticks,
+            "missed_ticks": self.missed_ticks,
+        }
+
+
+class SegmentClock:
+    """
+    Keeps the number of frames written to a recording segment in step with
+    wall-clock time, so a segment recorded at `fps` plays back at true speed.
+
+    Call `frames_due()` once per loop iteration and write the current frame
+    that many times: 0 drops the frame (the loop is ahead of the timeline),
+    more than 1 duplicates it (the loop fell behind). Every copy is encoded
+    on the frame thread, so at most `max_burst` copies are due per call; a
+    longer gap moves the segment start forward by the remainder instead, and
+    the skipped time is counted in `frames_skipped`. Catching up after a
+    stall therefore cannot cause the next stall.
+    """
+
+    def __init__(self, fps, max_burst=2):
+        self.fps = float(fps)
+        self.max_burst = max(1, int(max_burst))
+        self.start = None
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.frames_duplicated = 0
+        self.frames_skipped = 0
+
+    def start_segment(self, now=None):
+        self.start = time.monotonic() if now is None else now
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.frames_duplicated = 0
+        self.frames_skipped = 0
+
+    def elapsed(self, now=None):
+        if self.start is None:
+            return 0.0
+        return (time.monotonic() if now is None else now) - self.start
+
+    def frames_due(self, now=None):
+        """Return how many copies of the current frame to write at `now`."""
+        now = time.monotonic() if now is None else now
+        if self.start is None:
+            self.start_segment(now)
+
+        expected = int(self.elapsed(now) * self.fps) + 1
+        due = expected - self.frames_written
+        if due <= 0:
+            self.frames_dropped += 1
+            return 0
+
+        if due > self.max_burst:
+            skipped = due - self.max_burst
+            if self.frames_skipped == 0:
+                logger.warning(f"Recording fell {skipped / self.fps:.2f}s behind, re-anchoring segment timeline.")
+            self.frames_skipped += skipped
+            self.start += skipped / self.fps
+            due = self.max_burst
+
+        self.frames_written += due
+        self.frames_duplicated += due - 1
+        return due
+
+    def stats(self):
+        return {
+            "fps": self.fps,
+            "frames_written": self.frames_written,
+            "frames_dropped": self.frames_dropped,
+            "frames_duplicated": self.frames_duplicated,
+            "frames_skipped": self.frames_skipped,
+        }
+
+
+DEFAULT_ADAPTIVE_RATE_CONFIG = {
+    "enabled": True,
+    "idle_fps": 3.0,        # Detection rate while the line is calm
+    "margin": 0.5,          # Calm means STABLE with every score below mes_score * margin
+    "calm_seconds": 10.0,   # Calm time before dropping to idle_fps
+}
+
+
+class AdaptiveRate:
+    """
+    Detection rate that follows the line's activity.
+
+    Detection runs on every tick until the detector has been STABLE with
+    every score below `on_score * margin` for `calm_seconds`; then `due()`
+    lets it run only `idle_fps` times a second. The first score at or above
+    the margin, any state other than STABLE, or `wake()` (a detector
+    transition, a control update, PLC activity) restores the full rate at
+    once, so the added detection latency is at most one idle period.
+    `hold()` drops to the idle rate at once and keeps it there: neither
+    scores nor `wake()` lift it until `release()` is called (the PLC gate
+    reporting the line active again). The caller still compares each scored frame
+    with the frame of the tick before it, so idle scores stay on the same
+    scale as `on_score`.
+
+    Parameters:
+    ----------
+    idle_fps : float, optional
+        Detection rate while calm (default is 3.0).
+    margin : float, optional
+        Fraction of `on_score` a score must stay below to count as calm (default is 0.5).
+    calm_seconds : float, optional
+        Calm time before the rate drops (default is 10.0).
+    enabled : bool, optional
+        When False the rate never drops (default is True).
+    """
+
+    def __init__(self, idle_fps=3.0, margin=0.5, calm_seconds=10.0, enabled=True):
+        self.idle_fps = idle_fps
+        self.margin = margin
+        self.calm_seconds = calm_seconds
+        self.enabled = enabled
+        self.idle = False
+        self.held = None  # Reason of the hold() in force, if any
+        self.calm_since = None
+        self.last_run = None
+        self.idle_since = None
+        self.idle_seconds = 0.0
+        self.skipped = 0
+        self.wakeups = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["idle_fps"], config["margin"], config["calm_seconds"], config["enabled"])
+
+    def due(self, now):
+        """Whether detection should run on the tick at monotonic time `now`."""
+        if not self.idle:
+            return True
+        if self.last_run is not None and now - self.last_run < 1.0 / self.idle_fps:
+            self.skipped += 1
+            return False
+        self.last_run = now
+        return True
+
+    def observe(self, score, stable, on_score, now):
+        """Feed one detection result; drops to the idle rate after enough calm, or wakes up."""
+        if not stable or score >= on_score * self.margin:
+            self.wake(now, f"score {score:.1f}" if stable else "detector not stable")
+            return
+        if self.calm_since is None:
+            self.calm_since = now
+        if self.enabled and not self.idle and now - self.calm_since >= self.calm_seconds:
+            self.idle = True
+            self.idle_since = self.last_run = now
+            logger.info(f"Line calm for {self.calm_seconds:g} s, detecting at {self.idle_fps:g} fps.")
+
+    def hold(self, now, reason=""):
+        """Drop to the idle rate at once and stay there until `release()` (e.g. the PLC reports the line idle)."""
+        self.calm_since = None
+        self.held = reason
+        if not self.idle:
+            self.idle = True
+            self.idle_since = self.last_run = now
+            logger.info(f"Detecting at {self.idle_fps:g} fps ({reason}).")
+
+    def release(self, now, reason=""):
+        """End a `hold()` and return to the full rate."""
+        self.held = None
+        self.wake(now, reason)
+
+    def wake(self, now, reason=""):
+        """Return to the full rate at once, unless a `hold()` is in force."""
+        self.calm_since = None
+        if self.idle and self.held is None:
+            self.idle = False
+            self.idle_seconds += now - self.idle_since
+            self.wakeups += 1
+            logger.info(f"Detection back at full rate ({reason}).")
+
+    def stats(self, now):
+        idle_seconds = self.idle_seconds + (now - self.idle_since if self.idle else 0.0)
+        return {
+            "mode": "idle" if self.idle else "full",
+            "held": self.held,
+            "idle_fps": self.idle_fps,
+            "idle_seconds": round(idle_seconds, 1),
+            "skipped": self.skipped,
+            "wakeups": self.wakeups,
+        }
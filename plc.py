@@ -1,7 +1,9 @@
 import minimalmodbus
 import serial
+import threading
 import time
-from icecream import ic
+from logging_config import ic
+from tracing import traced
 ic.disable()
 class PLC():
     """
@@ -9,21 +11,30 @@ class PLC():
 
     Attributes:
     - isPLCConnected (bool): Indicates whether the connection to the PLC is established.
+    - connections (int): Number of successful (re)connections, so callers can re-send outputs after a reconnect.
     - door_open (int): PLC address for door open status (x0).
     - slab_status (int): PLC address for slab movement status (x1).
     - roller_status (int): PLC address for roller movement status (x2).
 
+    - port (str): Serial port the PLC is connected to (COM7 on the edge PC), or a pySerial URL such as socket://host:port.
+
     Methods:
-    - __init__(): Initializes the PLC object and attempts to connect to the PLC using the connectToPLC() method.
+    - __init__(port): Initializes the PLC object and attempts to connect to the PLC using the connectToPLC() method.
     - connectToPLC(): Connects to the PLC using minimalmodbus library with specified parameters.
     - read_bit(address): Reads the value of a specified address in the PLC.
+    - read_inputs(address, count): Reads consecutive X inputs in one request.
+
+    All methods may be called from several threads (PLC writer, PLC gate); one request runs at a time.
 
     """
-    def __init__(self):
+    def __init__(self, port='COM7'):
         """
         Initializes the PLC object and attempts to connect to the PLC using the connectToPLC() method.
         """
+        self.port = port
         self.isPLCConnectecd = False
+        self.connections = 0
+        self.lock = threading.Lock()
         self.connectToPLC()
 
 
@@ -54,7 +65,9 @@ class PLC():
 
         """
         try:
-            self.instrument = minimalmodbus.Instrument('COM7', 1, minimalmodbus.MODE_ASCII) #, debug = True) ## check com port in your system for me its "COM6"
+            # pySerial URLs (e.g. socket://host:port for a serial gateway or plc_simulator.py) are opened here
+            port = serial.serial_for_url(self.port) if "://" in self.port else self.port
+            self.instrument = minimalmodbus.Instrument(port, 1, minimalmodbus.MODE_ASCII) #, debug = True) ## check com port in your system for me its "COM6"
             self.instrument.serial.port                                     # this is the serial port name
             self.instrument.serial.baudrate = 9600                          # Baudrate
             self.instrument.serial.bytesize = 7
@@ -68,6 +81,7 @@ class PLC():
             print("parameter setting: ",self.instrument)
 
             self.isPLCConnectecd = True
+            self.connections += 1
 
         except serial.serialutil.SerialException:
             print("Coud Not Connect to PLC")
@@ -90,7 +104,12 @@ class PLC():
                 self.isPLCConnectecd = False
 
 
+    @traced("plc.read", "plc")
     def read_bit(self,adress):
+        with self.lock:
+            return self._read_bit(adress)
+
+    def _read_bit(self,adress):
         try:
             val = self.instrument.read_register(adress)
             # if adress == 4196 or adress == 4296:
@@ -110,10 +129,16 @@ class PLC():
             self.isPLCConnectecd = False
             return "PLC Not Connected"
     
+    @traced("plc.write", "plc")
     def write_bit(self,adress,data):
+        with self.lock:
+            return self._write_bit(adress,data)
+
+    def _write_bit(self,adress,data):
         try:
             ic(adress,data)
             self.instrument.write_register(adress,data)
+            return True
         except minimalmodbus.NoResponseError:
             try:
                 print("[INFO] 1 connect To PLC Called")
@@ -123,7 +148,17 @@ class PLC():
                 self.isPLCConnectecd = False
         except:
             self.isPLCConnectecd = False
-        return True
+        return False  # Not written; the caller retries
+
+    @traced("plc.read_inputs", "plc")
+    def read_inputs(self, address, count):
+        """
+        Reads `count` X inputs starting at Modbus `address` (X0 = 1024) with one
+        function 02 request and returns them as a list of 0/1. Unlike read_bit(),
+        errors are raised so the caller knows the values are missing.
+        """
+        with self.lock:
+            return self.instrument.read_bits(address, count, functioncode=2)
     
     
 if __name__ == "__main__":
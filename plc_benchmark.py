@@ -0,0 +1,114 @@
+import argparse
+import contextlib
+import io
+import numpy as np
+import time
+from plc import PLC
+from plc_simulator import PLCSimulator, D10
+
+
+def measure(name, operation, count, simulator=None):
+    """Run `operation(i)` `count` times and return its latency statistics."""
+    latencies = np.zeros(count)
+    failures = 0
+    for i in range(count):
+        # PLC swallows errors, so with the simulator success means one more normal response
+        answered = simulator.stats["responses"] - simulator.stats["errors"] if simulator else None
+        start = time.perf_counter()
+        result = operation(i)
+        latencies[i] = time.perf_counter() - start
+        if simulator:
+            failed = simulator.stats["responses"] - simulator.stats["errors"] == answered
+        else:
+            failed = result is None or result is False or result == "PLC Not Connected"
+        failures += failed
+    total = latencies.sum()
+    return {
+        "name": name,
+        "count": count,
+        "ops_per_s": count / total if total else 0.0,
+        "p50_ms": np.percentile(latencies, 50) * 1000,
+        "p95_ms": np.percentile(latencies, 95) * 1000,
+        "p99_ms": np.percentile(latencies, 99) * 1000,
+        "max_ms": latencies.max() * 1000,
+        "failures": failures,
+    }
+
+
+def print_result(result, reconnects=None):
+    line = (f"{result['name']:<14}{result['count']:>7}{result['ops_per_s']:>10.1f}{result['p50_ms']:>9.2f}"
+            f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['max_ms']:>10.2f}{result['failures']:>9}")
+    print(line + (f"{reconnects:>11}" if reconnects is not None else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PLC.write_bit/read_bit against the PLC simulator or a real PLC.")
+    parser.add_argument("--port", help="Serial port of a real PLC (default: start a simulator)")
+    parser.add_argument("--count", type=int, default=1000, help="Operations per measurement")
+    parser.add_argument("--delay", type=float, default=0.0, help="Simulator response delay in seconds")
+    parser.add_argument("--baudrate", type=int, help="Simulate serial line time at this speed (e.g. 9600)")
+    parser.add_argument("--fault-count", type=int, default=200, help="Operations in the fault injection phase (0 to skip)")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Exception responses during the fault phase")
+    parser.add_argument("--timeout-rate", type=float, default=0.02, help="Unanswered requests during the fault phase")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Serial read timeout in seconds (PLC default 2.0)")
+    parser.add_argument("--transport", choices=("auto", "pty", "socket"), default="auto", help="Simulator transport")
+    args = parser.parse_args()
+
+    simulator = None
+    port = args.port
+    if port is None:
+        simulator = PLCSimulator(delay=args.delay, baudrate=args.baudrate, seed=1, transport=args.transport).start()
+        port = simulator.port
+
+    reconnects = [0]
+    # PLC prints every read and connection attempt; keep that out of the timings
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        plc = PLC(port=port)
+    connect = plc.connectToPLC
+
+    def counting_connect():
+        reconnects[0] += 1
+        connect()
+        plc.instrument.serial.timeout = args.timeout
+
+    plc.connectToPLC = counting_connect
+    plc.instrument.serial.timeout = args.timeout
+    if not plc.isPLCConnectecd:
+        print(f"Could not connect to the PLC on {port}"
+              + (" (this kernel's ptys may reject 7E1, try --transport socket)" if port.startswith("/dev/") and simulator else ""))
+        return
+
+    print(f"PLC on {port}" + (f" (simulator, delay {args.delay * 1000:.1f} ms"
+                              f"{f', {args.baudrate} baud' if args.baudrate else ''})" if simulator else ""))
+    print(f"{'Operation':<14}{'Count':>7}{'Ops/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'Max ms':>10}{'Failures':>9}{'Reconnects':>11}")
+    with quiet:
+        write = measure("write_bit", lambda i: plc.write_bit(D10, 100 if i % 2 else 200), args.count, simulator)
+    print_result(write, reconnects[0])
+    with quiet:
+        read = measure("read_bit", lambda i: plc.read_bit(D10), args.count, simulator)
+    print_result(read, reconnects[0])
+
+    if simulator is not None and args.fault_count:
+        reconnects[0] = 0
+        simulator.error_rate, simulator.timeout_rate = args.error_rate, args.timeout_rate
+        with quiet:
+            faults = measure("write (faults)", lambda i: plc.write_bit(D10, 100 if i % 2 else 200), args.fault_count, simulator)
+        print_result(faults, reconnects[0])
+
+        # Recovery: how long until the PLC answers again once the faults stop
+        simulator.error_rate = simulator.timeout_rate = 0.0
+        start = time.perf_counter()
+        with quiet:
+            for attempt in range(1, 11):
+                if plc.read_bit(D10) is not None:
+                    break
+        print(f"Recovered after {attempt} read(s), {(time.perf_counter() - start) * 1000:.1f} ms; "
+              f"simulator stats {simulator.stats}")
+
+    if simulator is not None:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
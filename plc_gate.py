@@ -0,0 +1,152 @@
+import threading
+import time
+import traceback
+from collections import namedtuple
+from logging_config import logger
+
+X_BASE = 0x0400  # Modbus address of X0 on the Delta PLC
+
+DEFAULT_PLC_GATE_CONFIG = {
+    "enabled": False,
+    "poll_interval": 0.5,    # Seconds between input reads; also the worst-case resume delay
+    "stale_after": 3.0,      # Without a successful read for this long the gate fails open
+    "inputs": {"door_open": 0, "slab_status": 1, "roller_status": 2},  # Input name -> X number
+    # First matching rule wins; no match means full detection with recording.
+    # "detection" is "full", "reduced" (idle rate) or "off".
+    "rules": [
+        {"name": "door open", "when": {"door_open": 1}, "detection": "full", "recording": True},
+        {"name": "line idle", "when": {"slab_status": 0, "roller_status": 0}, "detection": "off", "recording": False},
+        {"name": "rollers stopped", "when": {"roller_status": 0}, "detection": "reduced", "recording": True},
+    ],
+}
+
+DETECTION_MODES = ("full", "reduced", "off")
+
+Decision = namedtuple("Decision", ["detection", "recording", "rule"])
+
+FAIL_OPEN = Decision("full", True, "no PLC data")
+NO_MATCH = Decision("full", True, None)
+
+
+def validate_rules(rules, inputs):
+    """Return `rules` with defaults filled in, or raise ValueError."""
+    clean = []
+    for i, rule in enumerate(rules):
+        when = rule.get("when", {})
+        unknown = set(when) - set(inputs)
+        if unknown:
+            raise ValueError(f"Gate rule {i} uses unknown inputs {sorted(unknown)}")
+        detection = rule.get("detection", "full")
+        if detection not in DETECTION_MODES:
+            raise ValueError(f"Gate rule {i}: 'detection' must be one of {DETECTION_MODES}")
+        clean.append({"name": rule.get("name", f"rule {i}"), "when": dict(when),
+                      "detection": detection, "recording": bool(rule.get("recording", True))})
+    return clean
+
+
+class PLCGate:
+    """
+    Decides from the PLC inputs whether there is anything to monitor.
+
+    A poll thread reads the configured X inputs (by default X0 door_open,
+    X1 slab_status and X2 roller_status) every `poll_interval` seconds in a
+    single function 02 request and caches them. `decide()` only looks at the
+    cache and does no I/O; output writes go through the PLC writer thread.
+    The poll and the writes share the PLC's lock, so a slow or timed-out
+    write (up to the 2 s serial timeout) delays the next poll, and a starting
+    line is seen within one poll interval plus any write in progress. The
+    first rule whose `when` inputs all match gives the detection mode and
+    whether to record.
+
+    The gate fails open: while the PLC is not connected, or no read has
+    succeeded for `stale_after` seconds, it returns full detection with
+    recording.
+
+    Parameters:
+    ----------
+    get_plc : callable
+        Returns the connected PLC, or None while it is not ready.
+    inputs : dict
+        Input name -> X number.
+    rules : list of dict
+        Gating rules, see DEFAULT_PLC_GATE_CONFIG.
+    poll_interval : float, optional
+        Seconds between reads (default is 0.5).
+    stale_after : float, optional
+        Seconds without a successful read before failing open (default is 3.0).
+    on_change : callable or None, optional
+        Called from the poll thread after an input changed, e.g. to wake the frame loop.
+    """
+
+    def __init__(self, get_plc, inputs, rules, poll_interval=0.5, stale_after=3.0, on_change=None):
+        self.get_plc = get_plc
+        self.on_change = on_change
+        self.inputs = dict(inputs)
+        self.rules = validate_rules(rules, self.inputs)
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.first = min(self.inputs.values())
+        self.count = max(self.inputs.values()) - self.first + 1
+        self.values = None
+        self.updated_at = None
+        self.version = 0  # Incremented whenever an input changes
+        self.stats = {"polls": 0, "errors": 0, "changes": 0}
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="plc-gate", daemon=True)
+
+    @classmethod
+    def from_config(cls, get_plc, config, on_change=None):
+        return cls(get_plc, config["inputs"], config["rules"], config["poll_interval"], config["stale_after"], on_change)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stop_event.is_set():
+            plc = self.get_plc()
+            if plc is not None:
+                self.poll(plc)
+            self.stop_event.wait(self.poll_interval)
+
+    def poll(self, plc):
+        try:
+            bits = plc.read_inputs(X_BASE + self.first, self.count)
+        except Exception as e:
+            self.stats["errors"] += 1
+            if self.stats["errors"] == 1 or self.stats["errors"] % 100 == 0:
+                logger.error(f"Error reading PLC inputs ({self.stats['errors']} errors): {e}")
+                logger.error(traceback.format_exc())
+            return
+        values = {name: int(bits[number - self.first]) for name, number in self.inputs.items()}
+        self.stats["polls"] += 1
+        previous, self.values, self.updated_at = self.values, values, time.monotonic()
+        if values != previous:
+            if previous is not None:
+                self.stats["changes"] += 1
+                logger.info(f"PLC inputs changed: {values}")
+            self.version += 1
+            if self.on_change is not None:
+                self.on_change()
+
+    def current(self, now):
+        """The cached inputs, or None if they are missing or older than `stale_after`."""
+        if self.updated_at is None or now - self.updated_at > self.stale_after:
+            return None
+        return self.values
+
+    def decide(self, now):
+        values = self.current(now)
+        if values is None:
+            return FAIL_OPEN
+        for rule in self.rules:
+            if all(values[name] == value for name, value in rule["when"].items()):
+                return Decision(rule["detection"], rule["recording"], rule["name"])
+        return NO_MATCH
+
+    def status(self, now):
+        return {"inputs": self.current(now), "decision": self.decide(now)._asdict(), **self.stats}
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join(timeout=5)
@@ -0,0 +1,334 @@
+import argparse
+import os
+import random
+import select
+import socket
+import termios
+import threading
+import time
+import traceback
+import tty
+from logging_config import logger
+
+SLAVE_ADDRESS = 1
+
+# Delta DVP Modbus addresses (see PLC_Related/Delta Modbus Address.xlsx)
+X_BASE = 0x0400   # X0 = 1024, inputs (function 02)
+Y_BASE = 0x0500   # Y0 = 1280, outputs (functions 01 / 05)
+D_BASE = 0x1000   # D0 = 4096, data registers (functions 03 / 06 / 16)
+D_COUNT = 4096
+BIT_COUNT = 256
+
+D10 = D_BASE + 10  # 4106, vibration signal written by the app: 100 = stable (Y0 on), 200 = vibrating (Y0 off)
+
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_ADDRESS = 0x02
+ILLEGAL_VALUE = 0x03
+DEVICE_FAILURE = 0x04
+
+
+def lrc(payload):
+    return (-sum(payload)) & 0xFF
+
+
+def encode_frame(payload):
+    return b":" + (bytes(payload) + bytes([lrc(payload)])).hex().upper().encode() + b"\r\n"
+
+
+def pty_supports_7e1():
+    """
+    Whether this kernel lets a pseudo-terminal be set to 7 data bits with even
+    parity, the PLC's line settings. Some recent kernels only allow 8N1 on ptys.
+    """
+    master_fd, slave_fd = os.openpty()
+    try:
+        attributes = termios.tcgetattr(slave_fd)
+        attributes[2] = (attributes[2] & ~termios.CSIZE) | termios.CS7 | termios.PARENB
+        termios.tcsetattr(slave_fd, termios.TCSANOW, attributes)
+        return True
+    except termios.error:
+        return False
+    finally:
+        os.close(master_fd)
+        os.close(slave_fd)
+
+
+def decode_frame(line):
+    """Return the payload of a Modbus ASCII frame (without LRC) or None if it is malformed."""
+    line = line.strip()
+    if not line.startswith(b":"):
+        return None
+    try:
+        data = bytes.fromhex(line[1:].decode())
+    except ValueError:
+        return None
+    if len(data) < 3 or lrc(data[:-1]) != data[-1]:
+        return None
+    return data[:-1]
+
+
+class PLCSimulator:
+    """
+    Software Delta PLC speaking Modbus ASCII on a pseudo-terminal.
+
+    Clients open `port` (the pty's slave side) exactly like COM7, e.g.
+    `PLC(port=simulator.port)`. With `transport="socket"` the simulator
+    listens on localhost instead and `port` is a socket:// URL, for kernels
+    whose ptys reject the PLC's 7E1 line settings. Supports functions
+    01/02/03/05/06/16 over the D registers (D0 = 4096), X inputs (X0 = 1024)
+    and Y outputs (Y0 = 1280). Like the ladder in PLC_Related/vms.dvp, writing 100 to D10
+    turns Y0 on and 200 turns it off.
+
+    Parameters:
+    ----------
+    delay : float, optional
+        Seconds before each response (default is 0).
+    jitter : float, optional
+        Extra random delay of up to `jitter` seconds (default is 0).
+    error_rate : float, optional
+        Fraction of requests answered with a "slave device failure" exception (default is 0).
+    timeout_rate : float, optional
+        Fraction of requests that get no answer at all (default is 0).
+    baudrate : int or None, optional
+        Emulate the time frames take on a serial line of this speed (7E1, 10 bits per byte).
+        None answers as fast as the pty allows (default is None).
+    seed : int or None, optional
+        Seed for the error and timeout injection.
+    transport : str, optional
+        "pty" (default), "socket", or "auto" to use a pty when it supports 7E1.
+    tcp_port : int, optional
+        Port of the socket transport, 0 picks a free one (default is 0).
+    """
+
+    def __init__(self, delay=0.0, jitter=0.0, error_rate=0.0, timeout_rate=0.0, baudrate=None, seed=None,
+                 transport="pty", tcp_port=0):
+        self.delay = delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.baudrate = baudrate
+        self.random = random.Random(seed)
+        self.registers = [0] * D_COUNT
+        self.inputs = [0] * BIT_COUNT
+        self.outputs = [0] * BIT_COUNT
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "responses": 0, "errors": 0, "timeouts": 0, "malformed": 0}
+        if transport == "auto":
+            transport = "pty" if pty_supports_7e1() else "socket"
+        self.transport = transport
+        self.master_fd = self.slave_fd = self.server = self.client = None
+        if transport == "pty":
+            self.master_fd, self.slave_fd = os.openpty()
+            tty.setraw(self.slave_fd)
+            # The slave side stays open so the pty survives clients closing and reopening it
+            self.port = os.ttyname(self.slave_fd)
+        else:
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server.bind(("127.0.0.1", tcp_port))
+            self.server.listen(1)
+            self.port = f"socket://127.0.0.1:{self.server.getsockname()[1]}"
+        self.running = False
+        self.thread = threading.Thread(target=self.serve, name="plc-simulator", daemon=True)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+        logger.info(f"PLC simulator listening on {self.port}")
+        return self
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=2)
+        if self.transport == "pty":
+            os.close(self.master_fd)
+            os.close(self.slave_fd)
+        else:
+            if self.client is not None:
+                self.client.close()
+            self.server.close()
+
+    def set_input(self, number, value):
+        """Set X`number` (e.g. 0 for X0, the door switch)."""
+        with self.lock:
+            self.inputs[number] = 1 if value else 0
+
+    def register(self, address):
+        with self.lock:
+            return self.registers[address - D_BASE]
+
+    def output(self, number):
+        with self.lock:
+            return self.outputs[number]
+
+    def line_time(self, byte_count):
+        return byte_count * 10 / self.baudrate if self.baudrate else 0.0
+
+    def receive(self, readable):
+        """Return bytes received from the client, or None if nothing usable arrived."""
+        if self.transport == "pty":
+            return os.read(self.master_fd, 1024)
+        if self.server in readable:
+            # One client at a time: a reconnecting PLC replaces the old connection
+            if self.client is not None:
+                self.client.close()
+            self.client, _ = self.server.accept()
+            return None
+        data = self.client.recv(1024)
+        if not data:
+            self.client.close()
+            self.client = None
+            return None
+        return data
+
+    def send(self, frame):
+        if self.transport == "pty":
+            os.write(self.master_fd, frame)
+        elif self.client is not None:
+            self.client.sendall(frame)
+
+    def serve(self):
+        buffer = b""
+        while self.running:
+            if self.transport == "pty":
+                sources = [self.master_fd]
+            else:
+                sources = [self.server] + ([self.client] if self.client is not None else [])
+            readable, _, _ = select.select(sources, [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                data = self.receive(readable)
+            except OSError:
+                continue
+            if data is None:
+                buffer = b""
+                continue
+            buffer += data
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                try:
+                    self.handle(line + b"\n")
+                except Exception as e:
+                    logger.error(f"PLC simulator error: {e}")
+                    logger.error(traceback.format_exc())
+
+    def handle(self, line):
+        self.stats["requests"] += 1
+        payload = decode_frame(line)
+        if payload is None:
+            # A real PLC ignores frames with a bad LRC
+            self.stats["malformed"] += 1
+            return
+        if payload[0] != SLAVE_ADDRESS:
+            return
+        wait = self.delay + (self.random.uniform(0, self.jitter) if self.jitter else 0) + self.line_time(len(line))
+        if self.timeout_rate and self.random.random() < self.timeout_rate:
+            self.stats["timeouts"] += 1
+            return
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            response = bytes([SLAVE_ADDRESS, payload[1] | 0x80, DEVICE_FAILURE])
+        else:
+            response = self.execute(payload[1], payload[2:])
+        frame = encode_frame(response)
+        wait += self.line_time(len(frame))
+        if wait > 0:
+            time.sleep(wait)
+        # Counted before sending so a client that got its answer always sees it counted
+        self.stats["responses"] += 1
+        self.send(frame)
+
+    def execute(self, function, data):
+        def exception(code):
+            return bytes([SLAVE_ADDRESS, function | 0x80, code])
+
+        if function in (0x01, 0x02, 0x03) and len(data) == 4:
+            start, count = int.from_bytes(data[:2], "big"), int.from_bytes(data[2:], "big")
+            if function == 0x03:
+                if not (D_BASE <= start and start + count <= D_BASE + D_COUNT) or not 1 <= count <= 125:
+                    return exception(ILLEGAL_ADDRESS)
+                with self.lock:
+                    values = self.registers[start - D_BASE:start - D_BASE + count]
+                body = b"".join(value.to_bytes(2, "big") for value in values)
+                return bytes([SLAVE_ADDRESS, function, len(body)]) + body
+            base = Y_BASE if function == 0x01 else X_BASE
+            bits = self.outputs if function == 0x01 else self.inputs
+            if not (base <= start and start + count <= base + BIT_COUNT) or not 1 <= count <= 2000:
+                return exception(ILLEGAL_ADDRESS)
+            with self.lock:
+                values = bits[start - base:start - base + count]
+            body = bytes(sum(bit << i for i, bit in enumerate(values[offset:offset + 8]))
+                         for offset in range(0, count, 8))
+            return bytes([SLAVE_ADDRESS, function, len(body)]) + body
+
+        if function == 0x05 and len(data) == 4:
+            address, value = int.from_bytes(data[:2], "big"), int.from_bytes(data[2:], "big")
+            if not Y_BASE <= address < Y_BASE + BIT_COUNT:
+                return exception(ILLEGAL_ADDRESS)
+            if value not in (0x0000, 0xFF00):
+                return exception(ILLEGAL_VALUE)
+            with self.lock:
+                self.outputs[address - Y_BASE] = 1 if value else 0
+            return bytes([SLAVE_ADDRESS, function]) + data
+
+        if function == 0x06 and len(data) == 4:
+            address = int.from_bytes(data[:2], "big")
+            if not D_BASE <= address < D_BASE + D_COUNT:
+                return exception(ILLEGAL_ADDRESS)
+            self.write_registers(address, [int.from_bytes(data[2:], "big")])
+            return bytes([SLAVE_ADDRESS, function]) + data
+
+        if function == 0x10 and len(data) >= 5:
+            start, count, byte_count = int.from_bytes(data[:2], "big"), int.from_bytes(data[2:4], "big"), data[4]
+            if byte_count != 2 * count or len(data) != 5 + byte_count or not 1 <= count <= 123:
+                return exception(ILLEGAL_VALUE)
+            if not (D_BASE <= start and start + count <= D_BASE + D_COUNT):
+                return exception(ILLEGAL_ADDRESS)
+            values = [int.from_bytes(data[5 + 2 * i:7 + 2 * i], "big") for i in range(count)]
+            self.write_registers(start, values)
+            return bytes([SLAVE_ADDRESS, function]) + data[:4]
+
+        return exception(ILLEGAL_FUNCTION)
+
+    def write_registers(self, start, values):
+        with self.lock:
+            self.registers[start - D_BASE:start - D_BASE + len(values)] = values
+            # Ladder logic of the vibration signal
+            if start <= D10 < start + len(values):
+                value = self.registers[D10 - D_BASE]
+                if value == 100:
+                    self.outputs[0] = 1
+                elif value == 200:
+                    self.outputs[0] = 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the Delta PLC on a pseudo-terminal (Modbus ASCII).")
+    parser.add_argument("--delay", type=float, default=0.0, help="Response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra delay of up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an exception")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of requests left unanswered")
+    parser.add_argument("--baudrate", type=int, help="Emulate serial line time at this speed (e.g. 9600)")
+    parser.add_argument("--door-open", action="store_true", help="Start with X0 (door open) set")
+    parser.add_argument("--transport", choices=("auto", "pty", "socket"), default="auto",
+                        help="pty, or a localhost socket where ptys reject 7E1 (default: auto)")
+    parser.add_argument("--tcp-port", type=int, default=5020, help="Port of the socket transport (default 5020)")
+    args = parser.parse_args()
+
+    simulator = PLCSimulator(args.delay, args.jitter, args.error_rate, args.timeout_rate, args.baudrate,
+                             transport=args.transport, tcp_port=args.tcp_port).start()
+    simulator.set_input(0, args.door_open)
+    print(f"PLC simulator on {simulator.port} - set \"plc\": {{\"port\": \"{simulator.port}\"}} in data/config.json. Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"D10={simulator.register(D10)} Y0={simulator.output(0)} {simulator.stats}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
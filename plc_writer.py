@@ -0,0 +1,93 @@
+import threading
+import time
+from logging_config import logger
+
+
+class PLCWriter:
+    """
+    Keeps PLC registers at the values the application last asked for.
+
+    `set()` only records the value and wakes a writer thread, so the frame
+    loop never waits on the serial line. The thread writes a changed value
+    at once and re-sends every value each `refresh_interval` seconds and
+    after the PLC reconnected, so a dropped write or a PLC restart is
+    corrected within one interval instead of at the next state change. A
+    value whose write failed, or that was set before the PLC was ready, is
+    retried every `retry_interval` seconds.
+
+    Parameters:
+    ----------
+    get_plc : callable
+        Returns the connected PLC, or None while it is not ready.
+    refresh_interval : float, optional
+        Seconds between re-sends of all values (default is 5.0).
+    retry_interval : float, optional
+        Seconds between attempts while a value is not written (default is 1.0).
+    """
+
+    def __init__(self, get_plc, refresh_interval=5.0, retry_interval=1.0):
+        self.get_plc = get_plc
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.lock = threading.Lock()
+        self.values = {}
+        self.dirty = set()  # Addresses whose value is not known to be in the PLC
+        self.stats = {"writes": 0, "failures": 0, "refreshes": 0}
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="plc-writer", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def set(self, address, value):
+        """Ask for `value` in register `address`; returns at once."""
+        with self.lock:
+            self.values[address] = value
+            self.dirty.add(address)
+        self.wake.set()
+
+    def run(self):
+        connections = None
+        next_refresh = time.monotonic() + self.refresh_interval
+        while True:
+            plc = self.get_plc()
+            if plc is not None:
+                now = time.monotonic()
+                if now >= next_refresh or plc.connections != connections:
+                    with self.lock:
+                        self.dirty.update(self.values)
+                    self.stats["refreshes"] += 1
+                    next_refresh = now + self.refresh_interval
+                connections = plc.connections  # A reconnect during the writes below triggers a re-send
+                self.write_dirty(plc)
+            if self.stop_event.is_set():
+                return
+            timeout = next_refresh - time.monotonic()
+            if self.dirty:
+                timeout = min(timeout, self.retry_interval)
+            self.wake.wait(max(0.0, timeout))
+            self.wake.clear()
+
+    def write_dirty(self, plc):
+        with self.lock:
+            pending = {address: self.values[address] for address in self.dirty}
+        for address, value in pending.items():
+            if not plc.write_bit(address, value):
+                self.stats["failures"] += 1
+                if self.stats["failures"] == 1 or self.stats["failures"] % 100 == 0:
+                    logger.error(f"Error writing {value} to PLC register {address} "
+                                 f"({self.stats['failures']} failures); retrying.")
+                return  # The next attempt follows after `retry_interval`
+            self.stats["writes"] += 1
+            with self.lock:
+                if self.values[address] == value:
+                    self.dirty.discard(address)
+
+    def stop(self):
+        """Write what is still pending, then end the thread."""
+        self.stop_event.set()
+        self.wake.set()
+        if self.thread.ident is not None:
+            self.thread.join(timeout=5)
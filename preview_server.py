@@ -0,0 +1,203 @@
+import cv2
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging_config import logger
+
+DEFAULT_PREVIEW_CONFIG = {
+    "enabled": False,
+    "host": "0.0.0.0",
+    "port": 8080,
+    "fps": 5,
+    "max_width": 960,
+    "quality": 70,
+}
+
+BOUNDARY = "vmsframe"
+
+
+class PreviewChannel:
+    """Latest display frame of one camera and its shared JPEG encoding."""
+
+    def __init__(self, name):
+        self.name = name
+        self.frame = None
+        self.frame_seq = 0
+        self.encoded_seq = 0
+        self.jpeg = None
+        self.clients = 0
+        self.cond = threading.Condition()
+
+
+class PreviewHub:
+    """
+    Encode-once fan-out of display frames to remote MJPEG viewers.
+
+    The frame loop only stores a reference to its display frame with
+    `publish()`. A single encoder thread JPEG-encodes each channel at most
+    once per preview tick, and only while that channel has viewers; every
+    connected client is then sent the same encoded bytes. With no viewers
+    the encoder sleeps and publishing costs one attribute assignment.
+    """
+
+    def __init__(self, fps=5, max_width=960, quality=70):
+        self.interval = 1.0 / fps
+        self.max_width = max_width
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]
+        self.channels = {}
+        self.lock = threading.Lock()
+        self.viewers = threading.Event()
+        self.running = True
+        self.encodes = 0
+        self.thread = threading.Thread(target=self.encode_loop, name="preview-encoder", daemon=True)
+        self.thread.start()
+
+    def channel(self, name):
+        with self.lock:
+            if name not in self.channels:
+                self.channels[name] = PreviewChannel(name)
+            return self.channels[name]
+
+    def publish(self, name, frame):
+        """Offer the latest display frame of a camera. The frame must not be modified afterwards."""
+        channel = self.channels.get(name) or self.channel(name)
+        channel.frame = frame
+        channel.frame_seq += 1
+
+    def add_client(self, channel):
+        with channel.cond:
+            channel.clients += 1
+        self.viewers.set()
+
+    def remove_client(self, channel):
+        with channel.cond:
+            channel.clients -= 1
+
+    def encode(self, frame):
+        height, width = frame.shape[:2]
+        if self.max_width and width > self.max_width:
+            size = (self.max_width, int(height * self.max_width / width))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode('.jpg', frame, self.encode_params)
+        return buffer.tobytes() if ok else None
+
+    def encode_loop(self):
+        next_tick = time.monotonic()
+        while self.running:
+            if not any(channel.clients for channel in list(self.channels.values())):
+                self.viewers.clear()
+                self.viewers.wait(timeout=1.0)
+                next_tick = time.monotonic()
+                continue
+
+            for channel in list(self.channels.values()):
+                if channel.clients == 0 or channel.frame is None or channel.frame_seq == channel.encoded_seq:
+                    continue
+                seq, frame = channel.frame_seq, channel.frame
+                try:
+                    jpeg = self.encode(frame)
+                except Exception as e:
+                    logger.error(f"Error encoding preview for {channel.name}: {e}")
+                    logger.error(traceback.format_exc())
+                    continue
+                if jpeg is None:
+                    continue
+                self.encodes += 1
+                with channel.cond:
+                    channel.jpeg = jpeg
+                    channel.encoded_seq = seq
+                    channel.cond.notify_all()
+
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
+
+    def stop(self):
+        self.running = False
+        self.viewers.set()
+        for channel in list(self.channels.values()):
+            with channel.cond:
+                channel.cond.notify_all()
+
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        hub = self.server.hub
+        if self.path == "/":
+            self.send_index(sorted(hub.channels))
+        elif self.path.startswith("/preview/"):
+            name = self.path[len("/preview/"):]
+            if name not in hub.channels:
+                self.send_error(404, f"Unknown camera {name}")
+                return
+            self.stream(hub, hub.channels[name])
+        else:
+            self.send_error(404)
+
+    def send_index(self, names):
+        images = "".join(f'<h3>{name}</h3><img src="/preview/{name}" style="max-width:100%">' for name in names)
+        body = f"<html><head><title>VMS Live Preview</title></head><body>{images}</body></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream(self, hub, channel):
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        hub.add_client(channel)
+        sent_seq = 0
+        try:
+            while hub.running:
+                with channel.cond:
+                    channel.cond.wait_for(lambda: channel.encoded_seq != sent_seq or not hub.running, timeout=5.0)
+                    if channel.encoded_seq == sent_seq:
+                        continue
+                    jpeg, sent_seq = channel.jpeg, channel.encoded_seq
+                self.wfile.write(
+                    f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode()
+                    + jpeg + b"\r\n"
+                )
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            hub.remove_client(channel)
+
+    def log_message(self, format, *args):
+        logger.info(f"Preview {self.address_string()} - {format % args}")
+
+
+class PreviewServer:
+    """HTTP server exposing one MJPEG stream per camera at /preview/<camera>."""
+
+    def __init__(self, host="0.0.0.0", port=8080, fps=5, max_width=960, quality=70):
+        self.hub = PreviewHub(fps, max_width, quality)
+        self.httpd = ThreadingHTTPServer((host, port), PreviewRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.hub = self.hub
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="preview-server", daemon=True)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["host"], config["port"], config["fps"], config["max_width"], config["quality"])
+
+    def start(self):
+        self.thread.start()
+        host, port = self.httpd.server_address[:2]
+        logger.info(f"Live preview available on http://{host}:{port}/")
+
+    def publish(self, name, frame):
+        self.hub.publish(name, frame)
+
+    def stop(self):
+        self.hub.stop()
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,150 @@
+import cv2
+import socket
+import struct
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from logging_config import logger
+
+HEADER = struct.Struct(">L")  # Same big-endian length prefix Recorder_PC expects
+
+DEFAULT_PUBLISHER_CONFIG = {
+    "enabled": False,
+    "host": "192.168.0.58",
+    "port": 12345,
+    "quality": 80,
+    "width": 0,  # 0 keeps the camera resolution
+    "height": 0,
+    "fps": 10,
+    "workers": 2,
+    "reconnect_period": 2.0,
+}
+
+
+class FramePublisher:
+    """
+    Streams frames to a Recorder_PC as length-prefixed JPEGs.
+
+    `submit()` never blocks: it rate-limits, hands the frame to a small
+    encoder pool and returns. Only the newest encoded frame is kept for the
+    sender thread, so when the link is slow stale frames are replaced instead
+    of queued, and a dead link just means frames are dropped while the sender
+    reconnects in the background.
+
+    Frames passed to `submit()` must not be modified afterwards.
+    """
+
+    def __init__(self, host, port, quality=80, width=0, height=0, fps=10, workers=2, reconnect_period=2.0):
+        self.address = (host, port)
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]
+        self.size = (width, height) if width and height else None
+        self.interval = 1.0 / fps if fps else 0
+        self.workers = workers
+        self.reconnect_period = reconnect_period
+        self.encoder = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="publisher-encode")
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.seq = 0
+        self.latest_seq = 0
+        self.latest_payload = None
+        self.last_submit = 0
+        self.sock = None
+        self.running = True
+        self.stats = {"submitted": 0, "dropped": 0, "sent": 0, "replaced": 0, "reconnects": 0}
+        self.sender = threading.Thread(target=self.send_loop, name="publisher-send", daemon=True)
+        self.sender.start()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["host"], config["port"], config["quality"], config["width"], config["height"],
+                   config["fps"], config["workers"], config["reconnect_period"])
+
+    def submit(self, frame):
+        """Queue a frame for publishing. Returns False if it was skipped."""
+        now = time.monotonic()
+        if now - self.last_submit < self.interval:
+            return False
+        with self.cond:
+            if self.in_flight >= self.workers:
+                self.stats["dropped"] += 1
+                return False
+            self.in_flight += 1
+            self.seq += 1
+            seq = self.seq
+        self.last_submit = now
+        self.stats["submitted"] += 1
+        self.encoder.submit(self.encode, seq, frame)
+        return True
+
+    def encode(self, seq, frame):
+        try:
+            if self.size is not None and (frame.shape[1], frame.shape[0]) != self.size:
+                frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+            ok, buffer = cv2.imencode('.jpg', frame, self.encode_params)
+            if not ok:
+                logger.warning("Publisher could not encode frame.")
+                return
+            payload = HEADER.pack(len(buffer)) + buffer.tobytes()
+            with self.cond:
+                if seq > self.latest_seq:
+                    if self.latest_payload is not None:
+                        self.stats["replaced"] += 1
+                    self.latest_seq = seq
+                    self.latest_payload = payload
+                    self.cond.notify()
+        except Exception as e:
+            logger.error(f"Error encoding frame for publishing: {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            with self.cond:
+                self.in_flight -= 1
+
+    def connect(self):
+        try:
+            sock = socket.create_connection(self.address, timeout=self.reconnect_period)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(5.0)
+            self.sock = sock
+            self.stats["reconnects"] += 1
+            logger.info(f"Publisher connected to {self.address[0]}:{self.address[1]}")
+            return True
+        except OSError as e:
+            logger.warning(f"Publisher could not connect to {self.address[0]}:{self.address[1]}: {e}")
+            return False
+
+    def disconnect(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def send_loop(self):
+        while self.running:
+            with self.cond:
+                while self.running and self.latest_payload is None:
+                    self.cond.wait(timeout=1.0)
+                payload, self.latest_payload = self.latest_payload, None
+            if payload is None:
+                continue
+
+            if self.sock is None and not self.connect():
+                time.sleep(self.reconnect_period)
+                continue
+            try:
+                self.sock.sendall(payload)
+                self.stats["sent"] += 1
+            except OSError as e:
+                logger.warning(f"Publisher connection lost: {e}")
+                self.disconnect()
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        self.encoder.shutdown(wait=False)
+        self.sender.join(timeout=2)
+        self.disconnect()
+        logger.info(f"Publisher stopped: {self.stats}")
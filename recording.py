@@ -0,0 +1,140 @@
+import cv2
+import os
+import time
+import traceback
+from datetime import datetime
+from logging_config import logger
+from config_loader import load_config_section
+from pacing import SegmentClock
+from tracing import traced
+
+DEFAULT_RECORDING_CONFIG = {
+    "mode": "continuous",   # "continuous" or "off"
+    "codec": "XVID",        # Any FourCC supported by the OpenCV build
+    "container": "avi",
+    "quality": 95,          # 0-100, honoured by codecs that support it (e.g. MJPG)
+    "fps": 0,               # 0 records at the processing FPS
+    "overview": {
+        "enabled": False,
+        "scale": 0.25,      # Fraction of the full resolution
+        "fps": 5,
+        "codec": "XVID",
+        "quality": 50,
+    },
+}
+
+
+def load_recording_config():
+    """Load the "recording" config section, filling in the nested overview defaults too."""
+    config = load_config_section('recording', DEFAULT_RECORDING_CONFIG)
+    config['overview'] = {**DEFAULT_RECORDING_CONFIG['overview'], **config.get('overview', {})}
+    return config
+
+
+def open_writer(output_path, codec, fps, frame_size, quality=None):
+    fourcc = cv2.VideoWriter_fourcc(*codec)
+    writer = cv2.VideoWriter(output_path, fourcc, fps, frame_size)
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open {codec} writer for {output_path} at {frame_size[0]}x{frame_size[1]}")
+    if quality is not None:
+        writer.set(cv2.VIDEOWRITER_PROP_QUALITY, quality)
+    return writer
+
+
+class VideoRecorder:
+    """
+    Writes one recording segment, sized from the first frame it receives.
+
+    Optionally writes a second "overview" track next to the full-quality
+    file: downscaled, at a lower frame rate and quality, named
+    `<segment>_overview.<container>`. Long-term archives can keep only the
+    overview and the full track around events.
+
+    Parameters:
+    ----------
+    output_path : str
+        Path of the full-quality segment.
+    fps : float
+        Frame rate of the full-quality track.
+    codec : str, optional
+        FourCC of the full-quality track (default is "XVID").
+    quality : int or None, optional
+        Encoder quality 0-100 where the codec supports it.
+    overview : dict or None, optional
+        Overview track settings ("enabled", "scale", "fps", "codec", "quality").
+    """
+
+    def __init__(self, output_path, fps, codec="XVID", quality=None, overview=None):
+        self.output_path = output_path
+        self.fps = fps
+        self.codec = codec
+        self.quality = quality
+        self.overview = overview if overview and overview.get("enabled") else None
+        self.overview_path = None
+        self.overview_clock = None
+        self.writer = None
+        self.overview_writer = None
+        self.frame_size = None
+        self.overview_size = None
+        self.frames_written = 0
+        self.frames_rejected = 0
+
+    @classmethod
+    def from_config(cls, output_path, fps, config):
+        return cls(output_path, fps, config["codec"], config["quality"], config["overview"])
+
+    def open(self, frame):
+        height, width = frame.shape[:2]
+        self.frame_size = (width, height)
+        self.writer = open_writer(self.output_path, self.codec, self.fps, self.frame_size, self.quality)
+        if self.overview is not None:
+            scale = self.overview["scale"]
+            # Most codecs need even dimensions
+            self.overview_size = (max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2))
+            root, ext = os.path.splitext(self.output_path)
+            self.overview_path = f"{root}_overview{ext}"
+            self.overview_writer = open_writer(self.overview_path, self.overview["codec"], self.overview["fps"],
+                                               self.overview_size, self.overview["quality"])
+            self.overview_clock = SegmentClock(self.overview["fps"])
+        logger.info(f"Recording {width}x{height} {self.codec} at {self.fps} fps to {self.output_path}")
+
+    @traced("recorder.write", "recording")
+    def write(self, frame, now=None):
+        if self.writer is None:
+            self.open(frame)
+        if (frame.shape[1], frame.shape[0]) != self.frame_size:
+            # OpenCV silently drops frames of the wrong size, so make it visible
+            self.frames_rejected += 1
+            if self.frames_rejected == 1:
+                logger.warning(f"Frame size {frame.shape[1]}x{frame.shape[0]} differs from segment size "
+                               f"{self.frame_size[0]}x{self.frame_size[1]}, resizing.")
+            frame = cv2.resize(frame, self.frame_size)
+        self.writer.write(frame)
+        self.frames_written += 1
+
+        if self.overview_writer is not None:
+            copies = self.overview_clock.frames_due(time.monotonic() if now is None else now)
+            if copies:
+                small = cv2.resize(frame, self.overview_size, interpolation=cv2.INTER_AREA)
+                for _ in range(copies):
+                    self.overview_writer.write(small)
+
+    def release(self):
+        try:
+            if self.writer is not None:
+                self.writer.release()
+            if self.overview_writer is not None:
+                self.overview_writer.release()
+        except Exception as e:
+            logger.error(f"Error releasing video writer: {e}")
+            logger.error(traceback.format_exc())
+        self.writer = None
+        self.overview_writer = None
+
+
+def segment_path(output_dir, container="avi", subdir=None):
+    """Return <output_dir>[/<subdir>]/<date>/<HH-MM-SS>.<container>, creating the directory."""
+    now = datetime.now()
+    date_dir = os.path.join(output_dir, *([subdir] if subdir else []), now.strftime("%Y-%m-%d"))
+    os.makedirs(date_dir, exist_ok=True)
+    return os.path.join(date_dir, now.strftime('%H-%M-%S') + '.' + container)
@@ -0,0 +1,206 @@
+import json
+import numpy as np
+import os
+import queue
+import threading
+import traceback
+from datetime import datetime, timedelta
+from logging_config import logger
+
+DEFAULT_SCORE_STORE_CONFIG = {
+    "enabled": True,
+    "path": "results/scores",
+    "chunk_size": 1024,        # Samples buffered in memory before a write
+    "flush_interval": 10.0,    # Seconds before a partly filled chunk is written anyway
+}
+
+# Detector states stored with each sample
+STATE_UNKNOWN = 0
+STATE_VIBRATING = 1
+STATE_SETTLING = 2
+STATE_STABLE = 3
+STATE_FROZEN = 4
+
+# 11 bytes per sample: milliseconds since local midnight, camera code, ROI index, state, score
+SAMPLE_DTYPE = np.dtype([
+    ("t_ms", "<u4"),
+    ("camera", "u1"),
+    ("roi", "u1"),
+    ("state", "u1"),
+    ("score", "<f4"),
+])
+
+
+def day_paths(root, day):
+    return os.path.join(root, f"{day}.npy"), os.path.join(root, f"{day}.json")
+
+
+def day_start(day):
+    """Epoch seconds of local midnight for a "YYYY-MM-DD" string."""
+    return datetime.strptime(day, "%Y-%m-%d").timestamp()
+
+
+def load_day_meta(day, root=DEFAULT_SCORE_STORE_CONFIG["path"]):
+    _, meta_path = day_paths(root, day)
+    with open(meta_path, "r") as file:
+        return json.load(file)
+
+
+def load_day(day, root=DEFAULT_SCORE_STORE_CONFIG["path"]):
+    """
+    Memory-map the samples recorded on `day` ("YYYY-MM-DD").
+
+    Returns (samples, meta). `samples` is a read-only structured array view of
+    the file and nothing is copied into RAM until it is accessed.
+    `meta["cameras"]` maps camera codes back to names.
+    """
+    data_path, _ = day_paths(root, day)
+    meta = load_day_meta(day, root)
+    samples = np.load(data_path, mmap_mode="r")[:meta["count"]]
+    return samples, meta
+
+
+def sample_times(samples, day):
+    """Epoch timestamps (float64 seconds) of the given samples."""
+    return day_start(day) + samples["t_ms"] / 1000.0
+
+
+class ScoreStore:
+    """
+    Append-only store of per-frame motion scores.
+
+    `append()` only writes into a preallocated in-memory chunk; full or
+    stale chunks are handed to a writer thread, which copies them into a
+    per-day memory-mapped `.npy` file under `root` and updates the sample
+    count in the day's `.json` sidecar. Day files are preallocated for a
+    full day at the expected rate and doubled if they fill up.
+    """
+
+    def __init__(self, root="results/scores", chunk_size=1024, flush_interval=10.0, expected_fps=20):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.day_capacity = max(chunk_size, int(expected_fps * 86400))
+        os.makedirs(root, exist_ok=True)
+        self.camera_codes = {}
+        self.chunk = np.zeros(chunk_size, dtype=SAMPLE_DTYPE)
+        self.fill = 0
+        self.chunk_started = 0
+        self.day = None
+        self.day_begin = 0
+        self.day_end = 0
+        self.dropped = 0
+        self.jobs = queue.Queue(maxsize=256)
+        self.thread = threading.Thread(target=self.run, name="score-store", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_config(cls, config, expected_fps):
+        return cls(config["path"], config["chunk_size"], config["flush_interval"], expected_fps)
+
+    def append(self, ts, camera, roi, score, state):
+        if not self.day_begin <= ts < self.day_end:
+            self.flush()
+            moment = datetime.fromtimestamp(ts)
+            self.day = moment.strftime("%Y-%m-%d")
+            self.day_begin = day_start(self.day)
+            self.day_end = (datetime.strptime(self.day, "%Y-%m-%d") + timedelta(days=1)).timestamp()
+
+        code = self.camera_codes.get(camera)
+        if code is None:
+            code = self.camera_codes[camera] = len(self.camera_codes)
+
+        if self.fill == 0:
+            self.chunk_started = ts
+        self.chunk[self.fill] = (int((ts - self.day_begin) * 1000), code, roi, state, score)
+        self.fill += 1
+        if self.fill == self.chunk_size or ts - self.chunk_started >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Hand the current chunk to the writer thread."""
+        if self.fill == 0:
+            return
+        cameras = sorted(self.camera_codes, key=self.camera_codes.get)
+        try:
+            self.jobs.put_nowait((self.day, self.chunk[:self.fill], cameras))
+        except queue.Full:
+            self.dropped += self.fill
+            logger.warning(f"Score store is behind, dropped {self.fill} samples.")
+        self.chunk = np.zeros(self.chunk_size, dtype=SAMPLE_DTYPE)
+        self.fill = 0
+
+    def run(self):
+        # The writer thread holds the only reference to the day's mapping
+        self.day_samples = None
+        self.day_meta = None
+        self.written_day = None
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            day, rows, cameras = job
+            try:
+                if day != self.written_day:
+                    self.open_day(day)
+                self.write_rows(rows, cameras)
+            except Exception as e:
+                logger.error(f"Error writing motion scores: {e}")
+                logger.error(traceback.format_exc())
+                self.written_day = None
+        self.day_samples = None
+
+    def open_day(self, day):
+        self.day_samples = None
+        data_path, meta_path = day_paths(self.root, day)
+        if os.path.exists(data_path) and os.path.exists(meta_path):
+            with open(meta_path, "r") as file:
+                self.day_meta = json.load(file)
+            self.day_samples = np.load(data_path, mmap_mode="r+")
+        else:
+            self.day_meta = {"count": 0, "cameras": []}
+            self.day_samples = np.lib.format.open_memmap(data_path, mode="w+", dtype=SAMPLE_DTYPE,
+                                                         shape=(self.day_capacity,))
+        self.written_day = day
+
+    def write_rows(self, rows, cameras):
+        meta = self.day_meta
+        # Translate this process's camera codes to the codes stored for the day
+        remap = np.zeros(256, dtype=np.uint8)
+        for code, name in enumerate(cameras):
+            if name not in meta["cameras"]:
+                meta["cameras"].append(name)
+            remap[code] = meta["cameras"].index(name)
+        rows = rows.copy()
+        rows["camera"] = remap[rows["camera"]]
+
+        count = meta["count"]
+        if count + len(rows) > len(self.day_samples):
+            self.grow(count)
+        self.day_samples[count:count + len(rows)] = rows
+        self.day_samples.flush()
+        meta["count"] = count + len(rows)
+
+        _, meta_path = day_paths(self.root, self.written_day)
+        with open(meta_path + ".tmp", "w") as file:
+            json.dump(meta, file)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def grow(self, count):
+        data_path, _ = day_paths(self.root, self.written_day)
+        tmp_path = data_path + ".tmp.npy"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=SAMPLE_DTYPE,
+                                          shape=(len(self.day_samples) * 2,))
+        grown[:count] = self.day_samples[:count]
+        grown.flush()
+        # Release both mappings before replacing the file (required on Windows)
+        del grown
+        self.day_samples = None
+        os.replace(tmp_path, data_path)
+        self.day_samples = np.load(data_path, mmap_mode="r+")
+        logger.info(f"Grew motion score file {data_path}.")
+
+    def stop(self):
+        self.flush()
+        self.jobs.put(None)
+        self.thread.join(timeout=10)
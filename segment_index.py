@@ -0,0 +1,308 @@
+import argparse
+import cv2
+import os
+import queue
+import sqlite3
+import struct
+import threading
+import time
+import traceback
+from datetime import datetime
+from logging_config import logger
+from tracing import tracer
+
+DEFAULT_INDEX_PATH = 'results/index.db'
+AVIIF_KEYFRAME = 0x10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    camera TEXT,
+    path TEXT UNIQUE,
+    start_ts REAL,
+    end_ts REAL,
+    frame_count INTEGER,
+    fps REAL
+);
+CREATE INDEX IF NOT EXISTS segments_time ON segments (camera, start_ts);
+CREATE TABLE IF NOT EXISTS keyframes (
+    segment_id INTEGER,
+    frame_no INTEGER,
+    byte_offset INTEGER,
+    PRIMARY KEY (segment_id, frame_no)
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL,
+    camera TEXT,
+    kind TEXT,
+    segment_id INTEGER,
+    frame_no INTEGER,
+    snapshot TEXT
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (ts);
+"""
+
+
+def read_avi_keyframes(path):
+    """
+    Return [(frame_no, byte_offset)] for the keyframes of an AVI, read from
+    its idx1 chunk. Only the chunk headers and the index are read, not the
+    video data. Returns an empty list if the file has no idx1.
+    """
+    keyframes = []
+    with open(path, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'AVI ':
+            return keyframes
+        movi_start = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return keyframes
+            fourcc, size = header[:4], struct.unpack('<I', header[4:])[0]
+            if fourcc == b'LIST':
+                list_type = f.read(4)
+                if list_type == b'movi':
+                    movi_start = f.tell() - 4
+                f.seek(size - 4 + (size % 2), os.SEEK_CUR)
+            elif fourcc == b'idx1':
+                index = f.read(size)
+                break
+            else:
+                f.seek(size + (size % 2), os.SEEK_CUR)
+
+    frame_no = 0
+    base = None
+    for ckid, flags, offset, _ in struct.iter_unpack('<4sIII', index[:len(index) - len(index) % 16]):
+        if ckid[2:4] not in (b'dc', b'db'):
+            continue
+        if base is None:
+            # idx1 offsets are usually relative to the 'movi' fourcc, but some writers use absolute offsets
+            base = movi_start if movi_start is not None and offset < movi_start else 0
+        if flags & AVIIF_KEYFRAME:
+            keyframes.append((frame_no, base + offset))
+        frame_no += 1
+    return keyframes
+
+
+class SegmentIndex:
+    """
+    SQLite index of recorded segments, their keyframes and detector events.
+
+    Writes from the frame loop are queued and applied on a background thread
+    that owns the database connection, so indexing never costs frame time.
+    Reading idx1 for keyframe offsets also happens there, once per closed
+    segment.
+    """
+
+    def __init__(self, db_path=DEFAULT_INDEX_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="segment-index", daemon=True)
+        self.thread.start()
+
+    def open_segment(self, camera, path, start_ts, fps):
+        self.jobs.put(("open", (camera, os.path.abspath(path), start_ts, fps)))
+
+    def close_segment(self, path, end_ts, frame_count):
+        self.jobs.put(("close", (os.path.abspath(path), end_ts, frame_count)))
+
+    def add_event(self, kind, ts, camera, segment_path=None, frame_no=None, snapshot=None):
+        path = os.path.abspath(segment_path) if segment_path else None
+        snapshot = os.path.abspath(snapshot) if snapshot else None
+        self.jobs.put(("event", (ts, camera, kind, path, frame_no, snapshot)))
+
+    def update_segment(self, path, frame_count, fps):
+        """Refresh a segment after its file has been rewritten (e.g. compacted)."""
+        self.jobs.put(("update", (os.path.abspath(path), frame_count, fps)))
+
+    def run(self):
+        conn = connect(self.db_path)
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            kind, args = job
+            start = tracer.begin()
+            try:
+                if kind == "open":
+                    conn.execute("INSERT OR REPLACE INTO segments (camera, path, start_ts, fps, frame_count) VALUES (?, ?, ?, ?, 0)", args)
+                elif kind == "close":
+                    path, end_ts, frame_count = args
+                    conn.execute("UPDATE segments SET end_ts = ?, frame_count = ? WHERE path = ?", (end_ts, frame_count, path))
+                    self.index_keyframes(conn, path)
+                elif kind == "update":
+                    path, frame_count, fps = args
+                    conn.execute("UPDATE segments SET frame_count = ?, fps = ? WHERE path = ?", (frame_count, fps, path))
+                    self.index_keyframes(conn, path)
+                elif kind == "event":
+                    ts, camera, event_kind, path, frame_no, snapshot = args
+                    conn.execute(
+                        "INSERT INTO events (ts, camera, kind, segment_id, frame_no, snapshot) "
+                        "VALUES (?, ?, ?, (SELECT id FROM segments WHERE path = ?), ?, ?)",
+                        (ts, camera, event_kind, path, frame_no, snapshot))
+                conn.commit()
+                tracer.complete("index." + kind, start, None, "db")
+            except Exception as e:
+                logger.error(f"Error updating segment index ({kind}): {e}")
+                logger.error(traceback.format_exc())
+        conn.close()
+
+    def index_keyframes(self, conn, path):
+        row = conn.execute("SELECT id FROM segments WHERE path = ?", (path,)).fetchone()
+        if row is None or not os.path.exists(path):
+            return
+        keyframes = read_avi_keyframes(path)
+        conn.execute("DELETE FROM keyframes WHERE segment_id = ?", (row[0],))
+        conn.executemany("INSERT INTO keyframes (segment_id, frame_no, byte_offset) VALUES (?, ?, ?)",
+                         [(row[0], frame_no, offset) for frame_no, offset in keyframes])
+
+    def stop(self):
+        self.jobs.put(None)
+        self.thread.join(timeout=10)
+
+
+def connect(db_path=DEFAULT_INDEX_PATH):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    # Migration: indexes created before event snapshots have no snapshot column
+    if "snapshot" not in [row["name"] for row in conn.execute("PRAGMA table_info(events)")]:
+        conn.execute("ALTER TABLE events ADD COLUMN snapshot TEXT")
+    return conn
+
+
+def find_segments(conn, start_ts, end_ts, camera=None):
+    """
+    Return the segments overlapping [start_ts, end_ts] with the frame range to
+    read from each and the nearest keyframe at or before the first frame.
+    """
+    query = "SELECT * FROM segments WHERE start_ts <= ? AND COALESCE(end_ts, ?) >= ?"
+    params = [end_ts, time.time(), start_ts]
+    if camera is not None:
+        query += " AND camera = ?"
+        params.append(camera)
+    results = []
+    for segment in conn.execute(query + " ORDER BY start_ts", params).fetchall():
+        fps = segment["fps"] or 1
+        last_frame = max(0, (segment["frame_count"] or 0) - 1)
+        first = min(last_frame, max(0, int((start_ts - segment["start_ts"]) * fps)))
+        last = min(last_frame, max(0, int((end_ts - segment["start_ts"]) * fps)))
+        keyframe = conn.execute(
+            "SELECT frame_no, byte_offset FROM keyframes WHERE segment_id = ? AND frame_no <= ? "
+            "ORDER BY frame_no DESC LIMIT 1", (segment["id"], first)).fetchone()
+        results.append({
+            "segment_id": segment["id"],
+            "camera": segment["camera"],
+            "path": segment["path"],
+            "fps": fps,
+            "first_frame": first,
+            "last_frame": last,
+            "keyframe": keyframe["frame_no"] if keyframe else None,
+            "keyframe_offset": keyframe["byte_offset"] if keyframe else None,
+        })
+    return results
+
+
+def get_event(conn, event_id):
+    return conn.execute("SELECT * FROM events WHERE id = ?", (event_id,)).fetchone()
+
+
+def export_clip(ranges, output_path):
+    """Copy the frame ranges returned by find_segments() into one video file."""
+    writer = None
+    written = 0
+    try:
+        for item in ranges:
+            capture = cv2.VideoCapture(item["path"])
+            if not capture.isOpened():
+                logger.error(f"Could not open segment {item['path']}")
+                continue
+            capture.set(cv2.CAP_PROP_POS_FRAMES, item["first_frame"])
+            for _ in range(item["last_frame"] - item["first_frame"] + 1):
+                ret, frame = capture.read()
+                if not ret:
+                    break
+                if writer is None:
+                    fourcc = cv2.VideoWriter_fourcc(*'XVID')
+                    writer = cv2.VideoWriter(output_path, fourcc, item["fps"], (frame.shape[1], frame.shape[0]))
+                writer.write(frame)
+                written += 1
+            capture.release()
+    finally:
+        if writer is not None:
+            writer.release()
+    return written
+
+
+def parse_time(value):
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timestamp()
+
+
+def format_time(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Look up and export recorded footage from the segment index.")
+    parser.add_argument("--db", default=DEFAULT_INDEX_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    find = commands.add_parser("find", help="List segments and seek positions for a time range")
+    find.add_argument("--start", required=True, help='"YYYY-MM-DD HH:MM:SS"')
+    find.add_argument("--end", required=True, help='"YYYY-MM-DD HH:MM:SS"')
+    find.add_argument("--camera")
+
+    events = commands.add_parser("events", help="List detector events in a time range")
+    events.add_argument("--start", required=True)
+    events.add_argument("--end", required=True)
+
+    export = commands.add_parser("export", help="Export a trimmed clip for a time range or an event")
+    export.add_argument("--event", type=int)
+    export.add_argument("--before", type=float, default=10.0, help="Seconds before the event")
+    export.add_argument("--after", type=float, default=10.0, help="Seconds after the event")
+    export.add_argument("--start")
+    export.add_argument("--end")
+    export.add_argument("--camera")
+    export.add_argument("-o", "--output", required=True)
+
+    args = parser.parse_args()
+    conn = connect(args.db)
+
+    if args.command == "events":
+        for event in conn.execute("SELECT * FROM events WHERE ts BETWEEN ? AND ? ORDER BY ts",
+                                  (parse_time(args.start), parse_time(args.end))):
+            print(f"{event['id']:>6}  {format_time(event['ts'])}  {event['camera']}  {event['kind']}  "
+                  f"segment={event['segment_id']} frame={event['frame_no']}")
+        return
+
+    camera = args.camera
+    if args.command == "export" and args.event is not None:
+        event = get_event(conn, args.event)
+        if event is None:
+            parser.error(f"No event with id {args.event}")
+        start_ts, end_ts = event["ts"] - args.before, event["ts"] + args.after
+        camera = camera or event["camera"]
+    elif args.start and args.end:
+        start_ts, end_ts = parse_time(args.start), parse_time(args.end)
+    else:
+        parser.error("Give either --event or both --start and --end")
+
+    ranges = find_segments(conn, start_ts, end_ts, camera)
+    if args.command == "find":
+        for item in ranges:
+            print(f"{item['path']}  frames {item['first_frame']}-{item['last_frame']} @ {item['fps']} fps  "
+                  f"keyframe {item['keyframe']} (byte {item['keyframe_offset']})")
+        return
+
+    if not ranges:
+        print("No recorded segments cover that time range.")
+        return
+    written = export_clip(ranges, args.output)
+    print(f"Exported {written} frames from {len(ranges)} segment(s) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
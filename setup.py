@@ -12,7 +12,7 @@ executables = [Executable("app.py", base=base)]
 # Define the options for the build
 build_options = {
     "packages": ["cv2", "time", "numpy", "os", "datetime", "json", "traceback"],
-    "includes": ["cam", "logging_config", "database", "plc", "file_verifier"],
+    "includes": ["cam", "logging_config", "database", "plc", "file_verifier", "pacing", "config_loader", "publisher", "control_api", "preview_server", "segment_index", "recording", "score_store", "mp_pipeline", "startup", "event_spool", "vibration_state", "frame_graph", "aggregator_client", "snapshots", "compactor", "mosaic", "tracing", "plc_gate", "plc_writer"],
     "include_files": [
         ("data/storage_limit.json", "data/storage_limit.json"),
         ("data/roi.json", "data/roi.json"),
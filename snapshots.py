@@ -0,0 +1,111 @@
+import cv2
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logging_config import logger
+
+DEFAULT_SNAPSHOT_CONFIG = {
+    "enabled": True,
+    "path": "results/snapshots",
+    "width": 640,         # Width of the full-frame part of the snapshot
+    "quality": 80,        # JPEG quality
+    "workers": 1,
+    "queue_size": 8,      # Snapshots waiting to be encoded before new ones are dropped
+}
+
+
+class SnapshotWriter:
+    """
+    Writes small JPEG snapshots of detector events on a background pool.
+
+    `submit()` only picks the file name and hands the frame to the encoder
+    pool, so the frame thread pays nothing for scaling, annotating or
+    encoding. At most `queue_size` snapshots wait at a time; further ones are
+    dropped and counted rather than piling up. A snapshot is the full frame
+    scaled to `width` with the ROI marked, the ROI crop at the same height
+    beside it, and a caption with the event, score, camera and time.
+
+    Frames passed to `submit()` must not be modified afterwards.
+
+    Parameters:
+    ----------
+    path : str
+        Root directory; snapshots go to `<path>/<YYYY-MM-DD>/`.
+    width : int, optional
+        Width of the scaled full frame (default is 640).
+    quality : int, optional
+        JPEG quality (default is 80).
+    workers : int, optional
+        Encoder threads (default is 1).
+    queue_size : int, optional
+        Maximum snapshots queued or being encoded (default is 8).
+    """
+
+    def __init__(self, path, width=640, quality=80, workers=1, queue_size=8):
+        self.path = path
+        self.width = width
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]
+        self.queue_size = queue_size
+        self.encoder = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot-encode")
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.stats = {"submitted": 0, "written": 0, "dropped": 0, "failed": 0}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["path"], config["width"], config["quality"], config["workers"], config["queue_size"])
+
+    def submit(self, kind, frame, roi, score, ts, camera=None):
+        """Queue a snapshot and return the path it will be written to, or None if it was dropped."""
+        with self.lock:
+            if self.pending >= self.queue_size:
+                self.stats["dropped"] += 1
+                return None
+            self.pending += 1
+            self.stats["submitted"] += 1
+        moment = datetime.fromtimestamp(ts)
+        name = f"{moment.strftime('%H%M%S_%f')[:-3]}_{camera or 'cam'}_{kind}.jpg"
+        path = os.path.join(self.path, moment.strftime('%Y-%m-%d'), name)
+        self.encoder.submit(self.write, path, kind, frame, dict(roi), score, moment, camera)
+        return path
+
+    def compose(self, kind, frame, roi, score, moment, camera):
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.width / width)
+        full = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+        x, y, w, h = (int(roi[key] * scale) for key in ("x", "y", "width", "height"))
+        cv2.rectangle(full, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        crop = frame[roi['y']:roi['y'] + roi['height'], roi['x']:roi['x'] + roi['width']]
+        if crop.size:
+            crop_width = max(1, int(crop.shape[1] * full.shape[0] / crop.shape[0]))
+            crop = cv2.resize(crop, (crop_width, full.shape[0]), interpolation=cv2.INTER_AREA)
+            full = cv2.hconcat([full, crop])
+        caption = f"{kind}  score {score:.1f}  {camera or ''}  {moment.strftime('%Y-%m-%d %H:%M:%S')}"
+        cv2.rectangle(full, (0, 0), (full.shape[1], 28), (0, 0, 0), -1)
+        cv2.putText(full, caption, (8, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1, cv2.LINE_AA)
+        return full
+
+    def write(self, path, kind, frame, roi, score, moment, camera):
+        try:
+            image = self.compose(kind, frame, roi, score, moment, camera)
+            ok, buffer = cv2.imencode('.jpg', image, self.encode_params)
+            if not ok:
+                raise RuntimeError("JPEG encoding failed")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(buffer.tobytes())
+            os.replace(tmp_path, path)  # A linked snapshot is either complete or absent
+            written = True
+        except Exception as e:
+            written = False
+            logger.error(f"Error writing snapshot {path}: {e}")
+            logger.error(traceback.format_exc())
+        with self.lock:
+            self.stats["written" if written else "failed"] += 1
+            self.pending -= 1
+
+    def stop(self):
+        self.encoder.shutdown(wait=True)
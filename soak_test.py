@@ -0,0 +1,369 @@
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+try:
+    import psutil  # Optional: open handles and RSS on Windows
+except ImportError:
+    psutil = None
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def open_fds():
+    """Open file descriptors (handles on Windows), or None if they cannot be counted."""
+    if psutil is not None:
+        process = psutil.Process()
+        return process.num_handles() if os.name == "nt" else process.num_fds()
+    if os.path.isdir("/proc/self/fd"):
+        return len(os.listdir("/proc/self/fd"))
+    return None
+
+
+def rss_mb():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1e6
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def make_test_video(path, roi, fps=20, seconds=20, size=(1280, 720), noise=2.0):
+    """
+    Write a clip that vibrates inside the ROI for its first quarter and is
+    still afterwards. Every frame gets its own sensor noise (standard
+    deviation `noise`), so the still part looks like a live camera and not
+    like a frozen one.
+    """
+    width, height = max(size[0], roi["x"] + roi["width"] + 10), max(size[1], roi["y"] + roi["height"] + 10)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, (height, width, 3), np.uint8)
+    sensor = np.empty((height, width, 3), np.int16)
+    for i in range(int(fps * seconds)):
+        np.copyto(sensor, rng.normal(0, noise, sensor.shape), casting="unsafe")
+        frame = cv2.add(base, sensor, dtype=cv2.CV_8U)
+        shake = 12 if i < fps * seconds / 4 and i % 2 else 0
+        x, y = roi["x"] + roi["width"] // 4 + shake, roi["y"] + roi["height"] // 4
+        cv2.rectangle(frame, (x, y), (x + roi["width"] // 2, y + roi["height"] // 2), (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+
+class Chaos:
+    """
+    Periodic fault injection: a camera source disappears for a while, the PLC
+    stops answering, or the database refuses writes.
+
+    `probe()` returns a counter that grows when the app runs into the fault
+    (failed reads, refused events, failed writes). A phase lasts `seconds`,
+    and longer if needed, up to `grace` more seconds, until the counter has
+    grown. A phase in which it never grew did not exercise its path and is
+    counted in `missed`.
+    """
+
+    def __init__(self, name, every, seconds, start, stop, probe=None, grace=60.0):
+        self.name = name
+        self.every = every
+        self.seconds = seconds
+        self.start = start
+        self.stop = stop
+        self.probe = probe
+        self.grace = grace
+        self.active_until = None
+        self.give_up_at = None
+        self.probe_start = None
+        self.next_at = time.monotonic() + every if every else None
+        self.count = 0
+        self.missed = 0
+
+    def exercised(self):
+        return self.probe is None or self.probe() > self.probe_start
+
+    def tick(self, now):
+        if self.active_until is not None:
+            if now >= self.active_until and (self.exercised() or now >= self.give_up_at):
+                self.end()
+        elif self.next_at is not None and now >= self.next_at:
+            self.probe_start = self.probe() if self.probe is not None else None
+            self.start()
+            self.count += 1
+            self.active_until = now + self.seconds
+            self.give_up_at = self.active_until + self.grace
+            self.next_at = now + self.every
+
+    def end(self, judge=True):
+        """End the current phase; `judge=False` when the run itself ends and cuts it short."""
+        if self.active_until is not None:
+            if judge and not self.exercised():
+                self.missed += 1
+            self.stop()
+            self.active_until = None
+
+
+class SoakDatabase:
+    """
+    Database subsystem for soak runs: stores nothing and fails while `down`.
+    `recovered` counts records stored after an outage had refused some.
+    """
+
+    def __init__(self):
+        self.down = False
+        self.stored = 0
+        self.refused = 0
+        self.backlog = False
+        self.recovered = 0
+
+    def store_spooled_events(self, records):
+        if self.down:
+            self.refused += len(records)
+            self.backlog = True
+            raise ConnectionError("Simulated database outage")
+        self.stored += len(records)
+        if self.backlog:
+            self.recovered += len(records)
+            self.backlog = False
+
+
+def rename_source(path, away):
+    """Make a camera file vanish (or come back) like a camera dropping off the network."""
+    source, target = (path, path + ".away") if away else (path + ".away", path)
+    try:
+        os.replace(source, target)
+    except OSError:
+        pass  # Still open on Windows; the next dropout tries again
+
+
+def prepare_workdir(workdir, videos, cameras, config_overrides):
+    os.makedirs(workdir, exist_ok=True)
+    shutil.copytree(os.path.join(REPO_DIR, "data"), os.path.join(workdir, "data"), dirs_exist_ok=True)
+    with open(os.path.join(workdir, "data", "roi.json")) as file:
+        roi = json.load(file)["roi"]
+    if not videos:
+        videos = [os.path.join(workdir, "soak_source.avi")]
+        make_test_video(videos[0], roi)
+    camera_config = {}
+    for i in range(cameras):
+        path = os.path.join(workdir, f"soak_cam{i + 1}.avi")
+        shutil.copyfile(videos[i % len(videos)], path)
+        camera_config[f"SOAK{i + 1}"] = path
+    with open(os.path.join(workdir, "data", "cameras.json"), "w") as file:
+        json.dump(camera_config, file, indent=4)
+    config_path = os.path.join(workdir, "data", "config.json")
+    with open(config_path) as file:
+        config = json.load(file)
+    for key, value in config_overrides.items():
+        if isinstance(value, dict):
+            config.setdefault(key, {}).update(value)
+        else:
+            config[key] = value
+    with open(config_path, "w") as file:
+        json.dump(config, file, indent=4)
+    return camera_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the full VideoProcessor loop for a long time and fail on resource growth.")
+    parser.add_argument("--duration", type=float, default=3600, help="Wall-clock seconds to run")
+    parser.add_argument("--fps", type=float, default=50, help="Loop rate; above the plant rate to compress time")
+    parser.add_argument("--segment-seconds", type=float, default=20, help="Recording segment length (plant: 180)")
+    parser.add_argument("--stable-threshold", type=float, default=2, help="Seconds of quiet before STABLE")
+    parser.add_argument("--cameras", type=int, default=1, help="Number of simulated cameras")
+    parser.add_argument("--video", action="append", default=[], help="Source clip(s) to loop (default: a generated clip)")
+    parser.add_argument("--workdir", help="Working directory for data/, results/ and logs/ (default: a temp dir)")
+    parser.add_argument("--sample-interval", type=float, default=30, help="Seconds between resource samples")
+    parser.add_argument("--warmup", type=float, default=60, help="Seconds before the baseline sample")
+    parser.add_argument("--dropout-every", type=float, default=120, help="Seconds between camera dropouts (0 disables)")
+    parser.add_argument("--dropout-seconds", type=float, default=5, help="Length of a camera dropout")
+    parser.add_argument("--plc-outage-every", type=float, default=300, help="Seconds between PLC outages (0 disables)")
+    parser.add_argument("--db-outage-every", type=float, default=240, help="Seconds between database outages (0 disables)")
+    parser.add_argument("--outage-seconds", type=float, default=30, help="Length of a PLC or database outage")
+    parser.add_argument("--no-plc", action="store_true", help="Run without the PLC simulator")
+    parser.add_argument("--control-port", type=int, default=12399, help="Control API port for the soak instance")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Skip Python allocation tracking (faster)")
+    parser.add_argument("--top", type=int, default=10, help="Allocation sites reported per sample")
+    parser.add_argument("--max-thread-growth", type=int, default=2)
+    parser.add_argument("--max-fd-growth", type=int, default=16)
+    parser.add_argument("--max-rss-growth-mb", type=float, default=100)
+    parser.add_argument("--max-traced-growth-mb", type=float, default=32)
+    parser.add_argument("--min-fps-ratio", type=float, default=0.8,
+                        help="Achieved loop rate after the warmup, as a fraction of --fps")
+    parser.add_argument("--min-events", type=int, default=1, help="Events the database must have stored by the end")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="vms_soak_"))
+    with open(os.path.join(REPO_DIR, "data", "config.json")) as file:
+        plant_fps = json.load(file).get("fps", 20)
+    camera_config = prepare_workdir(workdir, [os.path.abspath(v) for v in args.video], args.cameras, {
+        "fps": args.fps,
+        "video_duration": args.segment_seconds,
+        "stable_threshold": args.stable_threshold,
+        "control_api": {"host": "127.0.0.1", "port": args.control_port},
+        "preview": {"enabled": False},
+        "publisher": {"enabled": False},
+    })
+    os.chdir(workdir)  # The app uses data/, results/ and logs/ relative paths
+    sys.path.insert(0, REPO_DIR)
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    from logging_config import logger
+    import app
+
+    simulator = None
+    if not args.no_plc:
+        from plc_simulator import PLCSimulator
+        simulator = PLCSimulator(seed=1, transport="auto").start()
+    database = SoakDatabase()
+
+    class SoakProcessor(app.VideoProcessor):
+        def start_subsystems(self):
+            if simulator is not None:
+                self.subsystems.start('plc', lambda: app.connect_plc(simulator.port), retry_period=2.0)
+            self.subsystems.start('database', lambda: database, retry_period=2.0)
+
+    threads_before = threading.active_count()
+    fds_before = open_fds()
+    mes_score, fps, video_duration, stable_threshold, motion_blur = app.load_config()
+    processor = SoakProcessor(mes_score, fps, video_duration, stable_threshold, motion_blur, headless=True)
+    loop = threading.Thread(target=processor.process, name="soak-loop", daemon=True)
+    loop.start()
+
+    def camera_failures():
+        return sum(thread.connection.reconnects for thread in processor.camera_threads
+                   if getattr(thread, "connection", None) is not None)
+
+    # A renamed clip is only missed at its next reopen, so a dropout lasts until a read has failed
+    chaos = [Chaos("camera dropout", args.dropout_every, args.dropout_seconds,
+                   lambda: [rename_source(path, True) for path in camera_config.values()],
+                   lambda: [rename_source(path, False) for path in camera_config.values()],
+                   probe=camera_failures),
+             Chaos("database outage", args.db_outage_every, args.outage_seconds,
+                   lambda: setattr(database, "down", True), lambda: setattr(database, "down", False),
+                   probe=lambda: database.refused)]
+    if simulator is not None:
+        chaos.append(Chaos("PLC outage", args.plc_outage_every, args.outage_seconds,
+                           lambda: setattr(simulator, "timeout_rate", 1.0), lambda: setattr(simulator, "timeout_rate", 0.0),
+                           probe=lambda: processor.plc_writer.stats["failures"]))
+
+    report_path = os.path.join(workdir, "soak_report.jsonl")
+    report = open(report_path, "w")
+    started = time.monotonic()
+    baseline = baseline_snapshot = None
+    next_sample = started + min(args.warmup, args.sample_interval)
+
+    def sample():
+        gc.collect()
+        row = {
+            "elapsed": round(time.monotonic() - started, 1),
+            "frames": processor.cnt_frame,
+            "plant_hours": round(processor.cnt_frame / plant_fps / 3600, 3),
+            "threads": threading.active_count(),
+            "fds": open_fds(),
+            "rss_mb": rss_mb(),
+            "traced_mb": tracemalloc.get_traced_memory()[0] / 1e6 if tracemalloc.is_tracing() else None,
+            "camera_reconnects": camera_failures(),
+            "event_spool": processor.event_spool.stats(),
+        }
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        return row, snapshot
+
+    print(f"Soak run in {workdir} for {args.duration:.0f} s at {args.fps:g} fps "
+          f"({args.fps / plant_fps:.1f}x plant frame rate, {args.segment_seconds:g} s segments)")
+    try:
+        while time.monotonic() - started < args.duration and loop.is_alive():
+            now = time.monotonic()
+            for item in chaos:
+                item.tick(now)
+            if now >= next_sample:
+                row, snapshot = sample()
+                if baseline is None and now - started >= args.warmup:
+                    baseline, baseline_snapshot = row, snapshot
+                    row["baseline"] = True
+                elif baseline_snapshot is not None and snapshot is not None:
+                    stats = snapshot.compare_to(baseline_snapshot, "lineno")[:args.top]
+                    row["top_growth"] = [f"{stat.traceback[0].filename}:{stat.traceback[0].lineno} "
+                                         f"{stat.size_diff / 1e3:+.1f} kB ({stat.count_diff:+d} blocks)" for stat in stats]
+                report.write(json.dumps(row) + "\n")
+                report.flush()
+                print(f"[{row['elapsed']:>8.0f} s] frames {row['frames']} ({row['plant_hours']} plant h), threads {row['threads']}, "
+                      f"fds {row['fds']}, rss {row['rss_mb'] and round(row['rss_mb'], 1)} MB, "
+                      f"traced {row['traced_mb'] and round(row['traced_mb'], 1)} MB, reconnects {row['camera_reconnects']}")
+                next_sample = now + args.sample_interval
+            time.sleep(0.2)
+    finally:
+        for item in chaos:
+            item.end(judge=False)
+        # Give the spool one replay after the last database outage
+        replay_deadline = time.monotonic() + 3 * processor.event_spool.replay_interval
+        while database.backlog and loop.is_alive() and time.monotonic() < replay_deadline:
+            time.sleep(0.2)
+        final, final_snapshot = sample()
+        processor.stop()
+        loop.join(timeout=30)
+        if simulator is not None:
+            simulator.stop()
+        time.sleep(1)  # Let daemon workers observe their stop flags
+        gc.collect()
+
+    failures = []
+    if not loop.is_alive() and final["frames"] == 0:
+        failures.append("the processing loop produced no frames")
+    if baseline is None:
+        failures.append(f"the run ended before the {args.warmup:g} s warmup, no baseline")
+    else:
+        achieved_fps = (final["frames"] - baseline["frames"]) / max(1e-9, final["elapsed"] - baseline["elapsed"])
+        final["achieved_fps"] = round(achieved_fps, 2)
+        if achieved_fps < args.fps * args.min_fps_ratio:
+            failures.append(f"the loop achieved {achieved_fps:.1f} fps after the warmup, "
+                            f"below {args.min_fps_ratio:g} x {args.fps:g} fps")
+        for key, budget in (("threads", args.max_thread_growth), ("fds", args.max_fd_growth),
+                            ("rss_mb", args.max_rss_growth_mb), ("traced_mb", args.max_traced_growth_mb)):
+            if final[key] is not None and baseline[key] is not None and final[key] - baseline[key] > budget:
+                failures.append(f"{key} grew from {baseline[key]:.1f} to {final[key]:.1f} (budget {budget})")
+        if final_snapshot is not None and baseline_snapshot is not None:
+            print("Largest allocation growth since the baseline:")
+            for stat in final_snapshot.compare_to(baseline_snapshot, "lineno")[:args.top]:
+                print(f"    {stat}")
+    for item in chaos:
+        if item.missed:
+            failures.append(f"{item.missed} of {item.count} {item.name}s did not reach the app")
+    if database.stored < args.min_events:
+        failures.append(f"the database stored {database.stored} events, expected at least {args.min_events}")
+    if database.refused and not database.recovered:
+        failures.append(f"{database.refused} events refused during database outages were never replayed")
+    threads_after, fds_after = threading.active_count(), open_fds()
+    leftover = [thread.name for thread in threading.enumerate() if thread is not threading.main_thread()]
+    if threads_after - threads_before > args.max_thread_growth:
+        failures.append(f"{threads_after - threads_before} threads still running after shutdown: {leftover}")
+    if fds_after is not None and fds_before is not None and fds_after - fds_before > args.max_fd_growth:
+        failures.append(f"{fds_after - fds_before} file descriptors still open after shutdown")
+
+    summary = {"final": final, "threads_after_stop": threads_after, "fds_after_stop": fds_after,
+               "chaos": {"camera_dropouts": chaos[0].count, "db_outages": chaos[1].count,
+                         "plc_outages": chaos[2].count if simulator is not None else 0},
+               "database_events": database.stored, "database_refused": database.refused,
+               "database_recovered": database.recovered, "failures": failures}
+    report.write(json.dumps({"summary": summary}) + "\n")
+    report.close()
+    logger.info(f"Soak test finished: {summary}")
+    print(json.dumps(summary["chaos"]), f"{database.stored} events stored")
+    if failures:
+        print("SOAK FAILED:\n    " + "\n    ".join(failures))
+        sys.exit(1)
+    print(f"Soak passed, report in {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import threading
+import time
+import traceback
+from logging_config import logger
+
+PENDING = "pending"
+STARTING = "starting"
+READY = "ready"
+RETRYING = "retrying"
+
+
+class Subsystem:
+    """Readiness of one background-initialized subsystem."""
+
+    def __init__(self, name, init, retry_period):
+        self.name = name
+        self.init = init
+        self.retry_period = retry_period
+        self.state = PENDING
+        self.value = None
+        self.error = None
+        self.attempts = 0
+        self.started_at = None
+        self.ready_at = None
+        self.ready = threading.Event()
+
+
+class SubsystemManager:
+    """
+    Initializes slow subsystems (PLC, database) on background threads.
+
+    `start()` returns immediately, so the cameras and the frame loop can run
+    while the serial port is opened and the database is reached. `init` is
+    retried every `retry_period` seconds until it returns without raising;
+    its return value is then available from `get()`. Until then `get()`
+    returns None and callers skip or defer the work.
+    """
+
+    def __init__(self):
+        self.subsystems = {}
+        self.created = time.monotonic()
+
+    def start(self, name, init, retry_period=10.0):
+        subsystem = self.subsystems[name] = Subsystem(name, init, retry_period)
+        threading.Thread(target=self.run, args=(subsystem,), name=f"startup-{name}", daemon=True).start()
+        return subsystem
+
+    def run(self, subsystem):
+        subsystem.started_at = time.monotonic()
+        while True:
+            subsystem.state = STARTING
+            subsystem.attempts += 1
+            try:
+                subsystem.value = subsystem.init()
+                subsystem.state = READY
+                subsystem.error = None
+                subsystem.ready_at = time.monotonic()
+                subsystem.ready.set()
+                logger.info(f"{subsystem.name} ready after {subsystem.ready_at - self.created:.2f} s "
+                            f"({subsystem.attempts} attempt(s)).")
+                return
+            except Exception as e:
+                subsystem.state = RETRYING
+                subsystem.error = str(e)
+                logger.error(f"Error initializing {subsystem.name}: {e}")
+                logger.error(traceback.format_exc())
+                time.sleep(subsystem.retry_period)
+
+    def get(self, name):
+        """The initialized subsystem, or None if it is not ready (yet)."""
+        subsystem = self.subsystems.get(name)
+        return subsystem.value if subsystem is not None and subsystem.state == READY else None
+
+    def is_ready(self, name):
+        return self.get(name) is not None
+
+    def wait(self, name, timeout=None):
+        subsystem = self.subsystems.get(name)
+        return subsystem is not None and subsystem.ready.wait(timeout)
+
+    def status(self):
+        return {
+            name: {
+                "state": subsystem.state,
+                "attempts": subsystem.attempts,
+                "ready_after": None if subsystem.ready_at is None else round(subsystem.ready_at - self.created, 3),
+                "error": subsystem.error,
+            }
+            for name, subsystem in self.subsystems.items()
+        }
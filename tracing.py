@@ -0,0 +1,186 @@
+import functools
+import json
+import os
+import signal
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging_config import logger
+
+DEFAULT_TRACING_CONFIG = {
+    "enabled": False,       # Record spans from startup; SIGUSR1 or POST /trace toggles it at run time
+    "capacity": 200000,     # Spans kept in the ring buffer (roughly the last minute at 20 fps)
+    "path": "results/traces",
+}
+
+
+class Span:
+    """Context manager that records one complete span when it exits."""
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.complete(self.name, self.start, time.perf_counter_ns(), self.cat, self.args)
+        return False
+
+
+class NullSpan:
+    """Shared stand-in returned while tracing is off."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    """
+    In-memory ring buffer of timed spans, exported as Chrome Trace Event JSON.
+
+    Spans are plain tuples appended to a bounded deque, which is safe from
+    any thread without a lock and costs a couple of microseconds per span;
+    the oldest spans fall off once `capacity` is reached. While tracing is
+    off, `span()` returns a shared no-op context manager. `chrome_trace()`
+    builds the JSON that chrome://tracing and Perfetto load, with one row
+    per thread.
+
+    Parameters:
+    ----------
+    capacity : int, optional
+        Number of spans kept (default is 200000).
+    path : str, optional
+        Directory `dump()` writes trace files to (default is "results/traces").
+    """
+
+    def __init__(self, capacity=200000, path="results/traces"):
+        self.enabled = False
+        self.path = path
+        self.events = deque(maxlen=capacity)
+        self.thread_names = {}
+        self.origin = time.perf_counter_ns()
+        self.dumps = 0
+
+    def configure(self, config):
+        """Apply a "tracing" config section."""
+        if config["capacity"] != self.events.maxlen:
+            self.events = deque(self.events, maxlen=config["capacity"])
+        self.path = config["path"]
+        self.enabled = config["enabled"]
+
+    def span(self, name, cat="app", args=None):
+        """`with tracer.span("stage"):` records the block as one span."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, cat, args)
+
+    def begin(self):
+        """Start time for `complete()`, for spans that do not fit a `with` block."""
+        return time.perf_counter_ns()
+
+    def complete(self, name, start, end=None, cat="app", args=None):
+        """Record a span from `start` to `end` (perf_counter_ns values, `end` defaults to now)."""
+        if not self.enabled:
+            return
+        if end is None:
+            end = time.perf_counter_ns()
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        self.events.append((name, cat, start, end - start, tid, args))
+
+    def instant(self, name, cat="app", args=None):
+        """Record a point in time, e.g. a detector transition."""
+        if self.enabled:
+            self.complete(name, time.perf_counter_ns(), None, cat, args)
+
+    def chrome_trace(self):
+        while True:
+            try:
+                events = list(self.events)
+                break
+            except RuntimeError:
+                continue  # Appended to while copying; try again
+        pid = os.getpid()
+        trace = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                 for tid, name in list(self.thread_names.items())]
+        for name, cat, start, duration, tid, args in events:
+            event = {"name": name, "cat": cat, "ph": "X", "pid": pid, "tid": tid,
+                     "ts": (start - self.origin) / 1000, "dur": duration / 1000}
+            if args:
+                event["args"] = args
+            trace.append(event)
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def dump(self, path=None):
+        """Write the buffer to `path` (default: a timestamped file under `self.path`) and return the path."""
+        if path is None:
+            os.makedirs(self.path, exist_ok=True)
+            path = os.path.join(self.path, f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        trace = self.chrome_trace()
+        with open(path, "w") as file:
+            json.dump(trace, file, separators=(",", ":"))
+        self.dumps += 1
+        logger.info(f"Wrote {len(trace['traceEvents'])} trace events to {path}")
+        return path
+
+    def stats(self):
+        return {"enabled": self.enabled, "spans": len(self.events), "capacity": self.events.maxlen, "dumps": self.dumps}
+
+
+tracer = Tracer()
+
+
+def traced(name, cat="app"):
+    """Decorator: record every call of the function as a span."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                tracer.complete(name, start, None, cat)
+        return wrapper
+    return decorate
+
+
+def install_signal_handlers():
+    """
+    SIGUSR1 toggles tracing and SIGUSR2 dumps the buffer (POSIX only; on
+    Windows use the control API). Must be called from the main thread.
+    """
+    if not hasattr(signal, "SIGUSR1"):
+        return False
+
+    def toggle(signum, frame):
+        tracer.enabled = not tracer.enabled
+        logger.info(f"Tracing {'enabled' if tracer.enabled else 'disabled'} by signal.")
+
+    def dump(signum, frame):
+        # Not in the handler itself: it interrupts the main thread mid-frame
+        threading.Thread(target=tracer.dump, name="trace-dump", daemon=True).start()
+
+    try:
+        signal.signal(signal.SIGUSR1, toggle)
+        signal.signal(signal.SIGUSR2, dump)
+    except ValueError as e:
+        logger.warning(f"Tracing signals not installed: {e}")
+        return False
+    return True
@@ -0,0 +1,147 @@
+from collections import namedtuple
+from enum import IntEnum
+from score_store import STATE_VIBRATING, STATE_SETTLING, STATE_STABLE, STATE_FROZEN
+
+DEFAULT_DETECTOR_CONFIG = {
+    "off_ratio": 0.8,       # A frame is quiet only below mes_score * off_ratio (hysteresis)
+    "debounce": 0.1,        # Seconds scores must stay above mes_score before vibration is declared
+    "min_vibrating": 1.0,   # Seconds the detector stays VIBRATING before it may start settling
+    "freeze_timeout": 5.0,  # Seconds without a new picture before the camera is FROZEN
+}
+
+
+class VibrationState(IntEnum):
+    """Detector states, with the codes stored by score_store."""
+    VIBRATING = STATE_VIBRATING
+    SETTLING = STATE_SETTLING
+    STABLE = STATE_STABLE
+    FROZEN = STATE_FROZEN
+
+
+Transition = namedtuple("Transition", ["previous", "state", "at"])
+
+
+class VibrationDetector:
+    """
+    Vibration state machine driven by timestamps instead of frame counts.
+
+    STABLE -> VIBRATING once scores stay above `on_score` for `debounce`
+    seconds. VIBRATING -> SETTLING on the first quiet frame (below
+    `on_score * off_ratio`) after at least `min_vibrating` seconds.
+    SETTLING -> STABLE once every frame has been quiet for `stable_seconds`;
+    a score above `on_score` returns to VIBRATING at once, and a score in the
+    hysteresis band between the two thresholds restarts the settling time.
+    All durations are measured between the `now` values passed to `update()`,
+    so the behaviour is the same at 5 fps and at 60 fps.
+
+    Any state -> FROZEN through `check_frozen()` once the camera has not
+    delivered a new picture for `freeze_timeout` seconds. The next score
+    starts over as from no state at all, so STABLE is only reported again
+    after `stable_seconds` of quiet live video.
+
+    Parameters:
+    ----------
+    on_score : float
+        Score above which a frame shows vibration (`mes_score`).
+    stable_seconds : float
+        Quiet time needed before the slab is reported stable (`stable_threshold`).
+    off_ratio : float, optional
+        Quiet threshold as a fraction of `on_score` (default is 0.8).
+    debounce : float, optional
+        Seconds above `on_score` before leaving STABLE (default is 0.1).
+    min_vibrating : float, optional
+        Minimum seconds in VIBRATING (default is 1.0).
+    freeze_timeout : float, optional
+        Seconds without a new picture before FROZEN (default is 5.0).
+    """
+
+    def __init__(self, on_score, stable_seconds, off_ratio=0.8, debounce=0.1, min_vibrating=1.0, freeze_timeout=5.0):
+        self.on_score = on_score
+        self.stable_seconds = stable_seconds
+        self.off_ratio = off_ratio
+        self.debounce = debounce
+        self.min_vibrating = min_vibrating
+        self.freeze_timeout = freeze_timeout
+        self.state = None
+        self.entered_at = None
+        self.above_since = None
+        self.quiet_since = None
+
+    @classmethod
+    def from_config(cls, on_score, stable_seconds, config):
+        return cls(on_score, stable_seconds, config["off_ratio"], config["debounce"], config["min_vibrating"],
+                   config["freeze_timeout"])
+
+    @property
+    def off_score(self):
+        return self.on_score * self.off_ratio
+
+    def set_thresholds(self, on_score=None, stable_seconds=None):
+        if on_score is not None:
+            self.on_score = on_score
+        if stable_seconds is not None:
+            self.stable_seconds = stable_seconds
+
+    def quiet_time(self, now):
+        """Seconds every frame has been quiet, 0 unless SETTLING or STABLE."""
+        return now - self.quiet_since if self.quiet_since is not None else 0.0
+
+    def stats(self, now):
+        return {
+            "state": self.state.name if self.state else None,
+            "in_state": round(now - self.entered_at, 3) if self.entered_at is not None else 0.0,
+            "quiet_time": round(self.quiet_time(now), 3),
+            "on_score": self.on_score,
+            "off_score": self.off_score,
+        }
+
+    def enter(self, state, now):
+        transition = Transition(self.state, state, now)
+        self.state = state
+        self.entered_at = now
+        return transition
+
+    def check_frozen(self, changed_at, now):
+        """Enter FROZEN if the picture has not changed since monotonic time `changed_at`; return a Transition or None."""
+        if self.state == VibrationState.FROZEN or now - changed_at < self.freeze_timeout:
+            return None
+        self.above_since = None
+        self.quiet_since = None
+        return self.enter(VibrationState.FROZEN, now)
+
+    def update(self, score, now):
+        """Feed one frame's score at monotonic time `now`; return a Transition or None."""
+        above = score > self.on_score
+        quiet = score < self.off_score
+        if above:
+            if self.above_since is None:
+                self.above_since = now
+        else:
+            self.above_since = None
+
+        if self.state is None or self.state == VibrationState.FROZEN:
+            # Nothing is known yet: vibrating if the first frame says so, otherwise wait out the stable time
+            self.quiet_since = None if above else now
+            return self.enter(VibrationState.VIBRATING if above else VibrationState.SETTLING, now)
+
+        if self.state == VibrationState.STABLE:
+            if above and now - self.above_since >= self.debounce:
+                self.quiet_since = None
+                return self.enter(VibrationState.VIBRATING, now)
+            return None
+
+        if self.state == VibrationState.VIBRATING:
+            if quiet and now - self.entered_at >= self.min_vibrating:
+                self.quiet_since = now
+                return self.enter(VibrationState.SETTLING, now)
+            return None
+
+        # SETTLING
+        if above:
+            self.quiet_since = None
+            return self.enter(VibrationState.VIBRATING, now)
+        if not quiet:
+            self.quiet_since = now
+        elif now - self.quiet_since >= self.stable_seconds:
+            return self.enter(VibrationState.STABLE, now)
+        return None